@@ -32,8 +32,12 @@ import argparse
 import subprocess
 import logging
 import tarfile
+import tempfile
 import random
+import re
 import string
+import json
+import multiprocessing
 from contextlib import contextmanager
 
 logger = logging.getLogger("kd_master_backup")
@@ -49,8 +53,20 @@ stdout_handler.setFormatter(formatter)
 
 
 STORAGE_LOCATION = '/var/lib/kuberdock/storage/'
+STATE_LOCATION = '/var/lib/kuberdock/backup-state/'
 LOCKFILE = '/var/lock/kd-node-backup.lock'
 
+# Incremental archives contain this file with name of the base archive
+# (relative to the archive) and the list of deleted paths. Restore tooling
+# (see VolumeManager in node_network_plugin.py) follows this chain.
+BACKUP_META = '.kuberdock-backup.json'
+# Codec: (tarfile compression, archive extension)
+CODECS = {
+    'gzip': ('gz', '.tar.gz'),
+    'bzip2': ('bz2', '.tar.bz2'),
+}
+SNAPSHOT_PREFIX = 'kdbackup-'
+
 
 def lock(lockfile):
     def decorator(clbl):
@@ -73,17 +89,6 @@ def lock(lockfile):
     return decorator
 
 
-def iterate_src(src):
-    cmd = ['find', src, '-printf', '%T@ %p\n']
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    out = subprocess.Popen(['sort', '-nr'], stdin=proc.stdout,
-                           stdout=subprocess.PIPE)
-    for line in iter(out.stdout.readline, ''):
-        ts, fn = line.split(' ', 1)
-        logger.debug([ts, fn])
-        yield fn.strip()
-
-
 class BackupError(Exception):
     pass
 
@@ -98,26 +103,95 @@ def get_zfs_mountpoints():
     return dict(a.split('\t') for a in result_raw.split('\n') if a)
 
 
-def make_tar_backup(name, src, dst, skip_errors=False):
-    """ Make a backup by archiving all files in src
-    to tar.gz  located in dst
+def zfs_snapshot_exists(snap_name):
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call(['zfs', 'list', '-H', '-t', 'snapshot',
+                                snap_name], stdout=devnull,
+                               stderr=devnull) == 0
+
+
+def get_manifest(src):
+    """ Returns {relative path: [mtime, size]} of all files and directories
+    in src
     """
-    result = os.path.join(dst, "{0}.tar.gz".format(name))
+    manifest = {}
+    for root, dirs, files in os.walk(src):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            st = os.lstat(path)
+            manifest[os.path.relpath(path, src)] = [st.st_mtime, st.st_size]
+    return manifest
+
+
+def diff_manifests(old, new):
+    """ Returns list of (path, recursive) to backup and list of deleted paths
+    """
+    changed = [(path, False) for path, stat in new.iteritems()
+               if old.get(path) != stat]
+    deleted = [path for path in old if path not in new]
+    return sorted(changed), sorted(deleted)
+
+
+def _unescape_zfs_path(path):
+    # zfs diff escapes spaces and non-printable characters as \0ooo
+    return re.sub(r'\\0([0-7]{3})', lambda m: chr(int(m.group(1), 8)), path)
+
+
+def get_zfs_changes(old_snap, new_snap, mountpoint):
+    """ Returns list of (path, recursive) to backup and list of deleted paths
+    between two snapshots of dataset mounted to mountpoint
+    """
+    out = subprocess.check_output(['zfs', 'diff', '-H', old_snap, new_snap])
+    changed, deleted = {}, set()
+    for line in out.splitlines():
+        parts = line.split('\t')
+        kind = parts[0]
+        paths = [os.path.relpath(_unescape_zfs_path(p), mountpoint)
+                 for p in parts[1:]]
+        if kind == '-':
+            deleted.add(paths[0])
+        elif kind == 'R':
+            # Content of renamed directory is not listed separately
+            deleted.add(paths[0])
+            changed[paths[1]] = True
+        else:
+            changed.setdefault(paths[0], False)
+    deleted.difference_update(changed)
+    return sorted(changed.iteritems()), sorted(deleted)
+
+
+def make_tar_backup(name, src, dst, entries, skip_errors=False, meta=None,
+                    codec='gzip', level=6):
+    """ Make a backup by archiving `entries` (list of (path relative to src,
+    recursive)) to tar archive located in dst
+    """
+    mode, ext = CODECS[codec]
+    result = os.path.join(dst, "{0}{1}".format(name, ext))
     tmp_result = result + '.incomplete'
     logger.debug({"dst": result})
 
-    with tarfile.open(tmp_result, "w:gz") as tgzf:
-        for fn in iterate_src(src):
-            try:
-                logger.debug([fn, os.path.relpath(fn, src)])
-                tgzf.add(fn, arcname=os.path.relpath(fn, src))
-            except (IOError, OSError) as err:
-                if not skip_errors:
-                    if os.path.exists(tmp_result):
-                        os.remove(tmp_result)
-                    raise
-                logger.warning("File `{0}` backup skipped due to "
-                               "error `{1}`. Skipped".format(fn, err))
+    try:
+        with tarfile.open(tmp_result, "w:" + mode,
+                          compresslevel=level) as tarf:
+            if meta is not None:
+                with tempfile.NamedTemporaryFile() as f:
+                    json.dump(meta, f)
+                    f.flush()
+                    tarf.add(f.name, arcname=BACKUP_META)
+            for rel_path, recursive in entries:
+                fn = os.path.join(src, rel_path)
+                try:
+                    logger.debug([fn, rel_path])
+                    tarf.add(fn, arcname=rel_path, recursive=recursive)
+                except (IOError, OSError) as err:
+                    if not skip_errors:
+                        raise
+                    logger.warning("File `{0}` backup skipped due to "
+                                   "error `{1}`. Skipped".format(fn, err))
+    except Exception:
+        if os.path.exists(tmp_result):
+            os.remove(tmp_result)
+        raise
     os.rename(tmp_result, result)
     return result
 
@@ -127,22 +201,23 @@ def mount_context(device):
     if device is None:
         yield None
         return
-    mountpoint = os.environ.get('KD_CEPH_BACKUP_MOUNTPOINT', '/mnt')
-    if not os.path.exists(mountpoint):
-        os.makedirs(mountpoint)
-    if os.path.ismount(mountpoint):
-        raise BackupError("Mountpoint `{0}` already mounted. Please, "
-                          "release it or specify free mount point via"
-                          " KD_CEPH_BACKUP_MOUNTPOINT".format(mountpoint))
-    subprocess.check_call(['mount', '-t', 'zfs', device, mountpoint])
+    # Volumes are backed up in parallel, so every snapshot is mounted to
+    # its own directory
+    base = os.environ.get('KD_CEPH_BACKUP_MOUNTPOINT', '/mnt')
+    if not os.path.exists(base):
+        os.makedirs(base)
+    mountpoint = tempfile.mkdtemp(prefix='kd-backup-', dir=base)
     try:
-        yield mountpoint
+        subprocess.check_call(['mount', '-t', 'zfs', device, mountpoint])
+        try:
+            yield mountpoint
+        finally:
+            subprocess.check_call(['umount', mountpoint])
     finally:
-        subprocess.check_call(['umount', mountpoint])
+        os.rmdir(mountpoint)
 
 
-@contextmanager
-def zfs_snapshot(src):
+def create_zfs_snapshot(src):
     try:
         zfs_map = get_zfs_mountpoints()
     except OSError:
@@ -154,18 +229,117 @@ def zfs_snapshot(src):
 
     name = zfs_map[src]
     snap_id = ''.join(random.sample(string.ascii_letters + string.digits, 9))
-    snap_name = '@'.join([name, snap_id])
+    snap_name = '@'.join([name, SNAPSHOT_PREFIX + snap_id])
     subprocess.check_call(["zfs", "snap", snap_name])
     subprocess.check_call(["zfs", "hold", "-r", "keep", snap_name])
+    return snap_name
+
+
+def destroy_zfs_snapshot(snap_name):
+    subprocess.check_call(["zfs", "release", "-r", "keep", snap_name])
+    subprocess.check_call(["zfs", "destroy", snap_name])
+
+
+def get_state_path(state_dir, user_id, volume_id):
+    return os.path.join(state_dir, user_id, '{0}.json'.format(volume_id))
+
+
+def load_state(path):
     try:
-        yield snap_name
-    finally:
-        subprocess.check_call(["zfs", "release", "-r", "keep", snap_name])
-        subprocess.check_call(["zfs", "destroy", snap_name])
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def save_state(path, state):
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.rename(path + '.tmp', path)
+
+
+def backup_volume(task):
+    """ Backup one volume. Makes incremental backup if there is suitable
+    previous backup (see `task['prev']`), full one otherwise.
+
+    Snapshot of the previous backup is kept until new state is saved, so it
+    is not destroyed here. New snapshot is destroyed in case of error.
+
+    :param task: dict with keys: name, src, dst (directory for the archive),
+        archive (path of the archive relative to backups root), prev (state
+        of the previous backup or None), codec, level, skip_errors
+    :return: new state of the volume
+    """
+    prev = task['prev']
+    state = {'archive': task['archive'], 'codec': task['codec']}
+    try:
+        snap_name = create_zfs_snapshot(task['src'])
+    except NonZFSException as err:
+        logger.warning("Possible inconsistent backup "
+                       "creation: {}".format(err))
+        state['manifest'] = get_manifest(task['src'])
+        if prev and prev.get('manifest') is not None:
+            entries, deleted = diff_manifests(prev['manifest'],
+                                              state['manifest'])
+        else:
+            prev, deleted = None, []
+            entries = diff_manifests({}, state['manifest'])[0]
+        state['result'] = _make_volume_backup(task, task['src'], entries,
+                                              prev, deleted)
+    else:
+        state['snapshot'] = snap_name
+        try:
+            with mount_context(snap_name) as mountpoint:
+                prev_snap = prev and prev.get('snapshot')
+                if prev_snap and zfs_snapshot_exists(prev_snap):
+                    entries, deleted = get_zfs_changes(prev_snap, snap_name,
+                                                       task['src'])
+                else:
+                    prev, deleted = None, []
+                    entries = diff_manifests({}, get_manifest(mountpoint))[0]
+                state['result'] = _make_volume_backup(task, mountpoint,
+                                                      entries, prev, deleted)
+        except Exception:
+            destroy_zfs_snapshot(snap_name)
+            raise
+    state['chain'] = prev['chain'] + 1 if prev else 0
+    return state
+
+
+def _make_volume_backup(task, src, entries, prev, deleted):
+    meta = None
+    if prev is not None:
+        meta = {
+            'base': os.path.relpath(prev['archive'],
+                                    os.path.dirname(task['archive'])),
+            'deleted': deleted,
+        }
+    return make_tar_backup(task['name'], src, task['dst'], entries,
+                           task['skip_errors'], meta, task['codec'],
+                           task['level'])
+
+
+def _backup_volume_worker(task):
+    # Runs in pool process. Exceptions are returned to be reported by the
+    # main process, so failure of one volume does not stop other ones.
+    try:
+        return task, backup_volume(task), None
+    except Exception as err:
+        logger.exception('Backup of `{0}` failed'.format(task['src']))
+        return task, None, str(err) or repr(err)
 
 
 @lock(LOCKFILE)
-def do_node_backup(backup_dir, callback, skip_errors, **kwargs):
+def do_node_backup(*args, **kwargs):
+    return make_node_backup(*args, **kwargs)
+
+
+def make_node_backup(backup_dir, callback, skip_errors, codec='gzip',
+                     level=6, jobs=None, full=False, max_chain=6,
+                     state_dir=STATE_LOCATION, **kwargs):
 
     def handle(handler, result):
         try:
@@ -176,29 +350,66 @@ def do_node_backup(backup_dir, callback, skip_errors, **kwargs):
                 "Callback handler has failed with `{0}`".format(err))
 
     timestamp = datetime.datetime.today().isoformat()
-    dst = os.path.join(backup_dir, "local_pv_backup_{0}".format(timestamp))
+    run_name = "local_pv_backup_{0}".format(timestamp)
+    dst = os.path.join(backup_dir, run_name)
+    ext = CODECS[codec][1]
+    tasks = []
     for user_id in os.listdir(STORAGE_LOCATION):
         user_dir = os.path.join(STORAGE_LOCATION, user_id)
         for volume_id in os.listdir(user_dir):
-            volume_dir = os.path.join(user_dir, volume_id)
             result_dir = os.path.join(dst, user_id)
             if not os.path.exists(result_dir):
                 os.makedirs(result_dir)
             logger.debug({"src": STORAGE_LOCATION, "user": user_id,
                           "volume_id": volume_id})
-            try:
-                with zfs_snapshot(volume_dir) as snap_name:
-                    with mount_context(snap_name) as mountpoint:
-                        result = make_tar_backup(volume_id, mountpoint,
-                                                 result_dir, skip_errors)
-            except NonZFSException as err:
-                logging.warning("Possible inconsistent backup "
-                                "creation: {}".format(err))
-                result = make_tar_backup(volume_id, volume_dir,
-                                         result_dir, skip_errors)
-            logger.info('Backup created: {0}'.format(result))
-    if callback:
-        handle(callback, dst)
+            prev = None
+            if not full:
+                prev = load_state(
+                    get_state_path(state_dir, user_id, volume_id))
+                if prev and (prev.get('codec') != codec or
+                             prev.get('chain', 0) >= max_chain):
+                    prev = None
+            tasks.append({
+                'name': volume_id,
+                'src': os.path.join(user_dir, volume_id),
+                'dst': result_dir,
+                'archive': os.path.join(run_name, user_id, volume_id + ext),
+                'prev': prev,
+                'state_path': get_state_path(state_dir, user_id, volume_id),
+                'codec': codec,
+                'level': level,
+                'skip_errors': skip_errors,
+            })
+
+    pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+    try:
+        results = pool.map(_backup_volume_worker, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    states = [(task, state) for task, state, err in results if state]
+    try:
+        errors = [err for _, _, err in results if err is not None]
+        if errors and not skip_errors:
+            raise BackupError("Backup of {0} volume(s) failed: {1}".format(
+                len(errors), errors[0]))
+        for _, state in states:
+            logger.info('Backup created: {0}'.format(state.pop('result')))
+        if callback:
+            handle(callback, dst)
+    except Exception:
+        for _, state in states:
+            if state.get('snapshot'):
+                destroy_zfs_snapshot(state['snapshot'])
+        raise
+
+    # Backups are delivered, so new states replace the previous ones
+    for task, state in states:
+        save_state(task['state_path'], state)
+        prev_snap = task['prev'] and task['prev'].get('snapshot')
+        if prev_snap and zfs_snapshot_exists(prev_snap):
+            destroy_zfs_snapshot(prev_snap)
 
 
 def parse_args(args):
@@ -217,6 +428,24 @@ def parse_args(args):
     parser.add_argument("-e", '--callback',
                         help='Callback for backup file (backup path '
                         'passed as a 1st arg)')
+    parser.add_argument("-c", '--codec', choices=sorted(CODECS),
+                        default='gzip', help="Compression codec. "
+                        "Default: gzip")
+    parser.add_argument("-l", '--level', type=int, choices=range(1, 10),
+                        default=6, help="Compression level. Default: 6")
+    parser.add_argument("-j", '--jobs', type=int,
+                        help="Number of volumes compressed in parallel. "
+                        "Default: number of CPUs")
+    parser.add_argument("-f", '--full', action='store_true',
+                        help="Make full backup of all volumes")
+    parser.add_argument("-m", '--max-chain', type=int, default=6,
+                        dest='max_chain',
+                        help="Max number of incremental backups after a full "
+                        "one. Default: 6")
+    parser.add_argument('--state-dir', default=STATE_LOCATION,
+                        dest='state_dir',
+                        help="Where to keep state of previous backups. "
+                        "Default: {0}".format(STATE_LOCATION))
     parser.add_argument(
         'backup_dir', help="Destination for all created files")
     parser.set_defaults(func=do_node_backup)
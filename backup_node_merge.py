@@ -106,7 +106,9 @@ def will_override(src, group):
 
 def do_merge(backups, precision, dry_run, include_latest, skip_errors,
              **kwargs):
-    data = sorted(os.listdir(backups))
+    # Merged folders are replaced with symlinks (see below), skip them
+    data = sorted(item for item in os.listdir(backups)
+                  if not os.path.islink(os.path.join(backups, item)))
     if not data:
         raise MergeError("Nothing found.")
 
@@ -133,6 +135,10 @@ def do_merge(backups, precision, dry_run, include_latest, skip_errors,
             src = os.path.join(backups, item)
             dir_util.copy_tree(src, dst, verbose=True, dry_run=dry_run)
             dir_util.remove_tree(src, verbose=True, dry_run=dry_run)
+            if not dry_run:
+                # Incremental backups refer to their base archives by
+                # relative path, which must stay valid after the merge
+                os.symlink(os.path.basename(dst), src)
 
 
 def parse_args(args):
@@ -92,6 +92,10 @@ def create_app(settings_override=None, fake_sessions=False):
 
     app.before_request(handle_api_version)
 
+    if app.config.get('INSTRUMENTATION_ENABLED'):
+        from kubedock import instrumentation
+        instrumentation.init_app(app)
+
     return app
 
 
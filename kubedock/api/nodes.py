@@ -54,6 +54,17 @@ def get_one_node(node_id):
     return jsonify({'status': 'OK', 'data': data})
 
 
+@nodes.route('/<node_id>/install-log', methods=['GET'])
+@auth_required
+@check_permission('get', 'nodes')
+def get_install_log(node_id):
+    check_int_id(node_id)
+    data = node_utils.get_node_install_log(
+        node_id, offset=request.args.get('offset', type=int),
+        limit=request.args.get('limit', type=int))
+    return jsonify({'status': 'OK', 'data': data})
+
+
 @nodes.route('/', methods=['POST'])
 @auth_required
 @check_permission('create', 'nodes')
@@ -25,7 +25,7 @@ from kubedock.billing import has_billing
 from .utils import use_kwargs
 from ..backups import pods as backup_pods
 from ..decorators import maintenance_protected
-from ..exceptions import PermissionDenied
+from ..exceptions import APIError, PermissionDenied, api_error_to_dict
 from ..kapi.apps import PredefinedApp
 from ..kapi.podcollection import PodCollection, PodNotFound
 from ..login import auth_required
@@ -33,6 +33,7 @@ from ..pods.models import Pod
 from ..rbac import check_permission
 from ..system_settings.models import SystemSettings
 from ..tasks import make_backup
+from ..users import User
 from ..utils import KubeUtils, register_api, catch_error
 from ..validation import check_new_pod_data, check_change_pod_data, \
     owner_optional_schema, owner_mandatory_schema
@@ -207,7 +208,7 @@ def dump(pod_id):
 @KubeUtils.jsonwrap
 @use_kwargs({'owner': owner_optional_schema})
 def batch_dump(owner=None):
-    return PodCollection(owner).dump()
+    return KubeUtils.stream_json_list(PodCollection(owner).iter_dump())
 
 
 restore_args_schema = {
@@ -240,6 +241,62 @@ def restore(pod_dump, owner, **kwargs):
         return backup_pods.restore(pod_dump=pod_dump, owner=owner, **kwargs)
 
 
+restore_batch_args_schema = {
+    'pod_dumps': {
+        'type': 'list',
+        'required': True,
+        'schema': {'type': 'dict'}
+    },
+    'owner': owner_optional_schema,
+    'pv_backups_location': restore_args_schema['pv_backups_location'],
+    'pv_backups_path_template':
+        restore_args_schema['pv_backups_path_template'],
+}
+
+
+@podapi.route('/restore/batch', methods=['POST'])
+@auth_required
+@maintenance_protected
+@check_permission('create_non_owned', 'pods')
+@KubeUtils.jsonwrap
+@use_kwargs(restore_batch_args_schema)
+def restore_batch(pod_dumps, owner=None, **kwargs):
+    # If owner is not specified, every pod is restored for its original
+    # owner
+    if owner is not None:
+        check_permission('own', 'pods', user=owner).check()
+    owners, results, dumps_with_owners = {}, [None] * len(pod_dumps), []
+    for i, pod_dump in enumerate(pod_dumps):
+        dump_owner = owner
+        if dump_owner is None:
+            username = (pod_dump.get('owner') or {}).get('username')
+            if username not in owners:
+                try:
+                    owners[username] = _get_dump_owner(username), None
+                except APIError as e:
+                    owners[username] = None, e
+            dump_owner, error = owners[username]
+            if error is not None:
+                # do not prevent restoring of other pods
+                results[i] = {'error': api_error_to_dict(error)}
+                continue
+        dumps_with_owners.append((i, (pod_dump, dump_owner)))
+    restored = backup_pods.restore_batch(
+        [dump for i, dump in dumps_with_owners], **kwargs)
+    for (i, _), result in zip(dumps_with_owners, restored):
+        results[i] = result
+    return results
+
+
+def _get_dump_owner(username):
+    user = User.get(username)
+    if user is None:
+        raise APIError('Owner of pod dump is not specified or does not '
+                       'exist: {0}'.format(username))
+    check_permission('own', 'pods', user=user).check()
+    return user
+
+
 @podapi.route('/<pod_id>/plans-info', methods=['GET'])
 @auth_required
 @KubeUtils.jsonwrap
@@ -32,7 +32,7 @@ from ..utils import KubeUtils, register_api, atomic, all_request_params, NODE_ST
 from ..users import User
 from ..validation import check_pricing_api, package_schema, kube_schema, \
     packagekube_schema
-from ..billing.models import Package, Kube, PackageKube
+from ..billing.models import Package, Kube, PackageKube, kube_catalogue
 from ..pods.models import Pod
 from ..kapi import licensing
 from ..kapi import collect
@@ -87,7 +87,8 @@ def get_user_kube_types():
     user = User.query.filter_by(username=user.username).first()
     if user is None:
         raise APIError('No such user', 404, 'UserNotFound')
-    return {k.kube.name: k.kube.id for k in user.package.kubes}
+    package = kube_catalogue.get_package(user.package_id)
+    return {k.kube.name: k.kube.id for k in package.kubes}
 
 
 class PackagesAPI(KubeUtils, MethodView):
@@ -100,8 +101,8 @@ class PackagesAPI(KubeUtils, MethodView):
             if package_id is None:
                 return [p.to_dict(with_kubes=with_kubes,
                                   with_internal=with_internal)
-                        for p in Package.query.all()]
-            data = Package.query.get(package_id)
+                        for p in kube_catalogue.get_packages()]
+            data = kube_catalogue.get_package(package_id)
             if data is None:
                 raise PackageNotFound()
             return data.to_dict(with_kubes=with_kubes,
@@ -110,10 +111,10 @@ class PackagesAPI(KubeUtils, MethodView):
             user = KubeUtils.get_current_user()
             if with_internal:
                 with_internal = user.username == KUBERDOCK_INTERNAL_USER
-            if package_id is not None and package_id != user.package.id:
+            if package_id is not None and package_id != user.package_id:
                 raise PackageNotFound()  # user can get only own package
-            package = user.package.to_dict(with_kubes=with_kubes,
-                                           with_internal=with_internal)
+            package = kube_catalogue.get_package(user.package_id).to_dict(
+                with_kubes=with_kubes, with_internal=with_internal)
             return [package] if package_id is None else package
         raise PermissionDenied()
 
@@ -186,7 +187,7 @@ register_api(pricing, PackagesAPI, 'packages', '/packages/', 'package_id',
 @KubeUtils.jsonwrap
 @check_permission('get', 'pricing')
 def get_default_package():
-    package = Package.get_default()
+    package = kube_catalogue.get_default_package()
     if package is None:
         raise PackageNotFound
     return package.to_dict()
@@ -200,8 +201,8 @@ class KubesAPI(KubeUtils, MethodView):
     @check_permission('get', 'pricing')
     def get(self, kube_id=None):
         if kube_id is None:
-            return [i.to_dict() for i in Kube.public_kubes()]
-        item = Kube.query.get(kube_id)
+            return [i.to_dict() for i in kube_catalogue.get_public_kubes()]
+        item = kube_catalogue.get_kube(kube_id)
         if item is None:
             raise KubeNotFound()
         return item.to_dict()
@@ -268,7 +269,7 @@ register_api(pricing, KubesAPI, 'kubes', '/kubes/', 'kube_id')
 @KubeUtils.jsonwrap
 @check_permission('get', 'pricing')
 def get_default_kube():
-    kube = Kube.get_default_kube()
+    kube = kube_catalogue.get_default_kube()
     if kube is None:
         raise KubeNotFound()
     return kube.to_dict()
@@ -299,10 +300,10 @@ def add_kube(data):
 @KubeUtils.jsonwrap
 @check_permission('get', 'pricing')
 def get_package_kube_ids(package_id):
-    package = Package.query.get(package_id)
+    package = kube_catalogue.get_package(package_id)
     if package is None:
         raise PackageNotFound()
-    return [kube.kube_id for kube in package.kubes]
+    return [package_kube.kube.id for package_kube in package.kubes]
 
 
 @pricing.route('/packages/<int:package_id>/kubes-by-name', methods=['GET'])
@@ -310,7 +311,7 @@ def get_package_kube_ids(package_id):
 @KubeUtils.jsonwrap
 @check_permission('get', 'pricing')
 def get_package_kube_names(package_id):
-    package = Package.query.get(package_id)
+    package = kube_catalogue.get_package(package_id)
     if package is None:
         raise PackageNotFound()
     return [package_kube.kube.name for package_kube in package.kubes]
@@ -321,18 +322,16 @@ class PackageKubesAPI(KubeUtils, MethodView):
 
     @check_permission('get', 'pricing')
     def get(self, package_id, kube_id=None):
-        package = Package.query.get(package_id)
+        package = kube_catalogue.get_package(package_id)
         if package is None:
             raise PackageNotFound()
         if kube_id is None:
             return [dict(pk.kube.to_dict(), kube_price=pk.kube_price)
                     for pk in package.kubes]
-        try:
-            return (dict(pk.kube.to_dict(), kube_price=pk.kube_price)
-                    for pk in package.kubes
-                    if pk.kube_id == int(kube_id)).next()
-        except StopIteration:
+        pk = package.get_kube(int(kube_id))
+        if pk is None:
             raise KubeNotFound()
+        return dict(pk.kube.to_dict(), kube_price=pk.kube_price)
 
     @atomic(APIError('Could not add kube type to package', 500), nested=False)
     @check_permission('create', 'pricing')
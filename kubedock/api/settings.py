@@ -22,6 +22,8 @@ from pytz import common_timezones
 from flask import Blueprint, request, jsonify, current_app
 from flask.views import MethodView
 
+from .. import instrumentation
+from ..core import ssh_pool
 from ..exceptions import PermissionDenied
 from ..login import auth_required
 from ..rbac import check_permission
@@ -88,6 +90,27 @@ def get_setup_info():
     }
 
 
+@settings.route('/instrumentation', methods=['GET'])
+@auth_required
+@check_permission('read_private', 'system_settings')
+@KubeUtils.jsonwrap
+def get_instrumentation():
+    return {
+        'enabled': current_app.config.get('INSTRUMENTATION_ENABLED', False),
+        'endpoints': instrumentation.get_stats(),
+        'reports': instrumentation.get_reports(),
+        'ssh_pool': ssh_pool.get_metrics(),
+    }
+
+
+@settings.route('/instrumentation', methods=['DELETE'])
+@auth_required
+@check_permission('delete', 'system_settings')
+@KubeUtils.jsonwrap
+def reset_instrumentation():
+    instrumentation.reset()
+
+
 @settings.route('/timezone', methods=['GET'])
 @auth_required
 @check_permission('get', 'timezone')
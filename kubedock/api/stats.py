@@ -20,7 +20,7 @@
 
 from datetime import datetime, timedelta
 
-from flask import Blueprint
+from flask import Blueprint, request
 from sqlalchemy.exc import DataError
 
 from kubedock.exceptions import APIError, InternalAPIError
@@ -31,7 +31,7 @@ from kubedock.login import auth_required
 from kubedock.nodes.models import Node
 from kubedock.pods.models import Pod
 from kubedock.rbac import check_permission
-from kubedock.utils import KubeUtils, NODE_STATUSES
+from kubedock.utils import KubeUtils, NODE_STATUSES, parse_datetime_str
 
 stats = Blueprint('stats', __name__, url_prefix='/stats')
 
@@ -44,13 +44,30 @@ class InternalStatsError(InternalAPIError):
     pass
 
 
+def _get_time_range():
+    """Returns range of requested stats from optional `start` and `end`
+    parameters (UTC, see `parse_datetime_str`). Last hour by default.
+    Long ranges are read from rollups (see `kubedock.kubedata.rollups`).
+    """
+    end, start = request.args.get('end'), request.args.get('start')
+    end = parse_datetime_str(end) if end else datetime.utcnow()
+    if end is None:
+        raise APIError('Invalid "end" parameter')
+    start = parse_datetime_str(start) if start else \
+        end - timedelta(minutes=60)
+    if start is None:
+        raise APIError('Invalid "start" parameter')
+    if start >= end:
+        raise APIError('"start" must be earlier than "end"')
+    return start, end
+
+
 @stats.route('/nodes/<hostname>', methods=['GET'])
 @auth_required
 @check_permission('get', 'nodes')
 @KubeUtils.jsonwrap
 def nodes(hostname):
-    end = datetime.utcnow()
-    start = end - timedelta(minutes=60)
+    start, end = _get_time_range()
 
     node = Node.get_by_name(hostname)
     if node is None:
@@ -91,8 +108,7 @@ def nodes(hostname):
 @check_permission('get', 'pods')
 @KubeUtils.jsonwrap
 def pods(pod_id):
-    end = datetime.utcnow()
-    start = end - timedelta(minutes=60)
+    start, end = _get_time_range()
 
     _check_if_pod_exists(pod_id)
     data = kubestat.get_pod_stat(pod_id, start, end)
@@ -109,8 +125,7 @@ def pods(pod_id):
 @check_permission('get', 'pods')
 @KubeUtils.jsonwrap
 def containers(pod_id, container_id):
-    end = datetime.utcnow()
-    start = end - timedelta(minutes=60)
+    start, end = _get_time_range()
 
     _check_if_pod_exists(pod_id)
     data = kubestat.get_container_stat(pod_id, container_id, start, end)
@@ -31,6 +31,7 @@ from kubedock.utils import NODE_STATUSES
 class NodesUrl(object):
     list = '/nodes/'.format
     one = '/nodes/{0}'.format
+    install_log = '/nodes/{0}/install-log'.format
     create = '/nodes/'.format
     edit = '/nodes/{0}'.format
     patch = '/nodes/{0}'.format
@@ -66,6 +67,20 @@ class TestNodeCRUD(APITestCase):
         response = self.admin_open(NodesUrl.one(12345))
         self.assertAPIError(response, 404, 'APIError')
 
+    @mock.patch('kubedock.kapi.node_utils.get_node_install_log')
+    def test_install_log(self, get_node_install_log):
+        get_node_install_log.return_value = {
+            'log': 'line', 'offset': 10, 'size': 14}
+
+        response = self.admin_open(
+            NodesUrl.install_log(123) + '?offset=10&limit=100', 'GET')
+
+        self.assert200(response)
+        self.assertEqual(response.json['data'],
+                         get_node_install_log.return_value)
+        get_node_install_log.assert_called_once_with(
+            '123', offset=10, limit=100)
+
     def test_create_invalid_type(self):
         response = self.admin_open(
             NodesUrl.create(), 'POST', {
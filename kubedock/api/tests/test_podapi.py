@@ -24,6 +24,7 @@ from uuid import uuid4
 
 import mock
 
+from kubedock.exceptions import APIError
 from kubedock.kapi.podcollection import PodNotFound, PodCollection, KubeQuery
 from kubedock.system_settings.models import SystemSettings
 from kubedock.testutils.testcases import APITestCase
@@ -60,6 +61,57 @@ class TestPodAPI(APITestCase):
 
         self.assertAPIError(response, 404, 'PodNotFound')
 
+    @mock.patch('kubedock.api.podapi.PodCollection')
+    def test_batch_dump(self, PodCollection):
+        PodCollection().iter_dump.return_value = iter([{'a': 1}, {'b': 2}])
+        response = self.admin_open('/podapi/dump', 'GET')
+        self.assert200(response)
+        self.assertEqual(response.json, {'status': 'OK',
+                                         'data': [{'a': 1}, {'b': 2}]})
+
+        PodCollection().iter_dump.return_value = iter([])
+        response = self.admin_open('/podapi/dump', 'GET')
+        self.assertEqual(response.json, {'status': 'OK', 'data': []})
+
+    @mock.patch('kubedock.api.podapi.PodCollection')
+    def test_batch_dump_error(self, PodCollection):
+        pods = [mock.Mock(), mock.Mock(), mock.Mock()]
+        pods[0].dump.return_value = {'a': 1}
+        pods[1].dump.side_effect = APIError('Dump failed')
+
+        # error of the second pod ends the list, the response is valid JSON
+        PodCollection().iter_dump.side_effect = lambda: (
+            pod.dump() for pod in pods)
+        response = self.admin_open('/podapi/dump', 'GET')
+        self.assert200(response)
+        self.assertEqual(response.json, {'status': 'OK', 'data': [
+            {'a': 1},
+            {'error': {'data': 'Dump failed', 'type': 'APIError',
+                       'details': {}}}]})
+        self.assertFalse(pods[2].dump.called)
+
+        # error of the first pod is returned as usual
+        PodCollection().iter_dump.side_effect = lambda: (
+            pod.dump() for pod in pods[1:])
+        response = self.admin_open('/podapi/dump', 'GET')
+        self.assertAPIError(response, 400, 'APIError')
+
+    @mock.patch('kubedock.api.podapi.backup_pods')
+    def test_restore_batch_with_unknown_owner(self, backup_pods):
+        backup_pods.restore_batch.return_value = [{'pod': {'id': 'p1'}}]
+        response = self.admin_open('/podapi/restore/batch', 'POST', {
+            'pod_dumps': [
+                {'owner': {'username': 'unknown-user'}},
+                {'owner': {'username': self.user.username}},
+                {}]})
+        self.assert200(response)
+        results = response.json['data']
+        self.assertEqual(results[1], {'pod': {'id': 'p1'}})
+        self.assertIn('unknown-user', results[0]['error']['data'])
+        self.assertIn('error', results[2])
+        backup_pods.restore_batch.assert_called_once_with(
+            [({'owner': {'username': self.user.username}}, self.user)])
+
     def test_post_invalid_params(self):
         response = self.user_open(PodAPIUrl.post(), 'POST', {})
 
@@ -19,6 +19,10 @@
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+
+import mock
+
+from kubedock import instrumentation
 from kubedock.testutils.testcases import APITestCase
 from kubedock.system_settings.models import SystemSettings
 
@@ -120,6 +124,74 @@ class TestMisc(APITestCase):
         self.assert200(self.open(notifications_url, auth=self.adminauth))
 
 
+class TestInstrumentation(APITestCase):
+    """
+    Test for 'api/settings/instrumentation' endpoint
+    """
+    url = '/settings/instrumentation'
+    INSTRUMENTATION_ENABLED = True
+
+    def setUp(self):
+        instrumentation.reset()
+        self.addCleanup(instrumentation.reset)
+
+    def test_request_is_measured(self):
+        self.assert200(self.open('/settings/menu', auth=self.userauth))
+        self.assert200(self.open('/settings/menu', auth=self.userauth))
+
+        resp = self.admin_open()
+        self.assert200(resp)
+        data = resp.json['data']
+        self.assertTrue(data['enabled'])
+        self.assertIn('connections', data['ssh_pool'])
+        stats = data['endpoints']['settings.get_menu']
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(sum(n for _, n in stats['latency']['histogram']), 2)
+        self.assertGreater(stats['sql']['max'], 0)
+        self.assertEqual(stats['k8s'], {'avg': 0, 'max': 0})
+
+    def test_counters(self):
+        instrumentation.record('test', 7, {'sql': 3, 'k8s': 1})
+        instrumentation.record('test', 20000, {'sql': 1, 'ssh': 2},
+                               error=True)
+        stats = instrumentation.get_stats()['test']
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['errors'], 1)
+        histogram = dict(stats['latency']['histogram'])
+        self.assertEqual(histogram[10], 1)
+        self.assertEqual(histogram['inf'], 1)
+        self.assertEqual(sum(histogram.values()), 2)
+        self.assertEqual(stats['latency']['max'], 20000)
+        self.assertEqual(stats['sql'], {'avg': 2, 'max': 3})
+        self.assertEqual(stats['k8s'], {'avg': 0.5, 'max': 1})
+        self.assertEqual(stats['ssh'], {'avg': 1, 'max': 2})
+        self.assertEqual(stats['redis'], {'avg': 0, 'max': 0})
+
+    @mock.patch('kubedock.kapi.helpers.requests')
+    def test_k8s_calls_are_counted(self, requests_mock):
+        from kubedock.kapi.helpers import KubeQuery
+        instrumentation._local.counters = counters = {'k8s': 0}
+        try:
+            KubeQuery().get(['pods'])
+            KubeQuery().post(['pods'], '{}')
+        finally:
+            instrumentation._local.counters = None
+        self.assertEqual(counters['k8s'], 2)
+
+    def test_reports(self):
+        from kubedock.utils import report_metrics
+        report_metrics('test', {'phase': 1.5})
+        resp = self.open(auth=self.adminauth)
+        self.assertEqual(resp.json['data']['reports'],
+                         {'test': {'phase': 1.5}})
+
+    def test_reset(self):
+        instrumentation.record('test', 1, {})
+        self.assert200(self.open(method='DELETE', auth=self.adminauth))
+        self.assertNotIn('test', instrumentation.get_stats())
+
+
 def by_name(response, name):
     try:
         return (setting for setting in response.json.get('data')
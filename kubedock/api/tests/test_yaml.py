@@ -167,6 +167,27 @@ class TestYamlAPI(APITestCase):
             })
             self.assert200(response)
 
+    @mock.patch.object(yaml_api, 'send_event_to_user')
+    @mock.patch('kubedock.validation.V._validate_kube_type_exists')
+    @mock.patch('kubedock.kapi.apps.PodCollection')
+    def test_batch(self, PodCollection, _, send_event_to_user):
+        PodCollection().add_batch.return_value = [
+            ({'id': 'nginx'}, None), ({'id': 'redis'}, None)]
+        invalid = "apiVersion: v1\nkind: Pod\n"
+
+        response = self.user_open(self.item_url('batch'), 'POST', {
+            'data': '\n---\n'.join(
+                [_CORRECT_NGINX_YAML, invalid, _CORRECT_REDIS_YML])
+        })
+        self.assert200(response)
+        results = response.json['data']
+        self.assertEqual(results[0], {'pod': {'id': 'nginx'}})
+        self.assertEqual(results[1]['error']['type'], 'ValidationError')
+        self.assertEqual(results[2], {'pod': {'id': 'redis'}})
+        self.assertEqual(
+            len(PodCollection().add_batch.call_args[0][0]), 2)
+        self.assertEqual(send_event_to_user.call_count, 2)
+
     @mock.patch.object(yaml_api.KubeUtils, 'get_current_user')
     @mock.patch.object(yaml_api, 'AppInstance')
     def test_switch_pod_plan(self, AppInstanceMock, get_current_user):
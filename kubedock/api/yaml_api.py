@@ -27,7 +27,8 @@ from kubedock.billing import has_billing
 from kubedock.decorators import maintenance_protected
 from kubedock.exceptions import (
     APIError, InsufficientData, PermissionDenied, PredefinedAppExc)
-from kubedock.kapi.apps import PredefinedApp, AppInstance, start_pod_from_yaml
+from kubedock.kapi.apps import (
+    PredefinedApp, AppInstance, start_pod_from_yaml, start_pods_from_yaml)
 from kubedock.kapi.podcollection import PodCollection
 from kubedock.login import auth_required
 from kubedock.rbac import check_permission
@@ -50,6 +51,16 @@ def check_owner(owner=None):
     return owner
 
 
+def parse_yaml_documents(data):
+    if data is None:
+        raise InsufficientData('No "data" provided')
+    try:
+        return list(yaml.safe_load_all(data))
+    except yaml.YAMLError as e:
+        raise PredefinedAppExc.UnparseableTemplate(
+            'Incorrect yaml, parsing failed: "{0}"'.format(str(e)))
+
+
 class YamlAPI(KubeUtils, MethodView):
     decorators = (
         KubeUtils.jsonwrap,
@@ -63,14 +74,7 @@ class YamlAPI(KubeUtils, MethodView):
                 allow_unknown=True)
     def post(self, **params):
         user = self.get_current_user()
-        data = params.get('data')
-        if data is None:
-            raise InsufficientData('No "data" provided')
-        try:
-            parsed_data = list(yaml.safe_load_all(data))
-        except yaml.YAMLError as e:
-            raise PredefinedAppExc.UnparseableTemplate(
-                'Incorrect yaml, parsing failed: "{0}"'.format(str(e)))
+        parsed_data = parse_yaml_documents(params.get('data'))
 
         try:
             res = start_pod_from_yaml(parsed_data, user=user)
@@ -86,6 +90,27 @@ class YamlAPI(KubeUtils, MethodView):
 register_api(yamlapi, YamlAPI, 'yamlapi', '/', 'pod_id')
 
 
+@yamlapi.route('/batch', methods=['POST'])
+@auth_required
+@KubeUtils.pod_start_permissions
+@check_permission('create', 'yaml_pods')
+@KubeUtils.jsonwrap
+@maintenance_protected
+@use_kwargs({'data': {'type': 'string', 'empty': False}},
+            allow_unknown=True)
+def create_pods_batch(**params):
+    """Creates many pods from multi-document yaml. Returns results in order
+    of pods: {'pod': <created pod>} or {'error': <error description>}.
+    """
+    user = KubeUtils.get_current_user()
+    parsed_data = parse_yaml_documents(params.get('data'))
+    results = start_pods_from_yaml(parsed_data, user)
+    for result in results:
+        if 'pod' in result:
+            send_event_to_user('pod:change', result['pod'], user.id)
+    return results
+
+
 @yamlapi.route('/fill/<int:template_id>/<int:plan_id>', methods=['POST'])
 @use_kwargs({}, allow_unknown=True)
 def fill_template(template_id, plan_id, **params):
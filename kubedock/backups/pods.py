@@ -17,20 +17,28 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
-
 import os
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from flask import current_app
+from sqlalchemy import tuple_
 
 from kubedock import validation
 from kubedock.backups import utils
-from kubedock.exceptions import APIError
-from kubedock.kapi.pod import VolumeExists
+from kubedock.core import db
+from kubedock.exceptions import APIError, api_error_to_dict
+# podcollection must be imported before pod because of cyclic imports
 from kubedock.kapi.podcollection import PodCollection
+from kubedock.kapi.pod import VolumeExists
 from kubedock.pods.models import Pod as DBPod, PersistentDisk, \
     PersistentDiskStatuses
 from kubedock.users import User
 from kubedock.utils import nested_dict_utils
 
 DEFAULT_BACKUP_PATH_TEMPLATE = '/{owner_id}/{volume_name}.tar.gz'
+#: Max number of pods which are restored concurrently by `restore_batch`
+RESTORE_CONCURRENCY = 8
 
 
 def _filter_persistent_volumes(pod_spec):
@@ -46,14 +54,7 @@ class MultipleErrors(APIError):
 
     def __init__(self, errors):
         details = {
-            'errors': [
-                {
-                    'data': e.message,
-                    'type': getattr(e, 'type', e.__class__.__name__),
-                    'details': e.details
-                }
-                for e in errors
-            ]
+            'errors': [api_error_to_dict(e) for e in errors]
         }
         super(MultipleErrors, self).__init__(details=details)
 
@@ -94,8 +95,21 @@ class _PodRestoreCommand(object):
             pv_backups_location, pv_backups_path_template, **template_dict)
 
     def __call__(self):
+        self.prepare()
+        _ConflictsChecker([self]).check(self)
+        return self.restore()
+
+    @property
+    def pod_name(self):
+        return nested_dict_utils.get(self.pod_dump, 'pod_data.name')
+
+    def prepare(self, validation_context=None):
+        """Validates the dump and adds backup urls to its persistent
+        volumes.
+        """
         pod_dump = self.pod_dump
         validation.check_pod_dump(pod_dump, user=self.owner,
+                                  context=validation_context,
                                   allow_unknown=True)
 
         pod_data = pod_dump['pod_data']
@@ -112,12 +126,22 @@ class _PodRestoreCommand(object):
             self._extend_pv_specs_with_backup_info(persistent_volumes,
                                                    volumes_map)
 
-        self._check_for_conflicts(pod_data, volumes_map)
-
-        restored_pod_dict = self._restore_pod(pod_dump)
+    def restore(self):
+        """Creates the pod and starts it if it was running."""
+        restored_pod_dict = self._restore_pod(self.pod_dump)
         restored_pod_dict = self._start_pod_if_needed(restored_pod_dict)
         return restored_pod_dict
 
+    def get_restored_volume_names(self):
+        """Returns names of persistent disks which are restored from
+        backups (i.e. not ceph volumes which are reused as is).
+        """
+        pod_data = self.pod_dump['pod_data']
+        volumes_map = self.pod_dump['volumes_map']
+        return [nested_dict_utils.get(vol, 'persistentDisk.pdName')
+                for vol in _filter_persistent_volumes(pod_data)
+                if volumes_map.get(vol.get('name')) != 'ceph']
+
     def _extend_pv_specs_with_backup_info(self, pv_specs, volumes_map):
         for pv_spec in pv_specs:
             pd_name = nested_dict_utils.get(pv_spec, 'name')
@@ -127,49 +151,6 @@ class _PodRestoreCommand(object):
             backup_url = self.backup_url_factory.get_url(pd_name, pd_path)
             nested_dict_utils.set(pv_spec, 'annotation.backupUrl', backup_url)
 
-    def _check_for_conflicts(self, pod_data, volumes_map):
-        errors = []
-        pod_name = nested_dict_utils.get(pod_data, 'name')
-        e = self._check_pod_name(pod_name)
-        if e:
-            errors.append(e)
-
-        vols = _filter_persistent_volumes(pod_data)
-        for vol in vols:
-            volume_name = nested_dict_utils.get(vol, 'persistentDisk.pdName')
-            if volumes_map.get(vol.get('name')) != 'ceph':
-                e = self._check_volume_name(volume_name)
-                if e:
-                    errors.append(e)
-        if errors:
-            if len(errors) == 1:
-                raise errors[0]
-            else:
-                raise MultipleErrors(errors)
-
-    def _check_pod_name(self, pod_name):
-        pod = DBPod.query.filter(
-            DBPod.name == pod_name, DBPod.owner_id == self.owner.id
-        ).first()
-        if pod:
-            return APIError(
-                'Pod with name "{0}" already exists.'.format(pod_name),
-                status_code=409, type='PodNameConflict',
-                details={'id': pod.id, 'name': pod.name}
-            )
-
-    def _check_volume_name(self, volume_name):
-        persistent_disk = PersistentDisk.filter(
-            PersistentDisk.owner_id == self.owner.id,
-            PersistentDisk.name == volume_name,
-            PersistentDisk.state.in_([
-                PersistentDiskStatuses.PENDING,
-                PersistentDiskStatuses.CREATED
-            ])
-        ).first()
-        if persistent_disk:
-            return VolumeExists(persistent_disk.name, persistent_disk.id)
-
     def _restore_pod(self, pod_dump):
         pod_collection = PodCollection(owner=self.owner)
         restored_pod_dict = pod_collection.add_from_dump(pod_dump)
@@ -186,6 +167,77 @@ class _PodRestoreCommand(object):
         return restored_pod_dict
 
 
+class _ConflictsChecker(object):
+    """
+    Finds existing pods and persistent disks which have the same names as
+    restored ones. Conflicting records of all restored pods are loaded by
+    two queries. Pods and disks which are restored more than once are
+    conflicts too.
+    """
+
+    def __init__(self, commands):
+        pod_keys, disk_keys = set(), set()
+        for command in commands:
+            pod_keys.add((command.owner.id, command.pod_name))
+            disk_keys.update((command.owner.id, name)
+                             for name in command.get_restored_volume_names())
+
+        self.pods, self.disks = {}, {}
+        if pod_keys:
+            pods = DBPod.query.filter(
+                tuple_(DBPod.owner_id, DBPod.name).in_(pod_keys))
+            self.pods = {(pod.owner_id, pod.name): pod for pod in pods}
+        if disk_keys:
+            disks = PersistentDisk.filter(
+                tuple_(PersistentDisk.owner_id,
+                       PersistentDisk.name).in_(disk_keys),
+                PersistentDisk.state.in_([
+                    PersistentDiskStatuses.PENDING,
+                    PersistentDiskStatuses.CREATED
+                ])
+            )
+            self.disks = {(pd.owner_id, pd.name): pd for pd in disks}
+        self._restored_pods, self._restored_disks = set(), set()
+
+    def check(self, command):
+        """Raises an error if the pod of the command can not be restored
+        because of conflicts with existing or already checked pods.
+        """
+        errors = []
+        owner_id = command.owner.id
+        pod_name = command.pod_name
+        pod = self.pods.get((owner_id, pod_name))
+        if pod:
+            errors.append(APIError(
+                'Pod with name "{0}" already exists.'.format(pod_name),
+                status_code=409, type='PodNameConflict',
+                details={'id': pod.id, 'name': pod.name}
+            ))
+        elif (owner_id, pod_name) in self._restored_pods:
+            errors.append(APIError(
+                'Pod with name "{0}" is restored more than once.'.format(
+                    pod_name), status_code=409))
+
+        volume_names = command.get_restored_volume_names()
+        for volume_name in volume_names:
+            persistent_disk = self.disks.get((owner_id, volume_name))
+            if persistent_disk:
+                errors.append(VolumeExists(persistent_disk.name,
+                                           persistent_disk.id))
+            elif (owner_id, volume_name) in self._restored_disks:
+                errors.append(APIError(
+                    'Volume with name "{0}" is restored more than '
+                    'once.'.format(volume_name), status_code=409))
+        if errors:
+            if len(errors) == 1:
+                raise errors[0]
+            else:
+                raise MultipleErrors(errors)
+
+        self._restored_pods.add((owner_id, pod_name))
+        self._restored_disks.update((owner_id, name) for name in volume_names)
+
+
 def restore(pod_dump, owner, pv_backups_location=None,
             pv_backups_path_template=None):
     """Restore pod from backup.
@@ -211,3 +263,89 @@ def restore(pod_dump, owner, pv_backups_location=None,
     return _PodRestoreCommand(
         pod_dump, owner, pv_backups_location, pv_backups_path_template,
     )()
+
+
+def _restore_in_app_context(app, command):
+    with app.app_context():
+        try:
+            # objects of the caller's session must not be used in this thread
+            command.owner = User.get(command.owner)
+            return command.restore(), None
+        except APIError as e:
+            return None, e
+        except Exception:
+            current_app.logger.exception(
+                'Failed to restore pod "%s"', command.pod_name)
+            return None, APIError(
+                'Failed to restore pod "{0}".'.format(command.pod_name),
+                status_code=500)
+        finally:
+            db.session.remove()
+
+
+def restore_batch(pod_dumps, pv_backups_location=None,
+                  pv_backups_path_template=None,
+                  concurrency=RESTORE_CONCURRENCY):
+    """Restore several pods from backup.
+
+    All dumps are validated and checked for conflicts before any pod is
+    created, then pods are created (and started) concurrently. A failure of
+    one pod does not prevent restoring of the others.
+
+    Args:
+        pod_dumps (list): List of tuples (pod dump, pod's owner).
+        pv_backups_location (str): Url where backups are stored.
+        pv_backups_path_template (str): Template of path to backup at backups
+            location. See `restore`.
+        concurrency (int): Max number of pods restored at the same time.
+
+    Returns:
+        list: Results in the same order as dumps. Every result is a
+            dictionary with restored pod's data in 'pod' or error
+            description (see `MultipleErrors`) in 'error'.
+    """
+    commands = [
+        _PodRestoreCommand(pod_dump, owner, pv_backups_location,
+                           pv_backups_path_template)
+        for pod_dump, owner in pod_dumps]
+    errors = [None] * len(commands)
+
+    contexts = {}
+    for i, command in enumerate(commands):
+        context = contexts.get(command.owner.id)
+        if context is None:
+            context = contexts[command.owner.id] = \
+                validation.ValidationContext(command.owner.username)
+        try:
+            command.prepare(validation_context=context)
+        except APIError as e:
+            errors[i] = e
+
+    checker = _ConflictsChecker(
+        [command for command, error in zip(commands, errors)
+         if error is None])
+    for i, command in enumerate(commands):
+        if errors[i] is None:
+            try:
+                checker.check(command)
+            except APIError as e:
+                errors[i] = e
+
+    ready = [i for i, error in enumerate(errors) if error is None]
+    restored = {}
+    if ready:
+        pool = ThreadPool(min(len(ready), concurrency))
+        try:
+            results = pool.map(
+                partial(_restore_in_app_context,
+                        current_app._get_current_object()),
+                [commands[i] for i in ready])
+        finally:
+            pool.close()
+        for i, (pod, error) in zip(ready, results):
+            restored[i] = pod
+            errors[i] = error
+
+    return [{'error': api_error_to_dict(error)} if error is not None
+            else {'pod': restored[i]}
+            for i, error in enumerate(errors)]
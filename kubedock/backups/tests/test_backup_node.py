@@ -0,0 +1,135 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import tarfile
+
+import pytest
+
+import backup_node
+from node_network_plugin import VolumeManager
+
+
+@pytest.fixture
+def storage(tmpdir, monkeypatch):
+    """Local storage with one volume of user 3"""
+    storage_dir = tmpdir.mkdir('storage')
+    volume = storage_dir.mkdir('3').mkdir('vol1')
+    volume.join('a.txt').write('a')
+    volume.join('c.txt').write('c')
+    volume.mkdir('dir').join('b.txt').write('b')
+    monkeypatch.setattr(backup_node, 'STORAGE_LOCATION', storage_dir.strpath)
+    return volume
+
+
+@pytest.fixture
+def backups(tmpdir):
+    return tmpdir.mkdir('backups')
+
+
+@pytest.fixture
+def state_dir(tmpdir):
+    return tmpdir.join('state').strpath
+
+
+def run_backup(backups, state_dir, callback=None, **kwargs):
+    before = set(backups.listdir())
+    backup_node.make_node_backup(backups.strpath, callback, False, jobs=2,
+                                 state_dir=state_dir, **kwargs)
+    run, = set(backups.listdir()) - before
+    return run
+
+
+def archive_names(path):
+    with tarfile.open(path) as archive:
+        return sorted(archive.getnames())
+
+
+def read_tree(path):
+    tree = {}
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            full_path = os.path.join(root, name)
+            with open(full_path) as f:
+                tree[os.path.relpath(full_path, path)] = f.read()
+    return tree
+
+
+def test_incremental_backup_and_restore(storage, backups, state_dir, tmpdir):
+    full = run_backup(backups, state_dir)
+    assert archive_names(full.join('3', 'vol1.tar.gz').strpath) == [
+        'a.txt', 'c.txt', 'dir', 'dir/b.txt']
+
+    storage.join('a.txt').write('new a')
+    storage.join('c.txt').remove()
+    storage.join('dir', 'd.txt').write('d')
+    incremental = run_backup(backups, state_dir)
+    archive = incremental.join('3', 'vol1.tar.gz').strpath
+    assert archive_names(archive) == [
+        backup_node.BACKUP_META, 'a.txt', 'dir', 'dir/d.txt']
+    with tarfile.open(archive) as tar:
+        meta = json.load(tar.extractfile(backup_node.BACKUP_META))
+    assert meta == {
+        'base': os.path.join('..', '..', full.basename, '3', 'vol1.tar.gz'),
+        'deleted': ['c.txt']}
+
+    restored = tmpdir.join('restored').strpath
+    VolumeManager()._restore('file://' + archive, restored)
+    assert read_tree(restored) == {
+        'a.txt': 'new a', 'dir/b.txt': 'b', 'dir/d.txt': 'd'}
+
+
+def test_full_backup_if_codec_changed_or_chain_is_long(
+        storage, backups, state_dir):
+    run_backup(backups, state_dir)
+    run = run_backup(backups, state_dir, codec='bzip2', level=9)
+    assert backup_node.BACKUP_META not in archive_names(
+        run.join('3', 'vol1.tar.bz2').strpath)
+
+    run = run_backup(backups, state_dir, codec='bzip2', max_chain=1)
+    assert backup_node.BACKUP_META in archive_names(
+        run.join('3', 'vol1.tar.bz2').strpath)
+    run = run_backup(backups, state_dir, codec='bzip2', max_chain=1)
+    assert backup_node.BACKUP_META not in archive_names(
+        run.join('3', 'vol1.tar.bz2').strpath)
+
+
+def test_state_is_not_saved_if_callback_failed(storage, backups, state_dir):
+    with pytest.raises(backup_node.BackupError):
+        run_backup(backups, state_dir, callback='false')
+    run = run_backup(backups, state_dir)
+    assert backup_node.BACKUP_META not in archive_names(
+        run.join('3', 'vol1.tar.gz').strpath)
+
+
+def test_get_zfs_changes(mocker):
+    mocker.patch.object(backup_node.subprocess, 'check_output',
+                        return_value=(
+                            'M\t/storage/3/vol1/dir\n'
+                            '+\t/storage/3/vol1/dir/new\\0040file\n'
+                            '-\t/storage/3/vol1/old\n'
+                            'R\t/storage/3/vol1/dir1\t/storage/3/vol1/dir2\n'
+                        ))
+    changed, deleted = backup_node.get_zfs_changes(
+        'pool/vol1@kdbackup-1', 'pool/vol1@kdbackup-2', '/storage/3/vol1')
+    assert changed == [('dir', False), ('dir/new file', False),
+                       ('dir2', True)]
+    assert deleted == ['dir1', 'old']
@@ -0,0 +1,134 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+import mock
+
+from kubedock.backups import pods as backup_pods
+from kubedock.exceptions import APIError
+from kubedock.pods.models import PersistentDisk
+from kubedock.testutils.testcases import DBTestCase
+
+
+def pod_dump(name, volumes=(), status='stopped'):
+    return {
+        'pod_data': {
+            'name': name,
+            'status': status,
+            'volumes': [{'name': volume,
+                         'persistentDisk': {'pdName': volume}}
+                        for volume in volumes],
+        },
+        'volumes_map': {volume: '/var/lib/storage/{0}'.format(volume)
+                        for volume in volumes},
+        'owner': {'id': 100, 'username': 'original'},
+    }
+
+
+class TestRestoreBatch(DBTestCase):
+    def setUp(self):
+        self.user, _ = self.fixtures.user_fixtures()
+        self.other_user, _ = self.fixtures.user_fixtures()
+
+        patcher = mock.patch.object(backup_pods.validation, 'check_pod_dump')
+        self.check_pod_dump = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(backup_pods, 'PodCollection')
+        self.pod_collection = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pod_collection.return_value.add_from_dump.side_effect = (
+            lambda dump: {'id': 'id-' + dump['pod_data']['name'],
+                          'name': dump['pod_data']['name']})
+
+    def test_restore_batch(self):
+        existing_pod = self.fixtures.pod(owner=self.user, name='existing')
+        self.db.session.add(PersistentDisk(
+            name='existing-pd', owner_id=self.user.id, size=1))
+        self.db.session.commit()
+        dumps = [
+            (pod_dump('pod1', ['pd1']), self.user),
+            (pod_dump('existing'), self.user),
+            (pod_dump('pod2', ['existing-pd']), self.user),
+            (pod_dump('pod3', ['pd1']), self.user),
+            (pod_dump('existing', ['existing-pd']), self.other_user),
+            (pod_dump('pod4', ['pd4']), self.user),
+        ]
+
+        results = backup_pods.restore_batch(
+            dumps, pv_backups_location='http://backups')
+
+        self.assertEqual(results[0], {'pod': {'id': 'id-pod1',
+                                              'name': 'pod1'}})
+        self.assertEqual(results[1]['error']['type'], 'PodNameConflict')
+        self.assertEqual(results[1]['error']['details'],
+                         {'id': existing_pod.id, 'name': 'existing'})
+        self.assertEqual(results[2]['error']['type'], 'VolumeExists')
+        # volume is restored by the first pod
+        self.assertEqual(results[3]['error']['type'], 'APIError')
+        # pods and volumes of other users do not conflict
+        self.assertIn('pod', results[4])
+        self.assertIn('pod', results[5])
+        restored = [
+            call[0][0]['pod_data']['name'] for call in
+            self.pod_collection.return_value.add_from_dump.call_args_list]
+        self.assertItemsEqual(restored, ['pod1', 'existing', 'pod4'])
+        self.assertEqual(
+            dumps[0][0]['pod_data']['volumes'][0]['annotation']['backupUrl'],
+            'http://backups/{0}/pd1.tar.gz'.format(self.user.id))
+
+        # validation data is shared by pods of the same owner
+        contexts = {}
+        for args, kwargs in self.check_pod_dump.call_args_list:
+            contexts.setdefault(kwargs['user'], set()).add(
+                id(kwargs['context']))
+        self.assertEqual(map(len, contexts.values()), [1, 1])
+
+    def test_restore_batch_reports_errors_of_each_pod(self):
+        self.check_pod_dump.side_effect = [APIError('invalid'), None, None]
+        self.pod_collection.return_value.update.side_effect = APIError(
+            'can not start')
+
+        results = backup_pods.restore_batch([
+            (pod_dump('pod1'), self.user),
+            (pod_dump('pod2', status='running'), self.user),
+            (pod_dump('pod3'), self.user),
+        ])
+
+        self.assertEqual(results[0]['error']['data'], 'invalid')
+        self.assertEqual(results[1]['error']['data'], 'can not start')
+        self.assertEqual(results[2], {'pod': {'id': 'id-pod3',
+                                              'name': 'pod3'}})
+
+    def test_restore_checks_conflicts(self):
+        self.fixtures.pod(owner=self.user, name='existing')
+        self.db.session.add(PersistentDisk(
+            name='existing-pd', owner_id=self.user.id, size=1))
+        self.db.session.commit()
+
+        with self.assertRaises(backup_pods.MultipleErrors) as err:
+            backup_pods.restore(pod_dump('existing', ['existing-pd']),
+                                self.user, 'http://backups')
+        self.assertEqual(
+            [e['type'] for e in err.exception.details['errors']],
+            ['PodNameConflict', 'VolumeExists'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,12 +18,12 @@
 # You should have received a copy of the GNU General Public License
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
-from .models import Kube, Package, ExtraTax, PackageKube
+from .models import Kube, Package, ExtraTax, PackageKube, kube_catalogue
 from kubedock.system_settings.models import SystemSettings
 
 
 def kubes_to_limits(count, kube_type):
-    kube = Kube.query.get(kube_type)
+    kube = kube_catalogue.get_kube(kube_type)
 
     resources = {
         'cpu': '{0}'.format(count * kube.cpu),
@@ -36,7 +36,7 @@ def kubes_to_limits(count, kube_type):
 
 
 def repr_limits(count, kube_type):
-    kube = Kube.query.get(kube_type)
+    kube = kube_catalogue.get_kube(kube_type)
 
     cpu = '{0} {1}'.format(count * kube.cpu, kube.cpu_units)
     memory = '{0} {1}'.format(count * kube.memory, kube.memory_units)
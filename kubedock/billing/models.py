@@ -19,7 +19,8 @@
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
 from collections import namedtuple
-from ..core import db
+from ..core import db, PubSubCache
+from ..nodes.models import Node
 from ..users.models import User
 from ..utils import send_event_to_user, send_event_to_role
 from ..models_mixin import BaseModelMixin
@@ -182,6 +183,8 @@ class Kube(BaseModelMixin, db.Model):
         return kube_type != INTERNAL_SERVICE_KUBE_TYPE
 
     def send_event(self, name):
+        # availability of the kube depends on nodes
+        kube_catalogue.mark_changed()
         event_name, data = 'kube:{0}'.format(name), self.to_dict()
         for (user_id,) in db.session.query(User.id).filter(
                 User.package_id.in_([p.package_id for p in self.packages])).all():
@@ -197,3 +200,111 @@ class ExtraTax(BaseModelMixin, db.Model):
     price = db.Column(db.Float, default=0.0, nullable=False)
     currency = db.Column(db.String(16), default="USD", nullable=False)
     period = db.Column(db.String(16), default="hour", nullable=False)
+
+
+class KubeRecord(namedtuple('KubeRecord', Kube.__table__.columns.keys() +
+                            ['available'])):
+    """Immutable copy of Kube from `kube_catalogue`."""
+    __slots__ = ()
+
+    def to_dict(self):
+        return dict(self._asdict())
+
+    def to_limits(self, kubes=1):
+        return Limits(kubes * self.cpu, kubes * self.memory,
+                      kubes * self.disk_space)
+
+    def is_public(self):
+        return self.id not in NOT_PUBLIC_KUBE_TYPES
+
+
+PackageKubeRecord = namedtuple('PackageKubeRecord', ['kube', 'kube_price'])
+
+
+class PackageRecord(namedtuple('PackageRecord',
+                               Package.__table__.columns.keys() + ['kubes'])):
+    """Immutable copy of Package from `kube_catalogue`.
+    `kubes` is a tuple of PackageKubeRecord.
+    """
+    __slots__ = ()
+
+    def to_dict(self, with_kubes=False, with_internal=False):
+        data = dict(self._asdict())
+        del data['kubes']
+        if with_kubes:
+            data['kubes'] = [dict(package_kube.kube.to_dict(),
+                                  price=package_kube.kube_price)
+                             for package_kube in self.kubes]
+            if with_internal:
+                internal = kube_catalogue.get_kube(INTERNAL_SERVICE_KUBE_TYPE)
+                data['kubes'].append(dict(internal.to_dict(), price=0))
+        return data
+
+    def get_kube(self, kube_id):
+        for package_kube in self.kubes:
+            if package_kube.kube.id == kube_id:
+                return package_kube
+
+
+class KubeCatalogue(PubSubCache):
+    """Per-process cache of all kubes, packages and kubes of packages.
+    Lookups return immutable records instead of models.
+    """
+    channel = 'kd.billing.catalogue.invalidate'
+    models = (Kube, Package, PackageKube)
+
+    def load(self):
+        with_nodes = set(kube_id for (kube_id,) in
+                         db.session.query(Node.kube_id).distinct())
+        kubes = {}
+        for kube in Kube.query:
+            kubes[kube.id] = KubeRecord(available=(
+                kube.id == INTERNAL_SERVICE_KUBE_TYPE or kube.id in with_nodes
+            ), **BaseModelMixin.to_dict(kube))
+        package_kubes = {}
+        for package_kube in PackageKube.query.order_by(PackageKube.id):
+            package_kubes.setdefault(package_kube.package_id, []).append(
+                PackageKubeRecord(kubes[package_kube.kube_id],
+                                  package_kube.kube_price))
+        packages = {}
+        for package in Package.query:
+            packages[package.id] = PackageRecord(
+                kubes=tuple(package_kubes.get(package.id, ())),
+                **BaseModelMixin.to_dict(package))
+        return kubes, packages
+
+    def get_kube(self, kube_id):
+        try:
+            kube_id = int(kube_id)
+        except (TypeError, ValueError):
+            return None
+        return self.get_data()[0].get(kube_id)
+
+    def get_kubes(self):
+        return sorted(self.get_data()[0].itervalues(), key=lambda k: k.id)
+
+    def get_public_kubes(self):
+        return [kube for kube in self.get_kubes() if kube.is_public()]
+
+    def get_default_kube(self):
+        for kube in self.get_data()[0].itervalues():
+            if kube.is_default:
+                return kube
+
+    def get_package(self, package_id):
+        try:
+            package_id = int(package_id)
+        except (TypeError, ValueError):
+            return None
+        return self.get_data()[1].get(package_id)
+
+    def get_packages(self):
+        return sorted(self.get_data()[1].itervalues(), key=lambda p: p.id)
+
+    def get_default_package(self):
+        for package in self.get_data()[1].itervalues():
+            if package.is_default:
+                return package
+
+
+kube_catalogue = KubeCatalogue()
@@ -0,0 +1,88 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import mock
+
+from kubedock import billing
+from kubedock.billing.models import (
+    Kube, Package, PackageKube, kube_catalogue, INTERNAL_SERVICE_KUBE_TYPE)
+from kubedock.testutils.testcases import DBTestCase
+
+
+class TestKubeCatalogue(DBTestCase):
+    def setUp(self):
+        self.kube = self.fixtures.kube_type()
+        self.package = Package(name='test package').save()
+        PackageKube(package=self.package, kube=self.kube,
+                    kube_price=2.5).save()
+        # in tests changes are never committed to the root transaction
+        self.db.session().info.pop(kube_catalogue.session_flag, None)
+
+    def _count_queries(self):
+        return mock.patch.object(Kube, 'query', wraps=Kube.query)
+
+    def test_lookups_are_cached(self):
+        kube = kube_catalogue.get_kube(self.kube.id)
+        self.assertEqual(kube.to_dict(), self.kube.to_dict())
+        with self._count_queries() as query_mock:
+            self.assertIs(kube_catalogue.get_kube(str(self.kube.id)), kube)
+            self.assertEqual(billing.kubes_to_limits(2, self.kube.id), {
+                'resources': {
+                    'requires': {'cpu': '0.5', 'memory': 128 * 1024 * 1024},
+                    'limits': {'cpu': '0.5', 'memory': 128 * 1024 * 1024},
+                }})
+            self.assertEqual(billing.repr_limits(2, self.kube.id), {
+                'cpu': '0.5 Cores', 'memory': '128 MB'})
+        self.assertFalse(query_mock.called)
+
+        with self.assertRaises(AttributeError):
+            kube.cpu = 1
+        self.assertIsNone(kube_catalogue.get_kube('unknown'))
+
+    def test_packages(self):
+        package = kube_catalogue.get_package(self.package.id)
+        self.assertEqual(package.to_dict(), self.package.to_dict())
+        self.assertEqual(
+            package.to_dict(with_kubes=True, with_internal=True)['kubes'],
+            [dict(self.kube.to_dict(), price=2.5),
+             dict(Kube.query.get(INTERNAL_SERVICE_KUBE_TYPE).to_dict(),
+                  price=0)])
+        self.assertEqual(package.get_kube(self.kube.id).kube_price, 2.5)
+        self.assertIn(package, kube_catalogue.get_packages())
+        self.assertEqual(kube_catalogue.get_default_package().id,
+                         Package.get_default().id)
+
+    def test_changes_invalidate_catalogue(self):
+        self.assertEqual(kube_catalogue.get_kube(self.kube.id).cpu, .25)
+        self.kube.cpu = .5
+        self.assertEqual(kube_catalogue.get_kube(self.kube.id).cpu, .5)
+
+        PackageKube.query.filter_by(package_id=self.package.id).delete()
+        self.assertEqual(kube_catalogue.get_package(self.package.id).kubes,
+                         ())
+
+    @mock.patch('kubedock.billing.models.send_event_to_role')
+    def test_send_event_invalidates_catalogue(self, _):
+        self.assertFalse(kube_catalogue.get_kube(self.kube.id).available)
+        self.db.session.add(self.fixtures.node(kube_id=self.kube))
+        self.db.session.flush()
+        self.db.session().info.pop(kube_catalogue.session_flag, None)
+        self.kube.send_event('change')
+        self.assertTrue(kube_catalogue.get_kube(self.kube.id).available)
@@ -19,19 +19,28 @@
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
 import json
+import os
 import socket
+import threading
 import time
+from collections import defaultdict
+from contextlib import contextmanager
 
 import paramiko
 import redis
 from paramiko.ssh_exception import AuthenticationException, SSHException
+from sqlalchemy.orm import Session, object_session
 from flask_sqlalchemy_fix import SQLAlchemy
 from flask import current_app
 from werkzeug.contrib.cache import RedisCache
 
+from . import instrumentation
 from .login import LoginManager
 from .settings import (REDIS_HOST, REDIS_PORT,
                        SSH_KEY_FILENAME,
+                       SSH_POOL_MAX_CHANNELS,
+                       SSH_POOL_IDLE_TIMEOUT,
+                       SSH_POOL_KEEPALIVE_INTERVAL,
                        SSE_KEEPALIVE_INTERVAL,
                        SSE_POLL_INTERVAL)
 
@@ -255,6 +264,7 @@ class EvtStream(object):
 
 
 def ssh_connect(host, timeout=10):
+    instrumentation.count('ssh')
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     error_message = None
@@ -278,6 +288,144 @@ def ssh_connect(host, timeout=10):
     return ssh, error_message
 
 
+class SSHConnectionPool(object):
+    """Per-host pool of keep-alive SSH connections to nodes.
+    Only one connection is kept for every host and each command is executed
+    in a separate channel of the connection. Number of simultaneously leased
+    channels per host is limited. Connections which are not active anymore
+    or idle for too long are closed.
+    Every process has its own connections, pool is cleared after fork.
+    """
+
+    class _Host(object):
+        def __init__(self, max_channels):
+            self.client = None
+            self.last_used = 0
+            self.in_use = 0
+            self.lock = threading.Lock()
+            self.channels = threading.BoundedSemaphore(max_channels)
+
+    def __init__(self, max_channels=SSH_POOL_MAX_CHANNELS,
+                 idle_timeout=SSH_POOL_IDLE_TIMEOUT,
+                 keepalive=SSH_POOL_KEEPALIVE_INTERVAL):
+        self.max_channels = max_channels
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._hosts = {}
+        self.metrics = defaultdict(int)
+
+    @contextmanager
+    def connect(self, host, timeout=10):
+        """Leases connection to the host. Like `ssh_connect` yields a tuple
+        of paramiko SSHClient and error message. Do not close the client.
+        The connection is dropped if SSH or socket error is raised inside
+        the block.
+
+        :param host: node hostname or IP
+        :param timeout: timeout for a new connection in seconds
+        """
+        self.evict_idle()
+        entry = self._get_host(host)
+        if not entry.channels.acquire(False):
+            self.metrics['waits'] += 1
+            entry.channels.acquire()
+        with self._lock:
+            entry.in_use += 1
+        try:
+            ssh, error_message = self._get_client(entry, host, timeout)
+            try:
+                yield ssh, error_message
+            except (SSHException, socket.error, EOFError):
+                self.metrics['broken'] += 1
+                self._close(entry)
+                raise
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+            entry.channels.release()
+
+    def evict_idle(self):
+        """Closes connections which were not used for `idle_timeout`."""
+        deadline = time.time() - self.idle_timeout
+        with self._lock:
+            idle = [entry for entry in self._hosts.itervalues()
+                    if entry.client is not None and not entry.in_use and
+                    entry.last_used < deadline]
+        for entry in idle:
+            self.metrics['evicted'] += 1
+            self._close(entry)
+
+    def close_all(self):
+        with self._lock:
+            entries = self._hosts.values()
+        for entry in entries:
+            self._close(entry)
+
+    def get_metrics(self):
+        """Returns counters of the pool: connected, reused, failed, broken,
+        evicted, waits and current number of open connections and channels.
+        """
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics['connections'] = sum(
+                1 for entry in self._hosts.itervalues()
+                if entry.client is not None)
+            metrics['channels'] = sum(
+                entry.in_use for entry in self._hosts.itervalues())
+        return metrics
+
+    def _get_host(self, host):
+        with self._lock:
+            if self._pid != os.getpid():
+                # connections of the parent process must not be used or closed
+                self._pid = os.getpid()
+                self._hosts = {}
+                self.metrics = defaultdict(int)
+            if host not in self._hosts:
+                self._hosts[host] = self._Host(self.max_channels)
+            return self._hosts[host]
+
+    def _get_client(self, entry, host, timeout):
+        with entry.lock:
+            if entry.client is not None:
+                if self._is_healthy(entry.client):
+                    self.metrics['reused'] += 1
+                    instrumentation.count('ssh')
+                    return entry.client, None
+                self.metrics['broken'] += 1
+                self._close(entry)
+            ssh, error_message = ssh_connect(host, timeout)
+            if error_message:
+                self.metrics['failed'] += 1
+                return ssh, error_message
+            self.metrics['connected'] += 1
+            transport = ssh.get_transport()
+            if self.keepalive and transport is not None:
+                transport.set_keepalive(self.keepalive)
+            entry.client = ssh
+            return ssh, None
+
+    @staticmethod
+    def _is_healthy(client):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    @staticmethod
+    def _close(entry):
+        client, entry.client = entry.client, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+
+ssh_pool = SSHConnectionPool()
+
+
 class RemoteManager(object):
     """
     Set of helper functions for convenient work with remote hosts.
@@ -309,3 +457,139 @@ class RemoteManager(object):
         if exit_status > 0:
             return exit_status, e.read()
         return exit_status, o.read()
+
+
+class PubSubCache(object):
+    """Base class for per-process in-memory caches of rarely changed data
+    loaded from DB.
+    Data is loaded by `load` and served from memory until any instance of
+    `models` is changed. Changes are announced to all processes via redis
+    pub/sub `channel` after commit of the root transaction, every process
+    checks its subscription (without blocking) before using the data.
+    Data is not cached while the current session has uncommitted changes of
+    `models` or if redis is not available.
+    """
+    channel = None
+    models = ()
+
+    _instances = []
+
+    def __init__(self):
+        self._data = None
+        self._pubsub = None
+        self._pid = None
+        self.session_flag = 'changed:' + self.channel
+        self._instances.append(self)
+        for model in self.models:
+            for column in model.__table__.columns:
+                db.event.listen(getattr(model, column.key), 'set',
+                                self._attribute_set)
+
+    def load(self):
+        raise NotImplementedError()
+
+    def get_data(self):
+        self._receive_invalidations()
+        data = self._data
+        if data is None:
+            data = self.load()
+            if (self._pubsub is not None and
+                    not db.session().info.get(self.session_flag)):
+                self._data = data
+        return data
+
+    def invalidate(self):
+        self._data = None
+
+    def mark_changed(self, session=None):
+        """Drops the cached data and announces invalidation to other processes
+        after commit of the session (current one by default).
+        """
+        if session is None:
+            session = db.session()
+        session.info[self.session_flag] = True
+        self.invalidate()
+
+    def publish_invalidation(self):
+        self.invalidate()
+        try:
+            ConnectionPool.get_connection().publish(self.channel, '')
+        except redis.RedisError:
+            current_app.logger.warning(
+                'Failed to publish invalidation of %s', self.channel,
+                exc_info=True)
+
+    @classmethod
+    def invalidate_all(cls):
+        for instance in cls._instances:
+            instance.invalidate()
+
+    def _receive_invalidations(self):
+        if self._pid != os.getpid():
+            # subscription of the parent process can not be used
+            self._pid, self._pubsub, self._data = os.getpid(), None, None
+        try:
+            if self._pubsub is None:
+                pubsub = ConnectionPool.get_connection().pubsub(
+                    ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self._pubsub, self._data = pubsub, None
+            while self._pubsub.get_message() is not None:
+                self._data = None
+        except redis.RedisError:
+            # without notifications cache can not be used
+            current_app.logger.warning(
+                'Failed to receive invalidations of %s', self.channel,
+                exc_info=True)
+            self._pubsub, self._data = None, None
+
+    def _attribute_set(self, target, value, oldvalue, initiator):
+        session = object_session(target)
+        if session is None:
+            self.invalidate()  # will be marked on flush
+        else:
+            self.mark_changed(session)
+
+    def _is_changed_by(self, objects):
+        return any(isinstance(obj, self.models) for obj in objects)
+
+
+def _is_root_transaction(session):
+    # commit/rollback of a savepoint does not finish the whole transaction
+    return session.transaction is None or session.transaction._parent is None
+
+
+@db.event.listens_for(Session, 'after_flush')
+def _mark_changed_caches(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    for cache in PubSubCache._instances:
+        if cache._is_changed_by(changed):
+            cache.mark_changed(session)
+
+
+@db.event.listens_for(Session, 'after_bulk_update')
+@db.event.listens_for(Session, 'after_bulk_delete')
+def _mark_changed_caches_bulk(context):
+    models = tuple(desc['type'] for desc in context.query.column_descriptions
+                   if isinstance(desc['type'], type))
+    for cache in PubSubCache._instances:
+        if any(issubclass(model, cache.models) for model in models):
+            cache.mark_changed(context.session)
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _publish_changed_caches(session):
+    if not _is_root_transaction(session):
+        return
+    for cache in PubSubCache._instances:
+        if session.info.pop(cache.session_flag, False):
+            cache.publish_invalidation()
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _forget_changed_caches(session):
+    for cache in PubSubCache._instances:
+        if session.info.get(cache.session_flag):
+            cache.invalidate()
+            if _is_root_transaction(session):
+                del session.info[cache.session_flag]
@@ -75,6 +75,17 @@ class APIError(Exception):
             self.__class__.__name__, self.message, self.status_code)
 
 
+def api_error_to_dict(error):
+    """Serializes APIError for a part of response, e.g. a per-item result
+    of a batch operation.
+    """
+    return {
+        'data': error.message,
+        'type': getattr(error, 'type', error.__class__.__name__),
+        'details': error.details
+    }
+
+
 class InternalAPIError(APIError):
     """Message of this type is not shown to user, but to admin only."""
     __metaclass__ = ABCMeta
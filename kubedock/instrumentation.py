@@ -0,0 +1,238 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+"""Opt-in per-endpoint instrumentation of API requests.
+
+For every request it measures latency and counts SQL statements, Redis
+commands, kubernetes API calls and SSH sessions made while the request is
+processed. Results are aggregated per endpoint in Redis, so the statistics
+are shared by all worker processes, and may be read with `get_stats`.
+Enabled by INSTRUMENTATION_ENABLED setting.
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict
+
+import redis
+from flask import request, request_started, request_tearing_down
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#: Kinds of counted calls
+COUNTERS = ('sql', 'redis', 'k8s', 'ssh')
+#: Upper bounds of latency histogram buckets, milliseconds
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+KEY_PREFIX = 'kd.instrumentation.'
+ENDPOINTS_KEY = KEY_PREFIX + 'endpoints'
+REPORTS_KEY = KEY_PREFIX + 'reports'
+
+# thread-local (greenlet-local in monkey patched wsgi app) counters of the
+# current request
+_local = threading.local()
+_installed = False
+
+
+def count(kind, n=1):
+    """Counts a call of the given kind made by the current request.
+    Does nothing outside of an instrumented request.
+    """
+    counters = getattr(_local, 'counters', None)
+    if counters is not None:
+        counters[kind] += n
+
+
+def _endpoint_key(endpoint):
+    return KEY_PREFIX + 'endpoint.' + endpoint
+
+
+def _bucket(ms):
+    for bound in LATENCY_BUCKETS:
+        if ms <= bound:
+            return 'le_{0}'.format(bound)
+    return 'le_inf'
+
+
+def _on_request_started(sender, **extra):
+    _local.counters = defaultdict(int)
+    _local.started = time.time()
+
+
+def _on_request_tearing_down(sender, exc=None, **extra):
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        return
+    _local.counters = None
+    elapsed = (time.time() - _local.started) * 1000
+    endpoint = request.endpoint or 'unknown'
+    try:
+        record(endpoint, elapsed, counters, error=exc is not None)
+    except redis.RedisError:
+        sender.logger.warning('Failed to save instrumentation data',
+                              exc_info=True)
+
+
+# Updates all aggregates of a request in one round trip and atomically
+# among workers. KEYS: endpoint hash, set of endpoints; ARGV: endpoint,
+# histogram bucket, elapsed ms, error flag, then pairs of counter name and
+# number of calls.
+_RECORD_SCRIPT = """
+local function update_max(field, value)
+    local current = tonumber(redis.call('hget', KEYS[1], field))
+    if not current or current < value then
+        redis.call('hset', KEYS[1], field, value)
+    end
+end
+redis.call('sadd', KEYS[2], ARGV[1])
+redis.call('hincrby', KEYS[1], 'count', 1)
+redis.call('hincrby', KEYS[1], ARGV[2], 1)
+redis.call('hincrbyfloat', KEYS[1], 'time_sum', ARGV[3])
+update_max('time_max', tonumber(ARGV[3]))
+if ARGV[4] == '1' then
+    redis.call('hincrby', KEYS[1], 'errors', 1)
+end
+for i = 5, #ARGV, 2 do
+    local n = tonumber(ARGV[i + 1])
+    redis.call('hincrby', KEYS[1], ARGV[i] .. '_sum', n)
+    update_max(ARGV[i] .. '_max', n)
+end
+"""
+_record_script = None
+
+
+def record(endpoint, elapsed, counters, error=False):
+    """Adds a measured request to the aggregated statistics of the endpoint.
+
+    :param endpoint: name of the flask endpoint
+    :param elapsed: duration of the request in milliseconds
+    :param counters: dict of call kind -> number of calls
+    :param error: whether request processing failed with an exception
+    """
+    global _record_script
+    from .core import ConnectionPool
+    conn = ConnectionPool.get_connection()
+    if _record_script is None:
+        _record_script = conn.register_script(_RECORD_SCRIPT)
+    args = [endpoint, _bucket(elapsed), elapsed, int(bool(error))]
+    for kind in COUNTERS:
+        args.extend((kind, counters.get(kind, 0)))
+    _record_script(keys=[_endpoint_key(endpoint), ENDPOINTS_KEY], args=args,
+                   client=conn)
+
+
+def get_stats():
+    """Returns aggregated statistics as a dict of endpoint -> stats, where
+    stats contain number of requests, errors, latency histogram (number of
+    requests per upper bound of bucket in ms), average and maximal latency,
+    average and maximal number of calls of every kind per request.
+    """
+    from .core import ConnectionPool
+    conn = ConnectionPool.get_connection()
+    endpoints = sorted(conn.smembers(ENDPOINTS_KEY))
+    pipe = conn.pipeline(transaction=False)
+    for endpoint in endpoints:
+        pipe.hgetall(_endpoint_key(endpoint))
+    stats = {}
+    for endpoint, data in zip(endpoints, pipe.execute()):
+        total = int(data.get('count', 0))
+        if not total:
+            continue
+        histogram = [[bound, int(data.get('le_{0}'.format(bound), 0))]
+                     for bound in LATENCY_BUCKETS]
+        histogram.append(['inf', int(data.get('le_inf', 0))])
+        item = {
+            'count': total,
+            'errors': int(data.get('errors', 0)),
+            'latency': {
+                'avg': float(data.get('time_sum', 0)) / total,
+                'max': float(data.get('time_max', 0)),
+                'histogram': histogram,
+            },
+        }
+        for kind in COUNTERS:
+            item[kind] = {
+                'avg': float(data.get(kind + '_sum', 0)) / total,
+                'max': int(float(data.get(kind + '_max', 0))),
+            }
+        stats[endpoint] = item
+    return stats
+
+
+def get_reports():
+    """Returns the last values passed to `utils.report_metrics` by name."""
+    from .core import ConnectionPool
+    reports = ConnectionPool.get_connection().hgetall(REPORTS_KEY)
+    return {name: json.loads(values) for name, values in reports.iteritems()}
+
+
+def reset():
+    """Drops all aggregated statistics."""
+    from .core import ConnectionPool
+    conn = ConnectionPool.get_connection()
+    endpoints = conn.smembers(ENDPOINTS_KEY)
+    conn.delete(ENDPOINTS_KEY, REPORTS_KEY,
+                *[_endpoint_key(endpoint) for endpoint in endpoints])
+
+
+def metrics_hook(name, values):
+    """Hook for `utils.report_metrics` which saves the last reported values
+    along with requests statistics.
+    """
+    from .core import ConnectionPool
+    ConnectionPool.get_connection().hset(
+        REPORTS_KEY, name, json.dumps(values))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    count('sql')
+
+
+def _install():
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+
+    execute_command = redis.StrictRedis.execute_command
+    pipeline_execute = redis.client.BasePipeline.execute
+
+    def counted_execute_command(self, *args, **options):
+        count('redis')
+        return execute_command(self, *args, **options)
+
+    def counted_pipeline_execute(self, *args, **kwargs):
+        count('redis', len(self.command_stack))
+        return pipeline_execute(self, *args, **kwargs)
+
+    redis.StrictRedis.execute_command = counted_execute_command
+    redis.client.BasePipeline.execute = counted_pipeline_execute
+
+
+def init_app(app):
+    """Enables instrumentation of requests of the app."""
+    from .utils import metrics_hooks
+    _install()
+    request_started.connect(_on_request_started, app)
+    request_tearing_down.connect(_on_request_tearing_down, app)
+    if metrics_hook not in metrics_hooks:
+        metrics_hooks.append(metrics_hook)
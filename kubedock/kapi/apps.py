@@ -37,7 +37,7 @@ from kubedock.kapi.pstorage import STORAGE_CLASS
 from kubedock.predefined_apps.models import \
     PredefinedApp as PredefinedAppModel, PredefinedAppTemplate
 from kubedock.exceptions import NotFound, PermissionDenied, PredefinedAppExc, \
-    APIError
+    APIError, api_error_to_dict
 from kubedock.kapi.podcollection import PodCollection, change_pv_size
 from kubedock.kd_celery import celery
 from kubedock.nodes.models import Node
@@ -46,10 +46,14 @@ from kubedock.settings import KUBE_API_VERSION
 from kubedock.utils import send_event_to_user, atomic
 from kubedock.validation import V, predefined_app_schema
 from kubedock.validation.exceptions import ValidationError
-from kubedock.validation.validators import check_new_pod_data
+from kubedock.validation.validators import check_new_pod_data, \
+    ValidationContext
 from kubedock.rbac import check_permission
 from kubedock.billing import has_billing
 
+#: Max number of pods created by one call of `start_pods_from_yaml`
+MAX_YAML_BATCH_PODS = 50
+
 FIELD_PARSER = re.compile(ur"""
     \$(?:
         (?P<name>[\w\-]+)
@@ -133,6 +137,7 @@ class PredefinedApp(object):
         self._used_entities = {}
         self._used_entities_by_plans = {}
         self._filled_templates = {}
+        self._matchers = {}
 
     @classmethod
     def all(cls, as_dict=False):
@@ -316,90 +321,78 @@ class PredefinedApp(object):
         self._get_filled_template_for_plan(plan_id)
         return self._used_entities_by_plans[plan_id]
 
-    def is_template_for(self, derived):
+    def is_template_for(self, derived, fingerprint=None):
         """
-        Fills own template objects and compares it to already filled template
+        Compares already filled template to own template objects filled
+        with the same package
         :param derived: dict -> template to be compared
+        :param fingerprint: tuple -> precomputed fingerprint of derived
+            template (see TemplateMatcher.get_fingerprint) or None
         :return: bool
         """
-        loaded = self._get_loaded_template()
-        derived = deepcopy(derived)
-
-        kuberdock = derived.get('kuberdock')
-        kuberdock.pop('kuberdock_template_id', None)
-
+        kuberdock = (derived.get('kuberdock')
+                     if isinstance(derived, Mapping) else None)
         if (not isinstance(kuberdock, Mapping) or
                 not isinstance(kuberdock.get('appPackage'), Mapping)):
             return False
-        packages_by_name = dict((pkg['name'], pkg) for
-                                pkg in loaded['kuberdock']['appPackages'])
-        package = kuberdock.get('appPackage')
-        package = packages_by_name.get(package.get('name'))
-        if package is None:
+        matcher = self._get_template_matcher(
+            kuberdock['appPackage'].get('name'))
+        if matcher is None:
             return False
-        self._apply_package(loaded, package)
+        if fingerprint is None:
+            fingerprint = self.TemplateMatcher.get_fingerprint(derived)
+        if not matcher.accepts(fingerprint):
+            return False
+
+        if 'kuberdock_template_id' in kuberdock:
+            kuberdock = dict(kuberdock)
+            del kuberdock['kuberdock_template_id']
+            derived = dict(derived, kuberdock=kuberdock)
 
         if derived.get('appVariables'):
-            # we can just fill teplate with provided values
-            values = derived.get('appVariables')
-            filled = self._fill_template(loaded, values=values)
-            stack = [(filled, derived)]
-            while stack:
-                left, right = stack.pop()
-                if left == right:
-                    continue
-                elif all(isinstance(i, Mapping) for i in (left, right)):
-                    for key, val in left.items():
-                        if key not in right:
-                            return False
-                        stack.append((val, right.pop(key)))
-                    if right:
-                        return False
-                elif all(isinstance(i, basestring) for i in (left, right)):
-                    if not re.match(re.escape(left).replace(
-                            '\\%USER\\_DOMAIN\\%', '.*'), right):
-                        return False
-                elif all(isinstance(i, Sequence) for i in (left, right)):
-                    if len(left) != len(right):
-                        return False
-                    stack.extend(zip(left, right))
-                else:
-                    return False
-            return True
+            # we can just fill template with provided values
+            return matcher.match_filled(derived, derived['appVariables'])
+        return matcher.match(derived)
 
-        entities_set = set(self._entities.values())
-        any_entity_regex = re.compile('(?:\\%USER\\_DOMAIN\\%|{0})'.format(
-            '|'.join(entity.uid for entity in entities_set)))
-        stack = [(loaded, derived)]
-        while stack:
-            left, right = stack.pop()
-            if left == right:
+    @classmethod
+    def find_template_for(cls, derived, apps=None):
+        """
+        Finds predefined app which could be used to create filled template
+        :param derived: dict -> filled template
+        :param apps: list -> PA objects to look through. It's better to
+            reuse the same list for many lookups, because every PA object
+            keeps its compiled matchers. All apps are used if None.
+        :return: PA object or None
+        """
+        if apps is None:
+            apps = cls.all()
+        fingerprint = cls.TemplateMatcher.get_fingerprint(derived)
+        for app in apps:
+            try:
+                if app.is_template_for(derived, fingerprint):
+                    return app
+            except (PredefinedAppExc.InvalidTemplate,
+                    PredefinedAppExc.UnparseableTemplate):
                 continue
-            elif all(isinstance(i, Mapping) for i in (left, right)):
-                for key, val in left.items():
-                    if key not in right:
-                        return False
-                    stack.append((val, right.pop(key)))
-                if right:
-                    return False
-            elif all(isinstance(i, basestring) for i in (left, right)):
-                if not re.match(
-                        any_entity_regex.sub('.*', re.escape(left)),
-                        right):
-                    return False
-            elif all(isinstance(i, Sequence) for i in (left, right)):  # list
-                if len(left) != len(right):
-                    return False
-                stack.extend(zip(left, right))
-            elif (left in entities_set and
-                  isinstance(right, (Number, basestring, NoneType))):
-                if not hasattr(left, 'value'):
-                    left.value = right
-                elif left.value != right:
-                    return False
-            else:
-                return False
-        return True
+
+    def _get_template_matcher(self, package_name):
+        """
+        Returns compiled matcher of own template with applied package
+        :param package_name: string -> name of the plan
+        :return: obj -> TemplateMatcher or None if there is no such plan
+        """
+        if package_name in self._matchers:
+            return self._matchers[package_name]
+        loaded = deepcopy(self._get_loaded_template())
+        packages_by_name = dict((pkg['name'], pkg) for
+                                pkg in loaded['kuberdock']['appPackages'])
+        package = packages_by_name.get(package_name)
+        matcher = None
+        if package is not None:
+            matcher = self.TemplateMatcher(
+                self, self._apply_package(loaded, package))
+        self._matchers[package_name] = matcher
+        return matcher
 
     def set_package(self, package_id):
         """
@@ -1223,6 +1216,210 @@ class PredefinedApp(object):
                 return True
             return value
 
+    class TemplateMatcher(object):
+        """
+        Template with applied package compiled once for matching against
+        filled templates. Every string leaf keeps its own compiled pattern,
+        so each match is a single walk without copying or regex compilation.
+        """
+        USER_DOMAIN = '%USER_DOMAIN%'
+
+        def __init__(self, app, applied):
+            """
+            :param app: obj -> PA object the template belongs to
+            :param applied: dict -> loaded template with applied package
+            """
+            self.app = app
+            self.applied = applied
+            self._tokens = re.compile('|'.join(
+                [re.escape(self.USER_DOMAIN)] +
+                [re.escape(uid) for uid in app._entities_by_uid]))
+            self._domain_patterns = {}
+            self.fingerprint = self._get_own_fingerprint()
+            self.root = self._compile(applied)
+
+        @classmethod
+        def get_fingerprint(cls, doc):
+            """
+            Cheap structural summary of a template: top level and spec keys,
+            containers and volumes amounts. Filled templates always share it
+            with the template they were created from.
+            :param doc: dict -> filled or loaded template
+            :return: tuple or None if there is no structure to compare
+            """
+            if not isinstance(doc, Mapping):
+                return None
+            spec = doc.get('spec')
+            if isinstance(spec, Mapping) and 'template' in spec:
+                template = spec['template']
+                if not isinstance(template, Mapping):
+                    return None
+                spec = template.get('spec')
+            keys = cls._get_shape(doc) - {'appVariables'}
+            if not isinstance(spec, Mapping):
+                return keys, None, None, None
+            return (keys,
+                    cls._get_shape(spec),
+                    cls._get_shape(spec.get('containers')),
+                    cls._get_shape(spec.get('volumes')))
+
+        def accepts(self, fingerprint):
+            """
+            Fast check rejecting templates of a different structure
+            :param fingerprint: tuple -> see get_fingerprint
+            :return: bool -> False if template can't match for sure
+            """
+            if self.fingerprint is None or fingerprint is None:
+                return True
+            return all(own is None or own == other for own, other in
+                       zip(self.fingerprint, fingerprint))
+
+        def match(self, derived):
+            """
+            Matches template without appVariables. Any entity matches any
+            scalar value, but all occurrences of the entity must be equal.
+            :param derived: dict -> filled template
+            :return: bool
+            """
+            bound = {}
+            stack = [(self.root, derived)]
+            while stack:
+                (kind, left, pattern), right = stack.pop()
+                if kind == 'mapping':
+                    if not isinstance(right, Mapping) or \
+                            len(left) != len(right):
+                        return False
+                    for key, val in left.iteritems():
+                        if key not in right:
+                            return False
+                        stack.append((val, right[key]))
+                elif kind == 'sequence':
+                    if not self._is_sequence(right) or \
+                            len(left) != len(right):
+                        return False
+                    stack.extend(zip(left, right))
+                elif kind == 'string':
+                    if left == right:
+                        continue
+                    if not isinstance(right, basestring):
+                        return False
+                    if pattern is None:
+                        if not right.startswith(left):
+                            return False
+                    elif not pattern.match(right):
+                        return False
+                elif kind == 'entity':
+                    if not isinstance(right, (Number, basestring, NoneType)):
+                        return False
+                    if bound.setdefault(left, right) != right:
+                        return False
+                elif left != right:
+                    return False
+            return True
+
+        def match_filled(self, derived, values):
+            """
+            Fills template with provided values and compares it to filled one
+            :param derived: dict -> filled template
+            :param values: dict -> values of template entities
+            :return: bool
+            """
+            filled = self.app._fill_template(
+                loaded=self.applied, used_entities={}, values=values)
+            stack = [(filled, derived)]
+            while stack:
+                left, right = stack.pop()
+                if left == right:
+                    continue
+                elif isinstance(left, Mapping):
+                    if not isinstance(right, Mapping) or \
+                            len(left) != len(right):
+                        return False
+                    for key, val in left.iteritems():
+                        if key not in right:
+                            return False
+                        stack.append((val, right[key]))
+                elif isinstance(left, basestring):
+                    if not isinstance(right, basestring) or \
+                            not self._match_filled_string(left, right):
+                        return False
+                elif self._is_sequence(left):
+                    if not self._is_sequence(right) or \
+                            len(left) != len(right):
+                        return False
+                    stack.extend(zip(left, right))
+                else:
+                    return False
+            return True
+
+        def _compile(self, node):
+            """
+            Converts loaded template to the tree of (kind, value, pattern)
+            :param node: loaded template or its part
+            :return: tuple
+            """
+            if isinstance(node, PredefinedApp.TemplateField):
+                return 'entity', node.name, None
+            if isinstance(node, basestring):
+                if self._tokens.search(node) is None:
+                    return 'string', node, None
+                return 'string', node, re.compile('.*'.join(
+                    re.escape(part) for part in self._tokens.split(node)))
+            if isinstance(node, Mapping):
+                return 'mapping', dict((key, self._compile(val))
+                                       for key, val in node.iteritems()), None
+            if self._is_sequence(node):
+                return 'sequence', [self._compile(i) for i in node], None
+            return 'value', node, None
+
+        def _get_own_fingerprint(self):
+            """
+            Fingerprint of own template. Keys with entities are filled with
+            values, so such parts can't be compared and are set to None.
+            :return: tuple or None
+            """
+            fingerprint = self.get_fingerprint(self.applied)
+            if fingerprint is None:
+                return None
+            return tuple(
+                None if isinstance(shape, frozenset) and any(
+                    not isinstance(key, basestring) or self._tokens.search(key)
+                    for key in shape) else shape
+                for shape in fingerprint)
+
+        def _match_filled_string(self, left, right):
+            """
+            Compares strings of filled templates. Only user domain may differ.
+            :param left: string -> string of own filled template
+            :param right: string -> string to be compared
+            :return: bool
+            """
+            if self.USER_DOMAIN not in left:
+                return right.startswith(left)
+            pattern = self._domain_patterns.get(left)
+            if pattern is None:
+                pattern = re.compile('.*'.join(
+                    re.escape(part) for part in left.split(self.USER_DOMAIN)))
+                self._domain_patterns[left] = pattern
+            return pattern.match(right) is not None
+
+        @staticmethod
+        def _get_shape(node):
+            """
+            Structural shape of a template node
+            :return: frozenset of keys for mappings, length for lists or None
+            """
+            if isinstance(node, Mapping):
+                return frozenset(node)
+            if PredefinedApp.TemplateMatcher._is_sequence(node):
+                return len(node)
+            return None
+
+        @staticmethod
+        def _is_sequence(node):
+            return (isinstance(node, Sequence) and
+                    not isinstance(node, basestring))
+
 
 class AppInstance(object):
     """Object that handles all predefined app instance related routines"""
@@ -1354,18 +1551,88 @@ def start_pod_from_yaml(pod_data, user=None, template_id=None, dry_run=False):
     new_pod = dispatch_kind(pod_data, template_id)
     new_pod = check_new_pod_data(new_pod, user)
 
-    if template_id is None and user and user.role.rolename == 'LimitedUser':
+    if template_id is None:
+        _check_filled_template(new_pod, pod_data, user)
+
+    return PodCollection(user).add(new_pod, dry_run=dry_run)
+
+
+def start_pods_from_yaml(docs, user):
+    """Creates many pods from yaml documents at once.
+
+    Documents are split into pods by `split_pod_documents`. All pods are
+    validated before any pod is created, then valid pods are created by
+    `PodCollection.add_batch`. An invalid or failed pod does not prevent
+    creation of the others.
+
+    :param docs: list of parsed yaml documents
+    :param user: owner of pods
+    :returns: list of results in the same order as pods in docs. Every
+        result is a dict with created pod's data in 'pod' or error
+        description in 'error'.
+    """
+    groups = split_pod_documents(docs)
+    if not groups:
+        raise ValidationError('No objects found in data')
+    if len(groups) > MAX_YAML_BATCH_PODS:
+        raise ValidationError('Too many pods in one request, max is {0}'
+                              .format(MAX_YAML_BATCH_PODS))
+
+    context = ValidationContext(user.username)
+    results = [None] * len(groups)
+    new_pods = []
+    for i, group in enumerate(groups):
+        try:
+            new_pod = check_new_pod_data(dispatch_kind(group), user,
+                                         context=context)
+            _check_filled_template(new_pod, group, user)
+        except APIError as e:
+            results[i] = {'error': api_error_to_dict(e)}
+        else:
+            new_pods.append((i, new_pod))
+
+    created = PodCollection(user).add_batch(
+        [pod_data for i, pod_data in new_pods])
+    for (i, new_pod), (pod, error) in zip(new_pods, created):
+        results[i] = ({'pod': pod} if error is None
+                      else {'error': api_error_to_dict(error)})
+    return results
+
+
+def split_pod_documents(docs):
+    """Splits yaml documents of many pods into lists of documents of one
+    pod, as expected by `dispatch_kind`. Every Pod or ReplicationController
+    starts a new pod, Service belongs to the pod it is placed next to.
+    Empty documents are skipped.
+    """
+    groups = []
+    group, has_pod = [], False
+    for doc in docs:
+        if doc is None:
+            continue
+        is_pod = isinstance(doc, dict) and \
+            doc.get('kind') in ('Pod', 'ReplicationController')
+        if is_pod and has_pod:
+            groups.append(group)
+            group, has_pod = [], False
+        group.append(doc)
+        has_pod = has_pod or is_pod
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _check_filled_template(new_pod, docs, user):
+    if user and user.role.rolename == 'LimitedUser':
         # legacy check that filled yaml is created from template
         # TODO: remove after AC-4516
         template_id = new_pod.get('kuberdock_template_id')
         if template_id is None:
             raise PredefinedAppExc.NotPredefinedAppPod
         pa = PredefinedApp.get(template_id)
-        if not pa.is_template_for(pod_data[0]):
+        if not pa.is_template_for(docs[0]):
             raise PredefinedAppExc.NotPredefinedAppPod
 
-    return PodCollection(user).add(new_pod, dry_run=dry_run)
-
 
 def dispatch_kind(docs, template_id=None):
     if not docs or not docs[0]:  # at least one needed
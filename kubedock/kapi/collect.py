@@ -23,15 +23,19 @@ Module collect to gather and send usage case info back to developers
 """
 
 import json
+import pipes
+import socket
 import subprocess
 from collections import Counter
 from itertools import izip
+from multiprocessing.pool import ThreadPool
 
 import ipaddress
 import requests
 from flask import current_app
+from paramiko import SSHException
 
-from kubedock.core import db, ssh_connect, ConnectionPool
+from kubedock.core import db, ssh_pool, ConnectionPool
 from kubedock.kapi import licensing
 from kubedock.utils import get_version, NODE_STATUSES
 from kubedock.kapi.users import UserCollection
@@ -73,95 +77,172 @@ def fetch_nodes():
     return [{'_ip': node.ip} for node in Node.get_all()]
 
 
+#: Commands to get facts about a node. They are run on the node at once by
+#: NODE_FACTS_SCRIPT, which prints {fact: [exit code, output]} as JSON.
+NODE_FACTS_COMMANDS = {
+    'cores': 'nproc --all',
+    'kernel': 'uname -r',
+    'cpu': 'top -b -n1|grep "^%Cpu(s):"',
+    'memory': 'free -b',
+    'containers_running': 'docker ps --format "{{.ID}}"|wc -l',
+    'containers_total': 'docker ps -a --format "{{.ID}}"|wc -l',
+    # Use format to prevent table headers in docker ps output;
+    # exclude kuberdock service containers and kubernetes service containers
+    'user_containers_running': (
+        'docker ps --format "{{.ID}} {{.Image}}"|'
+        'grep -v -E "^\w+[[:space:]]+(kuberdock/(elasticsearch|fluentd)|'
+        'gcr.io/google_containers/)"|'
+        'wc -l'),
+    'pods': (
+        '''docker ps --format '{{.Label "io.kubernetes.pod.name"}}'|'''
+        '''uniq|wc -l'''),
+    'docker': 'rpm -q --qf "%{VERSION}-%{RELEASE}" docker',
+    'la': 'cat /proc/loadavg',
+}
+
+NODE_FACTS_SCRIPT = """
+import json, os, subprocess
+facts = {}
+with open(os.devnull, 'w') as devnull:
+    for key, cmd in json.loads(%r).items():
+        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                             stderr=devnull)
+        output = p.communicate()[0]
+        facts[key] = [p.returncode, output]
+print(json.dumps(facts))
+"""
+
+#: Timeout of gathering facts on a node, seconds
+NODE_FACTS_TIMEOUT = 60
+
+#: Max number of nodes processed at the same time
+NODES_CONCURRENCY = 20
+
+
 def extend_nodes(nodes):
     """
-    For every node in list make cadvisor request to get additional info
+    For every node in list make cadvisor request and run one script via ssh
+    to get additional info. All nodes are processed concurrently.
     :param nodes: list --> list of nodes
     """
+    if not nodes:
+        return nodes
+    pool = ThreadPool(min(len(nodes), NODES_CONCURRENCY))
+    try:
+        # Warnings are logged here, because there is no app context in
+        # worker threads
+        for warnings in pool.map(extend_node, nodes):
+            for warning in warnings:
+                current_app.logger.warning(warning)
+    finally:
+        pool.close()
+    return nodes
+
+
+def extend_node(node):
+    """
+    Add cadvisor and ssh info to node data.
+    :param node: dict --> node data with '_ip' key, which is removed
+    :return: list of warnings
+    """
     fmt = 'http://{0}:4194/api/v1.3/machine'
     cadvisor_key_map = {
         'filesystems': 'disks',
         'cpu_frequency_khz': 'clock',
         'machine_id': 'node-id'
     }
+    warnings = []
 
-    for node in nodes:
-        _ip = node.pop('_ip')
-        try:
-            r = requests.get(fmt.format(_ip))
-        except (requests.exceptions.ConnectionError, AttributeError) as e:
-            current_app.logger.warning(repr(e))
-        else:
-            if r.status_code != 200:
-                continue
+    _ip = node.pop('_ip')
+    try:
+        r = requests.get(fmt.format(_ip))
+    except (requests.exceptions.ConnectionError, AttributeError) as e:
+        warnings.append(repr(e))
+    else:
+        if r.status_code != 200:
+            return warnings
 
-            data = r.json()
-            for cadvkey, nodekey in cadvisor_key_map.iteritems():
-                node[nodekey] = data.get(cadvkey)
-            node['nics'] = len(data.get('network_devices', []))
+        data = r.json()
+        for cadvkey, nodekey in cadvisor_key_map.iteritems():
+            node[nodekey] = data.get(cadvkey)
+        node['nics'] = len(data.get('network_devices', []))
 
-        ssh, error_message = ssh_connect(_ip)
+    try:
+        facts = get_node_facts(_ip)
+    except (SSHException, socket.error, EOFError, ValueError) as e:
+        warnings.append(
+            'Cannot get facts of node {0}: {1!r}'.format(_ip, e))
+        return warnings
+    if facts is None:
+        return warnings
+
+    node['cores'] = get_node_cores_number(facts)
+    node['kernel'] = get_node_kernel_version(facts)
+    node['cpu'] = get_node_cpu_usage(facts)
+    extend_node_memory_info(facts, node)
+    node['containers'] = get_node_container_counts(facts)
+    node['pods'] = get_node_pods_count(facts)
+    node['user_containers'] = get_node_user_containers_counts(facts)
+    node['docker'] = get_node_package_version(facts)
+    node['la'] = get_node_load_avg(facts)
+    return warnings
+
+
+def get_node_facts(host):
+    """
+    Run NODE_FACTS_SCRIPT on the node.
+    :return: dict {fact: (exit code, output)} or None if node is unreachable
+    """
+    script = NODE_FACTS_SCRIPT % json.dumps(NODE_FACTS_COMMANDS)
+    with ssh_pool.connect(host) as (ssh, error_message):
         if error_message:
-            continue
+            return None
+        _, o, _ = ssh.exec_command('python2 -c ' + pipes.quote(script),
+                                   timeout=NODE_FACTS_TIMEOUT)
+        output = o.read()
+        if o.channel.recv_exit_status() != 0:
+            return None
+    return json.loads(output)
 
-        node['cores'] = get_node_cores_number(ssh)
-        node['kernel'] = get_node_kernel_version(ssh)
-        node['cpu'] = get_node_cpu_usage(ssh)
-        extend_node_memory_info(ssh, node)
-        node['containers'] = get_node_container_counts(ssh)
-        node['pods'] = get_node_pods_count(ssh)
-        node['user_containers'] = get_node_user_containers_counts(ssh)
-        node['docker'] = get_node_package_version(ssh, 'docker')
-        node['la'] = get_node_load_avg(ssh)
-    return nodes
 
+def _get_fact(facts, key):
+    """Output of the command of fact or None if the command failed."""
+    code, output = facts.get(key, (None, None))
+    return output if code == 0 else None
 
-def get_node_cores_number(ssh):
-    _, o, _ = ssh.exec_command(
-        'nproc --all'
-    )
-    res = 0
-    if o.channel.recv_exit_status() == 0:
-        try:
-            res = int(o.read())
-        except:
-            pass
-    return res
 
+def _get_int_fact(facts, key, default=None):
+    try:
+        return int(_get_fact(facts, key))
+    except (TypeError, ValueError):
+        return default
 
-def get_node_package_version(ssh, package):
-    _, o, _ = ssh.exec_command(
-        'rpm -q --qf "%{VERSION}-%{RELEASE}" ' + package
-    )
-    res = 'unknown'
-    if o.channel.recv_exit_status() == 0:
-        res = o.read()
-    return res
 
+def get_node_cores_number(facts):
+    return _get_int_fact(facts, 'cores', 0)
 
-def get_node_load_avg(ssh):
-    _, o, _ = ssh.exec_command(
-        'cat /proc/loadavg'
-    )
-    res = []
-    if o.channel.recv_exit_status() == 0:
-        res = [float(item) for item in o.read().split()[:3]]
-    return res
 
+def get_node_package_version(facts, package='docker'):
+    res = _get_fact(facts, package)
+    return 'unknown' if res is None else res
 
-def get_node_kernel_version(ssh):
-    _, o, _ = ssh.exec_command('uname -r')
-    res = 'unknown'
-    if o.channel.recv_exit_status() == 0:
-        res = o.read().strip('\n')
-    return res
+
+def get_node_load_avg(facts):
+    res = _get_fact(facts, 'la')
+    if res is None:
+        return []
+    return [float(item) for item in res.split()[:3]]
+
+
+def get_node_kernel_version(facts):
+    res = _get_fact(facts, 'kernel')
+    return 'unknown' if res is None else res.strip('\n')
 
 
-def get_node_cpu_usage(ssh):
-    _, o, _ = ssh.exec_command('top -b -n1|grep "^%Cpu(s):"')
+def get_node_cpu_usage(facts):
+    top_out = _get_fact(facts, 'cpu')
     res = {}
-    if o.channel.recv_exit_status() == 0:
-        top_out = o.read()
+    if top_out is not None:
         parts = top_out.replace('%Cpu(s):', '').strip().split(', ')
         for part in parts:
             try:
@@ -172,14 +253,14 @@ def get_node_cpu_usage(ssh):
     return res
 
 
-def extend_node_memory_info(ssh, node):
-    _, o, _ = ssh.exec_command('free -b')
-    if o.channel.recv_exit_status() != 0:
+def extend_node_memory_info(facts, node):
+    out = _get_fact(facts, 'memory')
+    if out is None:
         return
     keyline = 0
     memline = 1
     swapline = 2
-    lines = o.read().split('\n')
+    lines = out.split('\n')
     # '             total        used        free      shared ...'
     keys = lines[keyline].strip().split()
     # Mem:     1930043392   806088704   264581120   119083008 ...
@@ -189,56 +270,30 @@ def extend_node_memory_info(ssh, node):
     node['swap'] = dict(izip(keys, swap))
 
 
-def get_node_container_counts(ssh):
+def get_node_container_counts(facts):
     counters = {}
-    _, o, _ = ssh.exec_command('docker ps --format "{{.ID}}"|wc -l')
-    if o.channel.recv_exit_status() == 0:
-        try:
-            counters[NODE_STATUSES.running] = int(o.read())
-        except:
-            pass
-    _, o, _ = ssh.exec_command('docker ps -a --format "{{.ID}}"|wc -l')
-    if o.channel.recv_exit_status() == 0:
-        try:
-            counters['total'] = int(o.read())
-        except:
-            pass
+    running = _get_int_fact(facts, 'containers_running')
+    if running is not None:
+        counters[NODE_STATUSES.running] = running
+    total = _get_int_fact(facts, 'containers_total')
+    if total is not None:
+        counters['total'] = total
     return counters
 
 
-def get_node_user_containers_counts(ssh):
+def get_node_user_containers_counts(facts):
     """Counts only running containers which belong to a user (not system or
     internal kuberdock user)
     """
     counters = {}
-    # Use format to prevent table headers in docker ps output;
-    # exclude kuberdock service containers and kubernetes service containers
-    _, o, _ = ssh.exec_command(
-        'docker ps --format "{{.ID}} {{.Image}}"|'
-        'grep -v -E "^\w+[[:space:]]+(kuberdock/(elasticsearch|fluentd)|'
-        'gcr.io/google_containers/)"|'
-        'wc -l'
-    )
-    if o.channel.recv_exit_status() == 0:
-        try:
-            counters[NODE_STATUSES.running] = int(o.read())
-        except:
-            pass
+    running = _get_int_fact(facts, 'user_containers_running')
+    if running is not None:
+        counters[NODE_STATUSES.running] = running
     return counters
 
 
-def get_node_pods_count(ssh):
-    res = 0
-    _, o, _ = ssh.exec_command(
-        '''docker ps --format '{{.Label "io.kubernetes.pod.name"}}'|'''
-        '''uniq|wc -l'''
-    )
-    if o.channel.recv_exit_status() == 0:
-        try:
-            res = int(o.read())
-        except:
-            pass
-    return res
+def get_node_pods_count(facts):
+    return _get_int_fact(facts, 'pods', 0)
 
 
 def get_storage():
@@ -26,13 +26,14 @@ import string
 
 import requests
 
+from .. import instrumentation
 from .. import settings
 from .. import utils
 from kubedock.kapi.podutils import raise_if_failure
+from . import service_informer
 from ..core import db
 from ..exceptions import APIError
 from ..pods.models import Pod
-from ..users.models import User
 from ..utils import POD_STATUSES
 
 
@@ -133,6 +134,7 @@ class KubeQuery(object):
             'del': requests.delete,
             'patch': requests.patch,
         }
+        instrumentation.count('k8s')
         try:
             req = dispatcher.get(act, requests.get)(self._make_url(res, ns),
                                                     **args)
@@ -143,8 +145,10 @@ class KubeQuery(object):
 
 KUBERDOCK_POD_UID = 'kuberdock-pod-uid'
 KUBERDOCK_TYPE = 'kuberdock-type'
+KUBERDOCK_USER_UID = service_informer.OWNER_LABEL
 LABEL_SELECTOR_TYPE = KUBERDOCK_TYPE + '={}'
 LABEL_SELECTOR_PODS = KUBERDOCK_POD_UID + ' in ({})'
+LABEL_SELECTOR_USER = KUBERDOCK_USER_UID + '={}'
 SERVICES = 'services'
 
 
@@ -188,11 +192,14 @@ class Services(object):
     def delete(self, name, namespace):
         return self.kq.delete([SERVICES, name], ns=namespace)
 
-    def get_template(self, pod_id, ports, annotations=None):
+    def get_template(self, pod_id, ports, annotations=None, owner_id=None):
         if not all((pod_id, ports)):
             raise ValueError('Pod id and ports must be specified')
         template = copy.deepcopy(self.template)
         template['metadata']['labels']['kuberdock-pod-uid'] = pod_id
+        if owner_id is not None:
+            template['metadata']['labels'][KUBERDOCK_USER_UID] = \
+                str(owner_id)
         if self.svc_type:
             template['metadata']['labels'][KUBERDOCK_TYPE] = self.svc_type
         template['spec']['selector']['kuberdock-pod-uid'] = pod_id
@@ -271,13 +278,21 @@ class Services(object):
         return {s['metadata']['labels'][KUBERDOCK_POD_UID]: s for s in svc}
 
     def get_by_user(self, user_id):
-        """Return all service of selected type, owned by user
+        """Return all service of selected type, owned by user.
+        Services are taken from the cache of services watch listener if it
+        is current, otherwise they are selected by owner label.
         Args:
-            user_id (str): id of user
+            user_id (int, str): id of user
         """
-        user = User.get(user_id)
-        pods = [pod['id'] for pod in user.pods_to_dict()]
-        return self.get_by_pods(pods)
+        svc = service_informer.informer.get_by_owner(user_id)
+        if svc is None:
+            svc = self.get_by_type(LABEL_SELECTOR_USER.format(user_id))
+        elif self.svc_type:
+            svc = [s for s in svc
+                   if s['metadata']['labels'].get(KUBERDOCK_TYPE) ==
+                   self.svc_type]
+        # TODO: pod can have several services, we need list as value
+        return {s['metadata']['labels'][KUBERDOCK_POD_UID]: s for s in svc}
 
 
 LOCAL_SVC_TYPE = 'local'
@@ -288,8 +303,9 @@ class LocalService(Services):
     def __init__(self):
         super(LocalService, self).__init__(LOCAL_SVC_TYPE)
 
-    def get_template(self, pod_id, ports, resolve=None):
-        template = super(LocalService, self).get_template(pod_id, ports)
+    def get_template(self, pod_id, ports, resolve=None, owner_id=None):
+        template = super(LocalService, self).get_template(
+            pod_id, ports, owner_id=owner_id)
         template['metadata']['labels']['name'] = pod_id[:54] + '-service'
         if resolve:
             annotations = template['metadata'].setdefault('annotations', {})
@@ -443,6 +459,12 @@ class K8sSecretsClient(object):
     def list(self, namespace):
         return self._run('get', ['secrets'], namespace=namespace)
 
+    def list_all(self):
+        """List secrets of SECRET_TYPE in all namespaces."""
+        resp = self.k8s_query.get(
+            ['secrets'], {'fieldSelector': 'type=' + self.SECRET_TYPE})
+        return self._process_response(resp)
+
     def update(self, name, data, namespace):
         secret = self._build_secret(name, data, namespace)
         return self._run('put', ['secrets', name], secret, namespace=namespace,
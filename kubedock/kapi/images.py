@@ -29,6 +29,9 @@ from urlparse import urlparse, parse_qsl, urlsplit
 
 import re
 import requests
+from flask import current_app
+from functools import partial
+from multiprocessing.pool import ThreadPool
 from ..core import db
 from ..exceptions import APIError
 from ..pods.models import DockerfileCache, PrivateRegistryFailedLogin
@@ -54,6 +57,10 @@ REQUEST_TIMEOUT = 15.0
 #: Timeout for ping requests to registries in seconds
 PING_REQUEST_TIMEOUT = 5.0
 
+#: Max number of images checked at the same time by
+#: `Image.check_containers_batch`
+CHECK_CONCURRENCY = 8
+
 
 class ImageNotAvailable(APIError):
     message_template = 'Image "{image}" is not available'
@@ -613,18 +620,98 @@ class Image(namedtuple('Image', ['full_registry', 'registry', 'repo', 'tag'])):
             Each secret must be iterable (username, password, registry)
         :raises APIError: if some image is not available
         """
+        registries = cls._get_registries(secrets)
+        for container in containers:
+            image = cls(container['image'])
+            if cls._needs_command_check(container):
+                image_data = image._check_availability(registries, fast=False)
+                cls._check_command(image, container, image_data)
+            else:
+                image._check_availability(registries)
+
+    @classmethod
+    def check_containers_batch(cls, items, concurrency=CHECK_CONCURRENCY):
+        """Same as `check_containers`, but for containers of many pods.
+        Every image is checked once per set of credentials and checks are
+        made concurrently.
+
+        :param items: list of tuples (containers, secrets)
+        :param concurrency: max number of images checked at the same time
+        :returns: list of errors (APIError or None) in order of items
+        """
+        checks = set()
+        for containers, secrets in items:
+            for container in containers:
+                checks.add(cls._get_check_key(container, secrets))
+        checks = sorted(checks)
+        results = {}
+        if checks:
+            pool = ThreadPool(min(len(checks), concurrency))
+            try:
+                results = dict(zip(checks, pool.map(
+                    partial(_check_image_in_app_context,
+                            current_app._get_current_object()),
+                    checks)))
+            finally:
+                pool.close()
+
+        errors = []
+        for containers, secrets in items:
+            error = None
+            for container in containers:
+                result = results[cls._get_check_key(container, secrets)]
+                if isinstance(result, APIError):
+                    error = result
+                    break
+                if cls._needs_command_check(container):
+                    try:
+                        cls._check_command(cls(container['image']),
+                                           container, result)
+                    except APIError as e:
+                        error = e
+                        break
+            errors.append(error)
+        return errors
+
+    @staticmethod
+    def _get_registries(secrets):
         registries = defaultdict(lambda: {'v2_available': True,
                                           'auth': [None]})
         for username, password, registry in secrets:
             registry = complement_registry(registry)
             registries[registry]['auth'].append((username, password))
+        return registries
 
-        for container in containers:
-            image = cls(container['image'])
-            if not (container.get('args') or container.get('command')):
-                # need extra check: image must have CMD or ENTRYPOINT
-                image_data = image._check_availability(registries, fast=False)
-                if not (image_data.get('Cmd') or image_data.get('Entrypoint')):
-                    raise CommandIsMissing(image, container['name'])
-            else:
-                image._check_availability(registries)
+    @staticmethod
+    def _needs_command_check(container):
+        # need extra check: image must have CMD or ENTRYPOINT
+        return not (container.get('args') or container.get('command'))
+
+    @staticmethod
+    def _check_command(image, container, image_data):
+        if not (image_data.get('Cmd') or image_data.get('Entrypoint')):
+            raise CommandIsMissing(image, container['name'])
+
+    @classmethod
+    def _get_check_key(cls, container, secrets):
+        return (container['image'], cls._needs_command_check(container),
+                tuple(sorted(tuple(s) for s in secrets)))
+
+
+def _check_image_in_app_context(app, key):
+    """Checks availability of an image for `Image.check_containers_batch`.
+
+    :returns: image config if it is needed, True or error (APIError)
+    """
+    image, full_check, secrets = key
+    with app.app_context():
+        try:
+            return Image(image)._check_availability(
+                Image._get_registries(secrets), fast=not full_check)
+        except APIError as e:
+            return e
+        except Exception:
+            current_app.logger.exception('Failed to check image "%s"', image)
+            return ImageNotAvailable(image)
+        finally:
+            db.session.remove()
@@ -168,6 +168,18 @@ class IngressResourceClient(object):
                                resource.json_config, ns=resource.namespace)
         self._process_response(response)
 
+    def create_if_absent(self, resource):
+        """Creates the resource unless a resource with the same name exists.
+        Takes one request instead of checking existence first.
+
+        :return: True if the resource has been created
+        """
+        try:
+            self.create(resource)
+        except IngressResourceAlreadyExists:
+            return False
+        return True
+
     def update_or_create(self, resource):
         try:
             r = self.kq.post(['ingresses'], resource.json_config, rest=True,
@@ -191,7 +203,8 @@ class IngressResourceClient(object):
 
 def create_ingress_http(namespace, service, domain, custom_domain=None):
     """
-    Create Ingress resource for HTTP only
+    Create Ingress resource for HTTP only.
+    Nothing is done if the resource already exists (pod was started before).
 
     :param namespace: Pod Namespace
     :type namespace: str
@@ -202,27 +215,22 @@ def create_ingress_http(namespace, service, domain, custom_domain=None):
     """
 
     resource = IngressResource('http', namespace)
+    resource.add_http_rule(domain, service)
     client = IngressResourceClient()
-
-    try:
-        client.get(resource.namespace, resource.name)
+    if not client.create_if_absent(resource):
         return
-    except IngressResourceNotFound:
-        pass
 
-    resource.add_http_rule(domain, service)
     if custom_domain is not None:
         c_resource = IngressResource('http-{}'.format(domain), namespace)
         c_resource.add_http_rule(custom_domain, service)
-        client.create(c_resource)
-
-    client.create(resource)
+        client.create_if_absent(c_resource)
 
 
 def create_ingress_https(namespace, service, domain, custom_domain=None,
                          certificate=None):
     """
-    Create Ingress resource for HTTPS and HTTP
+    Create Ingress resource for HTTPS and HTTP.
+    Nothing is done if the resource already exists (pod was started before).
 
     :param namespace: Pod Namespace
     :type namespace: str
@@ -232,21 +240,38 @@ def create_ingress_https(namespace, service, domain, custom_domain=None,
     :type service: str
     """
 
-    client = IngressResourceClient()
-    resource = IngressResource('https', namespace)
-
-    try:
-        client.get(resource.namespace, resource.name)
-        return
-    except IngressResourceNotFound:
-        pass
-
     pod_domain = PodDomain.find_by_full_domain(domain)
     if pod_domain is None:
         raise Exception('{} domain is not present in a db'.format(domain))
 
     wildcard_cert = pod_domain.base_domain.certificate
 
+    # Wildcard certificate is used in all cases except there is user provided
+    # certificate and there is no custom_domain specified
+    if certificate is not None and custom_domain is None:
+        domain_cert = certificate
+    else:
+        domain_cert = wildcard_cert
+    # certificates are checked before anything is created, because the
+    # existing resource means that the pod already has all it needs
+    if domain_cert:
+        check_cert_is_valid_for_domain(domain, domain_cert['cert'])
+    if custom_domain is not None and certificate is not None:
+        check_cert_is_valid_for_domain(custom_domain, certificate['cert'])
+
+    client = IngressResourceClient()
+    resource = IngressResource('https', namespace)
+    resource.add_http_rule(domain, service)
+    resource.add_tls('https', domain)
+    resource.enable_ssl_autogeneration()
+    if domain_cert:
+        resource.disable_ssl_autogeneration()
+    if not client.create_if_absent(resource):
+        return
+    if domain_cert:
+        save_certificate_to_secret(domain_cert, domain, resource.name,
+                                   namespace)
+
     if custom_domain is not None:
         custom_r = IngressResource('https-{}'.format(custom_domain), namespace)
         custom_r.add_http_rule(custom_domain, service)
@@ -258,23 +283,7 @@ def create_ingress_https(namespace, service, domain, custom_domain=None,
         else:
             custom_r.enable_ssl_autogeneration()
 
-        client.create(custom_r)
-
-    resource.add_http_rule(domain, service)
-    resource.add_tls('https', domain)
-    resource.enable_ssl_autogeneration()
-    # Wildcard certificate is used in all cases except there is user provided
-    # certificate and there is no custom_domain specified
-    if certificate is not None and custom_domain is None:
-        save_certificate_to_secret(certificate, domain, resource.name,
-                                   namespace)
-        resource.disable_ssl_autogeneration()
-    elif wildcard_cert:
-        save_certificate_to_secret(wildcard_cert, domain, resource.name,
-                                   namespace)
-        resource.disable_ssl_autogeneration()
-
-    client.create(resource)
+        client.create_if_absent(custom_r)
 
 
 def save_certificate_to_secret(certificate, domain, secret_name, namespace):
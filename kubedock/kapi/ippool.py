@@ -118,6 +118,7 @@ class IpAddrPool(object):
             if node_name and current_app.config['FIXED_IP_POOLS']:
                 try:
                     node = K8SNode(hostname=node_name)
+                    node.fetch_data_from_k8s()
                     node.increment_free_public_ip_count(len(pool.free_hosts()))
                 except NodeNotFound:
                     raise APIError(
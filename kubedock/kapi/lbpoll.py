@@ -38,9 +38,9 @@ class LoadBalanceService(Services):
     def __init__(self):
         super(LoadBalanceService, self).__init__(PUBLIC_SVC_TYPE)
 
-    def get_template(self, pod_id, ports, annotations=None):
+    def get_template(self, pod_id, ports, annotations=None, owner_id=None):
         template = super(LoadBalanceService, self).get_template(
-            pod_id, ports, annotations)
+            pod_id, ports, annotations, owner_id)
 
         template['spec']['type'] = 'LoadBalancer'
         return template
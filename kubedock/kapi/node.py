@@ -20,12 +20,45 @@
 
 import json
 from copy import copy
-import time
 
-from ..core import ExclusiveLock
+from flask import current_app
+
+from ..core import ConnectionPool, ExclusiveLock
+from ..kd_celery import celery
 from .helpers import KubeQuery
 from ..settings import NODE_CEPH_AWARE_KUBERDOCK_LABEL
 
+#: Redis hash of hostname -> change of the number of free public IPs of the
+#: node which is not published to the node annotation yet
+FREE_IPS_PENDING_KEY = 'kd.node_free_ips.pending'
+#: Prefix of Redis keys which exist while publishing of the node counter is
+#: scheduled
+FREE_IPS_SCHEDULED_PREFIX = 'kd.node_free_ips.scheduled.'
+#: Changes of the counter made during that time are published in one update,
+#: seconds
+FREE_IPS_PUBLISH_DELAY = 1
+#: Publishing is scheduled again if the scheduled one hasn't started in that
+#: time, seconds
+FREE_IPS_SCHEDULED_TTL = 60
+
+# Adds a change to the pending changes of the node counter. KEYS: pending
+# changes hash, scheduled flag; ARGV: hostname, delta, current value of the
+# annotation or empty string if the result should not be checked, ttl of
+# the flag. Returns -1 if the counter would become negative (nothing is
+# changed then), 1 if publishing has to be scheduled and 0 otherwise.
+_INCREMENT_SCRIPT = """
+local pending = redis.call('hincrby', KEYS[1], ARGV[1], ARGV[2])
+if ARGV[3] ~= '' and tonumber(ARGV[3]) + pending < 0 then
+    redis.call('hincrby', KEYS[1], ARGV[1], -tonumber(ARGV[2]))
+    return -1
+end
+if redis.call('set', KEYS[2], 1, 'NX', 'EX', ARGV[4]) then
+    return 1
+end
+return 0
+"""
+_increment_script = None
+
 
 class NodeException(Exception):
     pass
@@ -88,32 +121,83 @@ class Node(object):
         result = self.k8squery.put(['nodes', self.hostname], json.dumps(data))
         return result.get('code') != self.K8S_CONFLICT_CODE
 
-    def increment_free_public_ip_count(self, delta=1, max_retries=5):
+    def increment_free_public_ip_count(self, delta=1):
         """
-        Atomically increases the number of public IP addresses available on a
-        node. Fetches a K8S node information beforehand
-        :param max_retries: how many times we try to update the counter if
-        somebody concurrently updated spec
+        Atomically changes the number of public IP addresses available on a
+        node. Changes are accumulated in Redis and published to the node
+        annotation asynchronously in batches (see
+        `publish_free_public_ip_count`), so concurrent changes neither wait
+        for each other nor for K8S. Decreasing of the counter fetches a K8S
+        node information beforehand to check that the counter stays positive
         :param delta: positive or negative number which is added to the
         current ip count
         """
-        lock = ExclusiveLock('NODE.PUBLIC_IP_INCR_{}'.format(self.hostname))
+        global _increment_script
+        if not delta:
+            return
+        current = ''
+        if delta < 0:
+            # For example we have 1 free ip and scheduler scheduled a
+            # pod, decreasing this number by 1 and here we are trying to
+            # decrease it once more. We'll get negative count and
+            # that's an error, we need to prohibit the caller from
+            # blocking or removing IP
+            self.fetch_data_from_k8s()
+            current = self.free_public_ip_count
+        conn = ConnectionPool.get_connection()
+        if _increment_script is None:
+            _increment_script = conn.register_script(_INCREMENT_SCRIPT)
+        result = _increment_script(
+            keys=[FREE_IPS_PENDING_KEY,
+                  FREE_IPS_SCHEDULED_PREFIX + self.hostname],
+            args=[self.hostname, delta, current, FREE_IPS_SCHEDULED_TTL],
+            client=conn)
+        if result < 0:
+            raise NodeExceptionNegativeFreeIPCount()
+        if result:
+            publish_free_public_ip_count_task.apply_async(
+                (self.hostname,), countdown=FREE_IPS_PUBLISH_DELAY)
+
+    def publish_free_public_ip_count(self, max_retries=5):
+        """
+        Adds changes accumulated by `increment_free_public_ip_count` to the
+        counter in the node annotation. The annotation is updated only if
+        node spec version is not changed, so decreasing of the counter by
+        scheduler is never lost. If the counter is missing or becomes
+        negative, it is recalculated from IP pools of the node.
+        :param max_retries: how many times we try to update the counter if
+        somebody concurrently updated spec
+        """
+        conn = ConnectionPool.get_connection()
+        lock = ExclusiveLock('NODE.PUBLIC_IP_PUBLISH_{}'.format(self.hostname),
+                             ttl=FREE_IPS_SCHEDULED_TTL)
         lock.lock(blocking=True)
         try:
+            # changes made from now on are published by the next call
+            conn.delete(FREE_IPS_SCHEDULED_PREFIX + self.hostname)
             for _ in range(max_retries):
-                self.fetch_data_from_k8s()
-                new_count = self.free_public_ip_count + delta
-
-                # For example we have 1 free ip and scheduler scheduled a
-                # pod, decreasing this number by 1 and here we are trying to
-                # decrease it once more. We'll get new_count == -1 and
-                # that's an error, we need to prohibit the caller from
-                # blocking or removing IP
-                if new_count < 0:
-                    raise NodeExceptionNegativeFreeIPCount()
+                delta = conn.hget(FREE_IPS_PENDING_KEY, self.hostname)
+                delta = int(delta or 0)
+                if not delta:
+                    return
+                try:
+                    self.fetch_data_from_k8s()
+                except NodeNotFound:
+                    # Counter of a missing node is missing too
+                    conn.hincrby(FREE_IPS_PENDING_KEY, self.hostname, -delta)
+                    return
+                try:
+                    new_count = self.free_public_ip_count + delta
+                except NodeExceptionIPCounterMissing:
+                    new_count = None
+                if new_count is None or new_count < 0:
+                    new_count = self.count_free_public_ips()
+                    current_app.logger.warning(
+                        'Free public IP counter of node %s has drifted, '
+                        'reset it to %s', self.hostname, new_count)
                 if self.update_free_public_ip_count(new_count):
+                    conn.hincrby(FREE_IPS_PENDING_KEY, self.hostname, -delta)
                     return
-                time.sleep(0.1)
         finally:
             lock.release()
 
@@ -122,6 +206,20 @@ class Node(object):
                                          'updates, blocking this update for '
                                          'too long')
 
+    def count_free_public_ips(self):
+        """
+        Calculates the number of free public IPs in IP pools of the node.
+        IPs which scheduler has reserved for pods not started yet are
+        counted as free
+        """
+        from ..nodes.models import Node as DBNode
+        from ..pods.models import IPPool
+        db_node = DBNode.get_by_name(self.hostname)
+        if db_node is None:
+            return 0
+        return sum(len(pool.free_hosts())
+                   for pool in IPPool.query.filter_by(node=db_node))
+
     @property
     def free_public_ip_count(self):
         try:
@@ -209,3 +307,25 @@ class Node(object):
             return response.text if not response.ok else False
         except SystemExit as e:
             return str(e)
+
+
+@celery.task(ignore_result=True)
+def publish_free_public_ip_count_task(hostname):
+    Node(hostname=hostname).publish_free_public_ip_count()
+
+
+@celery.task(ignore_result=True)
+def publish_pending_free_public_ip_counts():
+    """Publishes changes of free public IP counters which were not
+    published because of failures.
+    """
+    pending = ConnectionPool.get_connection().hgetall(FREE_IPS_PENDING_KEY)
+    for hostname, delta in pending.iteritems():
+        if not int(delta):
+            continue
+        try:
+            Node(hostname=hostname).publish_free_public_ip_count()
+        except NodeException:
+            current_app.logger.warning(
+                'Failed to publish free public IP counter of node %s',
+                hostname, exc_info=True)
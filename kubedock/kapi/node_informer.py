@@ -0,0 +1,118 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+"""Shared cache of kubernetes nodes kept current by the nodes watch.
+
+Nodes watch listener (see `kubedock.listeners.listen_fabric`) lists all
+nodes when it connects and then applies every watch event to a Redis hash,
+so all processes get nodes from the cache instead of kubernetes API. The
+cache is used only while the listener is connected and receives events
+(nodes post their status regularly); otherwise callers have to ask
+kubernetes themselves.
+"""
+
+import json
+import os
+
+import requests
+
+from ..core import ConnectionPool
+from ..utils import get_api_url
+
+#: Redis hash of node name -> node object in kubernetes
+NODES_KEY = 'kd.k8s_nodes'
+#: Redis key which exists while the cache is current
+SYNCED_KEY = 'kd.k8s_nodes.synced'
+#: The cache is considered outdated if the listener has got no events for
+#: that time, seconds. Kubelet updates node status every 10 seconds.
+SYNCED_TTL = 120
+
+
+class NodeInformer(object):
+    """Reads the cache and, being used as a notifier of nodes watch
+    listener, updates it.
+    """
+
+    def __init__(self):
+        self._list_version = None
+
+    def get_all(self):
+        """Returns list of all nodes or None if the cache is not current."""
+        pipe = ConnectionPool.get_connection().pipeline(transaction=False)
+        pipe.exists(SYNCED_KEY)
+        pipe.hvals(NODES_KEY)
+        synced, nodes = pipe.execute()
+        if not synced:
+            return None
+        return [json.loads(node) for node in nodes]
+
+    def get(self, name):
+        """Returns tuple (is cache current, node or None if there is no
+        such node).
+        """
+        pipe = ConnectionPool.get_connection().pipeline(transaction=False)
+        pipe.exists(SYNCED_KEY)
+        pipe.hget(NODES_KEY, name)
+        synced, node = pipe.execute()
+        if not synced:
+            return False, None
+        return True, None if node is None else json.loads(node)
+
+    def connected(self):
+        response = requests.get(get_api_url('nodes', namespace=False))
+        response.raise_for_status()
+        data = response.json()
+        # events up to this version are already taken into account
+        self._list_version = int(data['metadata']['resourceVersion'])
+        nodes = {node['metadata']['name']: json.dumps(node)
+                 for node in data.get('items') or []}
+        pipe = ConnectionPool.get_connection().pipeline()
+        pipe.delete(NODES_KEY)
+        if nodes:
+            pipe.hmset(NODES_KEY, nodes)
+        pipe.setex(SYNCED_KEY, SYNCED_TTL, os.getpid())
+        pipe.execute()
+
+    def notify(self, events):
+        if self._list_version is None:
+            return
+        pipe = ConnectionPool.get_connection().pipeline()
+        for event in events:
+            node = event['object']
+            if int(node['metadata']['resourceVersion']) <= self._list_version:
+                continue
+            name = node['metadata']['name']
+            if event['type'] == 'DELETED':
+                pipe.hdel(NODES_KEY, name)
+            else:
+                pipe.hset(NODES_KEY, name, json.dumps(node))
+        pipe.setex(SYNCED_KEY, SYNCED_TTL, os.getpid())
+        pipe.execute()
+
+    def heartbeat(self):
+        if self._list_version is not None:
+            ConnectionPool.get_connection().setex(
+                SYNCED_KEY, SYNCED_TTL, os.getpid())
+
+    def disconnected(self):
+        self._list_version = None
+        ConnectionPool.get_connection().delete(SYNCED_KEY)
+
+
+informer = NodeInformer()
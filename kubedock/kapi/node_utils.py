@@ -18,6 +18,7 @@
 # You should have received a copy of the GNU General Public License
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
+import os
 import socket
 import requests
 import json
@@ -33,12 +34,14 @@ from ..system_settings.models import SystemSettings
 from ..utils import from_binunit, from_siunit, get_api_url, NODE_STATUSES, Etcd
 from ..billing.models import Kube
 from ..exceptions import APIError
-from ..core import db, ssh_connect
+from ..core import db, ssh_connect, ssh_pool
 from ..settings import (
-    NODE_INSTALL_LOG_FILE, AWS, CEPH, PD_NAMESPACE, PD_NS_SEPARATOR,
-    NODE_STORAGE_MANAGE_CMD, ZFS, ETCD_CALICO_HOST_ENDPOINT_KEY_PATH_TEMPLATE,
+    NODE_INSTALL_LOG_FILE, NODE_INSTALL_LOG_TAIL_SIZE, AWS, CEPH,
+    PD_NAMESPACE, PD_NS_SEPARATOR, NODE_STORAGE_MANAGE_CMD, ZFS,
+    ETCD_CALICO_HOST_ENDPOINT_KEY_PATH_TEMPLATE,
     ETCD_CALICO_HOST_CONFIG_KEY_PATH_TEMPLATE, ETCD_NETWORK_POLICY_NODES,
     KD_NODE_HOST_ENDPOINT_ROLE)
+from . import node_informer
 from .network_policies import get_node_host_endpoint_policy
 
 
@@ -271,14 +274,62 @@ def _get_node_condition(x):
 
 
 def get_install_log(node_status, hostname):
+    """Returns the tail of node install log (at most
+    NODE_INSTALL_LOG_TAIL_SIZE bytes). Use `read_install_log` to get
+    earlier parts of the log.
+    """
     if node_status == NODE_STATUSES.running:
         return ''
-    else:
-        try:
-            with open(NODE_INSTALL_LOG_FILE.format(hostname), 'r') as f:
-                return f.read()
-        except IOError:
-            return 'No install log available for this node.\n'
+    part = read_install_log(hostname)
+    if part is None:
+        return 'No install log available for this node.\n'
+    if part['offset']:
+        # the log is cut, drop incomplete first line
+        return '...\n' + part['log'].split('\n', 1)[-1]
+    return part['log']
+
+
+def read_install_log(hostname, offset=None, limit=None):
+    """Reads a part of node install log.
+
+    :param offset: position in the log to read from. By default the last
+        `limit` bytes are read
+    :param limit: max number of bytes to read, NODE_INSTALL_LOG_TAIL_SIZE
+        by default
+    :return: dict with text of the part ('log'), its position in the log
+        ('offset') and size of the whole log ('size') or None if there is
+        no log
+    """
+    # f.read with a negative size would read the whole log
+    limit = max(limit or NODE_INSTALL_LOG_TAIL_SIZE, 1)
+    try:
+        with open(NODE_INSTALL_LOG_FILE.format(hostname), 'r') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if offset is None:
+                offset = max(size - limit, 0)
+            offset = min(max(offset, 0), size)
+            f.seek(offset)
+            log = f.read(limit).decode('utf-8', 'replace')
+    except IOError:
+        return None
+    return {'log': log, 'offset': offset, 'size': size}
+
+
+def get_node_install_log(node_id, offset=None, limit=None):
+    """Reads a part of install log of the node. See `read_install_log`."""
+    node = Node.get_by_id(node_id)
+    if not node:
+        raise APIError("Error. Node {0} doesn't exists".format(node_id),
+                       status_code=404)
+    limit = min(max(limit or NODE_INSTALL_LOG_TAIL_SIZE, 1),
+                NODE_INSTALL_LOG_TAIL_SIZE)
+    if offset is not None:
+        offset = max(offset, 0)
+    part = read_install_log(node.hostname, offset, limit)
+    if part is None:
+        return {'log': '', 'offset': 0, 'size': 0}
+    return part
 
 
 def get_one_node(node_id):
@@ -327,6 +378,9 @@ def get_one_node(node_id):
 
 
 def _get_k8s_node_by_host(host):
+    synced, node = node_informer.informer.get(host)
+    if synced:
+        return node if node is not None else {'status': 'Failure'}
     try:
         r = requests.get(get_api_url('nodes', host, namespace=False))
         res = r.json()
@@ -340,6 +394,9 @@ def _get_k8s_node_by_host(host):
 
 
 def get_all_nodes():
+    nodes = node_informer.informer.get_all()
+    if nodes is not None:
+        return nodes
     r = requests.get(get_api_url('nodes', namespace=False))
     return r.json().get('items') or []
 
@@ -586,16 +643,17 @@ def remove_ls_storage(hostname, raise_on_error=True):
 
 
 def _exec_on_host(hostname, command, err_message_prefix):
-    ssh, connect_error = ssh_connect(hostname)
-    if connect_error:
-        error_message = u'{}: {}'.format(err_message_prefix, connect_error)
-        raise APIError(error_message)
+    with ssh_pool.connect(hostname) as (ssh, connect_error):
+        if connect_error:
+            error_message = u'{}: {}'.format(
+                err_message_prefix, connect_error)
+            raise APIError(error_message)
 
-    _, o, e = ssh.exec_command(command)
-    if o.channel.recv_exit_status():
-        error_message = u'{}: {}'.format(err_message_prefix, e.read())
-        raise APIError(error_message)
-    return o.read()
+        _, o, e = ssh.exec_command(command)
+        if o.channel.recv_exit_status():
+            error_message = u'{}: {}'.format(err_message_prefix, e.read())
+            raise APIError(error_message)
+        return o.read()
 
 
 def get_ls_info(hostname):
@@ -686,21 +744,28 @@ def get_block_device_list(hostname):
     return devices
 
 
-def create_calico_host_endpoint(node_hostname, node_ipv4):
-    """Creates host endpoint for the node"""
+def get_calico_host_endpoint(node_ipv4):
+    """Returns host endpoint config for the node"""
     # If the node is added as host endpoint, then by default there will be
     # dropped all traffic (incoming and outgoing) to the node.
     # So there must be added an appropriate policy to role 'kdnode' and it
     # must be set during KD cluster deployment.
-    node_endpoint = {
+    return {
         "expected_ipv4_addrs": [node_ipv4],
         "labels": {"role": KD_NODE_HOST_ENDPOINT_ROLE},
         "profile_ids": []
     }
+
+
+def create_calico_host_endpoint(node_hostname, node_ipv4):
+    """Creates host endpoint for the node"""
     etcd_path = ETCD_CALICO_HOST_ENDPOINT_KEY_PATH_TEMPLATE.format(
         hostname=node_hostname
     )
-    Etcd(etcd_path).put(None, value=node_endpoint)
+    Etcd(etcd_path).put(None, value=get_calico_host_endpoint(node_ipv4))
+
+
+ETCD_ENDPOINT_TO_HOST_ACTION_KEY = 'DefaultEndpointToHostAction'
 
 
 def drop_endpoint_traffic_to_node(node_hostname):
@@ -711,7 +776,6 @@ def drop_endpoint_traffic_to_node(node_hostname):
     FIXME: actually works until rebooting, see
     https://github.com/projectcalico/calico-containers/issues/1190
     """
-    ETCD_ENDPOINT_TO_HOST_ACTION_KEY = 'DefaultEndpointToHostAction'
     etcd_path = ETCD_CALICO_HOST_CONFIG_KEY_PATH_TEMPLATE.format(
         hostname=node_hostname
     )
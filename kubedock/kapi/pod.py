@@ -194,18 +194,24 @@ class Pod(object):
                         for container in pod.containers)
         return pod
 
-    def dump(self):
+    def dump(self, all_secrets=None):
         """Get full information about pod.
 
         ATTENTION! Do not use it in methods allowed for user! It may contain
         secret information. FOR ADMINS ONLY!
+
+        :param all_secrets: secrets of all namespaces (see `get_all_secrets`).
+            If not specified, secrets of the pod will be requested from k8s.
         """
         if self.owner.is_internal():
             raise ServicePodDumpError
 
         pod_data = self.as_dict()
         owner = self.owner
-        k8s_secrets = self.get_secrets()
+        if all_secrets is None:
+            k8s_secrets = self.get_secrets()
+        else:
+            k8s_secrets = all_secrets.get(self.namespace, {})
         volumes_map = self.get_volumes()
 
         rv = {
@@ -251,6 +257,30 @@ class Pod(object):
 
         return rv
 
+    @staticmethod
+    def get_all_secrets():
+        """Retrieve secrets of type '.dockercfg' of all namespaces by one
+        request to kubernetes.
+
+        Returns dict {namespace: {secret_name: parsed_secret_data, ...}, ...}
+        """
+        secrets_client = K8sSecretsClient(KubeQuery())
+
+        try:
+            resp = secrets_client.list_all()
+        except secrets_client.ErrorBase as e:
+            raise APIError('Cannot get k8s secrets due to: %s' % e.message)
+
+        parse = K8sSecretsBuilder.parse_secret_data
+
+        rv = {}
+        for x in resp['items']:
+            if x['type'] == K8sSecretsClient.SECRET_TYPE:
+                metadata = x['metadata']
+                rv.setdefault(metadata['namespace'], {})[metadata['name']] = \
+                    parse(x['data'])
+        return rv
+
     def _as_dict(self):
         data = vars(self).copy()
 
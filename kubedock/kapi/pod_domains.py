@@ -21,7 +21,7 @@
 import socket
 import string
 
-from ..core import ExclusiveLockContextManager
+from ..core import ExclusiveLockContextManager, db
 from ..domains.models import BaseDomain, PodDomain
 from ..exceptions import (DomainNotFound, InternalAPIError, PodDomainExists,
                           PublicAccessAssigningError)
@@ -150,14 +150,17 @@ def _get_unique_domain_name(basename, domain_id):
     """Returns unique domain name for given basename.
     If basename does not exists in DB with specified domain_id, then it will
     be returned as is.
-    Otherwise will be returned basename with random suffix
+    Otherwise will be returned basename with random suffix.
+    All taken names which may collide are selected by one prefix query
+    (basename is domainized, so it has no LIKE wildcards) and candidates are
+    checked against them in memory. Callers hold the pod domains lock.
     """
-    pod_domain = PodDomain.query.filter_by(name=basename,
-                                           domain_id=domain_id).first()
-    if pod_domain is None:
+    taken = {name for (name,) in db.session.query(PodDomain.name).filter(
+        PodDomain.domain_id == domain_id,
+        PodDomain.name.startswith(basename))}
+    if basename not in taken:
         return basename
 
-    res = None
     # try to get unique random domain name. If it fails for tries limit,
     # then something is going wrong, return None and it will be better to fail
     # in calling code
@@ -168,12 +171,9 @@ def _get_unique_domain_name(basename, domain_id):
             symbols=string.lowercase + string.digits,
             length=random_suffix_length)
         new_name = '{0}{1}'.format(basename, suffix)
-        pod_domain = PodDomain.query.filter_by(
-            name=new_name, domain_id=domain_id).first()
-        if pod_domain is None:
-            res = new_name
-            break
-    return res
+        if new_name not in taken:
+            return new_name
+    return None
 
 
 def validate_domain_reachability(domain):
@@ -0,0 +1,181 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+"""Waiting for changes of pods driven by events of the pods watch.
+
+Pods watch listener (see `kubedock.listeners.listen_fabric`) publishes ids
+of pods it has got events for to a Redis channel. Every process keeps one
+subscription to the channel and wakes up waiters of these pods, so a waiter
+checks the pod only when something has happened to it.
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+import redis
+from flask import current_app
+
+from ..core import ConnectionPool
+
+CHANNEL = 'kd.pod_events'
+#: Redis key which exists while pods watch listener is connected
+LISTENER_KEY = 'kd.pod_events.listener'
+#: The listener is considered gone if it has not refreshed the key for that
+#: time, seconds. It is refreshed on every batch of events and heartbeat.
+LISTENER_TTL = 120
+#: Max time to wait for subscription to the channel, seconds
+SUBSCRIBE_TIMEOUT = 1
+#: Pods are checked at least that often even if there are no events, seconds
+RECHECK_INTERVAL = 10
+POD_UID_LABEL = 'kuberdock-pod-uid'
+
+
+class PodEventWaiters(object):
+    """Per-process registry of waiters for events of pods."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._events = defaultdict(set)
+        self._thread = None
+        self._subscribed = threading.Event()
+
+    @contextmanager
+    def register(self, pod_id):
+        """Registers a waiter for events of the pod.
+        Yields `threading.Event` which is set on every event of the pod.
+        Clear it before checking the pod so no event is missed.
+        """
+        event = threading.Event()
+        with self._lock:
+            self._reset_after_fork()
+            self._events[pod_id].add(event)
+        try:
+            yield event
+        finally:
+            with self._lock:
+                events = self._events.get(pod_id)
+                if events is not None:
+                    events.discard(event)
+                    if not events:
+                        del self._events[pod_id]
+
+    def available(self):
+        """Checks that events are delivered: the process is subscribed to
+        the channel and pods watch listener is connected. Otherwise waiters
+        have to poll.
+        """
+        try:
+            if not self._subscribe():
+                return False
+            return bool(ConnectionPool.get_connection().exists(LISTENER_KEY))
+        except redis.RedisError:
+            current_app.logger.warning('Pod events are not available',
+                                       exc_info=True)
+            return False
+
+    def _reset_after_fork(self):
+        if self._pid != os.getpid():
+            # subscription of the parent process can not be used
+            self._pid = os.getpid()
+            self._events = defaultdict(set)
+            self._thread = None
+            self._subscribed = threading.Event()
+
+    def _subscribe(self):
+        with self._lock:
+            self._reset_after_fork()
+            if self._thread is None:
+                pubsub = ConnectionPool.get_connection().pubsub()
+                pubsub.subscribe(CHANNEL)
+                self._thread = threading.Thread(
+                    target=self._listen, args=(pubsub, self._subscribed))
+                self._thread.daemon = True
+                self._thread.start()
+            subscribed = self._subscribed
+        return subscribed.wait(SUBSCRIBE_TIMEOUT)
+
+    def _listen(self, pubsub, subscribed):
+        try:
+            for message in pubsub.listen():
+                if message['type'] == 'subscribe':
+                    subscribed.set()
+                elif message['type'] == 'message':
+                    self._notify(json.loads(message['data']))
+        except Exception:
+            # there is no app context in this thread, the next call of
+            # `available` logs the problem if Redis is still unavailable
+            pass
+        finally:
+            with self._lock:
+                if self._subscribed is subscribed:
+                    subscribed.clear()
+                    self._subscribed = threading.Event()
+                    self._thread = None
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+    def _notify(self, pod_ids):
+        with self._lock:
+            events = [event for pod_id in pod_ids
+                      for event in self._events.get(pod_id, ())]
+        for event in events:
+            event.set()
+
+
+waiters = PodEventWaiters()
+
+
+class WatchNotifier(object):
+    """Feeds waiters of all processes with events of pods watch.
+    Used by `kubedock.listeners.listen_fabric`.
+    """
+
+    def connected(self):
+        self._call('setex', LISTENER_KEY, LISTENER_TTL, os.getpid())
+
+    def heartbeat(self):
+        self._call('setex', LISTENER_KEY, LISTENER_TTL, os.getpid())
+
+    def disconnected(self):
+        self._call('delete', LISTENER_KEY)
+
+    def notify(self, events):
+        pod_ids = set()
+        for event in events:
+            labels = event['object']['metadata'].get('labels') or {}
+            if labels.get(POD_UID_LABEL):
+                pod_ids.add(labels[POD_UID_LABEL])
+        self._call('setex', LISTENER_KEY, LISTENER_TTL, os.getpid())
+        if pod_ids:
+            self._call('publish', CHANNEL, json.dumps(sorted(pod_ids)))
+
+    @staticmethod
+    def _call(command, *args):
+        try:
+            getattr(ConnectionPool.get_connection(), command)(*args)
+        except redis.RedisError:
+            current_app.logger.warning('Failed to notify pod event waiters',
+                                       exc_info=True)
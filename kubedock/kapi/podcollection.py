@@ -19,6 +19,7 @@
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
 import json
+import time
 from collections import defaultdict
 from crypt import crypt
 from datetime import datetime
@@ -35,6 +36,7 @@ import ingress_resource
 import licensing
 import node_utils
 import pod_domains
+import pod_events
 import podutils
 import pstorage
 from helpers import (
@@ -148,7 +150,8 @@ class PodCollection(object):
         self._get_pods(namespaces)
         self._merge()
 
-    def _preprocess_new_pod(self, params, original_pod=None, skip_check=False):
+    def _preprocess_new_pod(self, params, original_pod=None, skip_check=False,
+                            check_images=True):
         """
         Do some trivial checks and changes in new pod data.
 
@@ -157,6 +160,8 @@ class PodCollection(object):
             edit, not creation.
         :param skip_check: use it if you trust the source or need to break some
             rules (usually for kuberdock-internal)
+        :param check_images: set it to False if images are already checked
+            (see `add_batch`)
         :returns: prepared pod config and list of secrets. Secret is
             a tuple(username, password, registry).
         """
@@ -167,7 +172,8 @@ class PodCollection(object):
         secrets = sorted(secrets)
 
         self._preprocess_containers(params['containers'], secrets, skip_check,
-                                    original_pod=original_pod)
+                                    original_pod=original_pod,
+                                    check_images=check_images)
 
         params['owner'] = self.owner
 
@@ -215,7 +221,7 @@ class PodCollection(object):
         return pod_data, secrets
 
     def _preprocess_containers(self, containers, secrets, skip_check,
-                               original_pod=None):
+                               original_pod=None, check_images=True):
         fix_relative_mount_paths(containers)
 
         # TODO: with cerberus 0.10 use "default" normalization rule
@@ -227,7 +233,8 @@ class PodCollection(object):
         if not skip_check:
             if self.owner is not None:  # may not have an owner in dry-run
                 self._check_trial(containers, original_pod=original_pod)
-            Image.check_containers(containers, secrets)
+            if check_images:
+                Image.check_containers(containers, secrets)
 
     def _check_status(self, pod_data):
         billing_type = SystemSettings.get_by_name(
@@ -316,6 +323,50 @@ class PodCollection(object):
 
         return self._add_pod(params, secrets, skip_check, reuse_pv)
 
+    def add_batch(self, pods_params, skip_check=False):
+        """Creates many pods of the owner. Images of all pods are checked
+        concurrently and only once per image, then pods are created one by
+        one. A pod which fails does not prevent creation of the others.
+
+        :param pods_params: list of pod configs
+        :param skip_check: same as in `add`
+        :returns: list of tuples (pod, error) in order of pods_params, where
+            pod is a dict (as returned by `add`) or None and error is
+            APIError or None
+        """
+        if self.owner is None:
+            raise InsufficientData('Cannot create a pod without an owner')
+
+        if not skip_check:
+            _check_license()
+            errors = Image.check_containers_batch([
+                (params['containers'],
+                 sorted(extract_secrets(params['containers'], remove=False)))
+                for params in pods_params])
+        else:
+            errors = [None] * len(pods_params)
+
+        results = []
+        for params, error in zip(pods_params, errors):
+            if error is not None:
+                results.append((None, error))
+                continue
+            try:
+                params, secrets = self._preprocess_new_pod(
+                    params, skip_check=skip_check, check_images=False)
+                self._preprocess_public_access(params)
+                results.append(
+                    (self._add_pod(params, secrets, skip_check, True), None))
+            except APIError as e:
+                db.session.rollback()
+                results.append((None, e))
+            except Exception:
+                db.session.rollback()
+                current_app.logger.exception('Failed to create a pod')
+                results.append((None, APIError('Failed to create a pod',
+                                               status_code=500)))
+        return results
+
     def add_from_dump(self, dump, skip_check=False):
         if not skip_check:
             _check_license()
@@ -429,16 +480,27 @@ class PodCollection(object):
             return self._dump_one(pod_id)
 
     def _dump_all(self):
+        return list(self.iter_dump())
+
+    def iter_dump(self):
+        """Get full information about all pods one by one.
+        Secrets of all pods are requested from k8s at once, before iteration.
+        ATTENTION! Do not use it in methods allowed for user! It may contain
+        secret information. FOR ADMINS ONLY!
+        """
         if self.owner is None:
-            rv = [pod.dump() for pod in self._get_owned()
-                  if not pod.owner.is_internal()]
+            pods = [pod for pod in self._get_owned()
+                    if not pod.owner.is_internal()]
         else:
             # a little optimization. All pods have the same owner,
             # so check once
             if self.owner.is_internal():
                 raise ServicePodDumpError
-            rv = [pod.dump() for pod in self._get_owned()]
-        return rv
+            pods = self._get_owned()
+        if not pods:
+            return iter(())
+        all_secrets = Pod.get_all_secrets()
+        return (pod.dump(all_secrets) for pod in pods)
 
     def _dump_one(self, pod_id):
         # check for internal user performed in the pod
@@ -1728,7 +1790,11 @@ def _check_if_domain_system_ready():
 
 def wait_pod_status(pod_id, wait_status, interval=1, max_retries=120,
                     error_message=None):
-    """Keeps polling k8s api until pod status becomes as given"""
+    """Waits until pod status becomes as given. The pod is checked on every
+    event of it received by pods watch listener (see `pod_events`). If the
+    listener is down, k8s api is polled every `interval` seconds.
+    Gives up after `interval * max_retries` seconds.
+    """
 
     def check_status():
         # we need a fresh status
@@ -1741,12 +1807,24 @@ def wait_pod_status(pod_id, wait_status, interval=1, max_retries=120,
         if pod.status == wait_status:
             return pod
 
-    return utils.retry(
-        check_status, interval, max_retries,
-        APIError(error_message or (
-            "Pod {0} did not become {1} after a given timeout. "
-            "It may become later.".format(pod_id, wait_status)))
-    )
+    deadline = time.time() + interval * max_retries
+    with pod_events.waiters.register(pod_id) as event:
+        while True:
+            # events received during the check must wake us up
+            event.clear()
+            pod = check_status()
+            if pod is not None:
+                return pod
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise APIError(error_message or (
+                    "Pod {0} did not become {1} after a given timeout. "
+                    "It may become later.".format(pod_id, wait_status)))
+            if pod_events.waiters.available():
+                timeout = pod_events.RECHECK_INTERVAL
+            else:
+                timeout = interval
+            event.wait(min(timeout, remaining))
 
 
 @celery.task(bind=True, default_retry_delay=1, max_retries=10)
@@ -1878,11 +1956,17 @@ def restore_fake_volume_mounts(k8s_containers, kd_containers):
             container['volumeMounts'] = vol_mounts
 
 
-def extract_secrets(containers):
-    """Get set of secrets from list of containers."""
+def extract_secrets(containers, remove=True):
+    """Get set of secrets from list of containers.
+
+    :param remove: also remove secrets from containers
+    """
     secrets = set()  # each item is tuple: (username, password, full_registry)
     for container in containers:
-        secret = container.pop('secret', None)
+        if remove:
+            secret = container.pop('secret', None)
+        else:
+            secret = container.get('secret')
         if secret is not None:
             secrets.add((secret['username'], secret['password'],
                          Image(container['image']).full_registry))
@@ -2086,22 +2170,25 @@ def run_service(pod, annotations=None):
                                       annotations)
     cluster_ip = getattr(pod, 'podIP', None)
     local_svc = ingress_local_ports(pod.id, pod.namespace, ports,
-                                    resolve, cluster_ip)
+                                    resolve, cluster_ip, pod.owner)
     return local_svc, public_svc
 
 
 def ingress_local_ports(pod_id, namespace, ports,
-                        resolve=None, cluster_ip=None):
+                        resolve=None, cluster_ip=None, owner=None):
     """Ingress local ports to service
     :param: pod_id: pod id
     :param: namespace: pod namespace
     :param: ports: list of ports to ingress, see get_ports
     :param: cluster_ip: cluster_ip to use in service. Optional.
+    :param: owner: pod owner, service is labelled with it. Optional.
     """
     local_svc = LocalService()
     services = local_svc.get_by_pods(pod_id)
     if not services and ports:
-        service = local_svc.get_template(pod_id, ports, resolve)
+        service = local_svc.get_template(
+            pod_id, ports, resolve,
+            owner_id=owner.id if owner is not None else None)
         service = local_svc.set_clusterIP(service, cluster_ip)
         rv = local_svc.post(service, namespace)
         podutils.raise_if_failure(rv, "Could not ingress local ports")
@@ -2132,7 +2219,8 @@ def ingress_public_ports(pod_id, namespace, ports, owner, publicIP=None,
     svc = get_service_provider()
     services = svc.get_by_pods(pod_id)
     if not services and ports:
-        service = svc.get_template(pod_id, ports, annotations)
+        service = svc.get_template(pod_id, ports, annotations,
+                                   owner_id=owner.id)
         if not settings.AWS:
             service = svc.set_publicIP(service, publicIP)
         rv = svc.post(service, namespace)
@@ -21,19 +21,21 @@
 import boto
 import boto.ec2
 import json
+import pipes
+import socket
 import time
 from contextlib import contextmanager
 import os
 from collections import defaultdict
 
 from ConfigParser import ConfigParser
-from fabric.api import run, settings, env, hide
+from fabric.api import env
 from StringIO import StringIO
-from fabric.exceptions import CommandTimeout, NetworkError
 from flask import current_app
+from paramiko.ssh_exception import SSHException
 
 import podcollection
-from ..core import db, ExclusiveLock, ConnectionPool
+from ..core import db, ExclusiveLock, ConnectionPool, ssh_pool
 from ..exceptions import (
     APIError, PVResizeIsNotSupportedError, PVResizeFailed, PDNotFound)
 from ..nodes.models import Node, NodeFlagNames
@@ -646,21 +648,27 @@ class PersistentStorage(object):
         raise NotImplementedError()
 
 
-def execute_run(command, timeout=NODE_COMMAND_TIMEOUT, jsonresult=False,
+def execute_run(ssh, command, timeout=NODE_COMMAND_TIMEOUT, jsonresult=False,
                 catch_exitcodes=None):
+    # Command is executed the same way as fabric's run does it: in a login
+    # shell with pty, so stderr is combined with stdout.
     try:
-        result = run(command, timeout=timeout)
-    except (CommandTimeout, NetworkError):
+        _, o, _ = ssh.exec_command(
+            '/bin/bash -l -c {0}'.format(pipes.quote(command)),
+            timeout=timeout, get_pty=True)
+        result = o.read().replace('\r\n', '\n').strip()
+        return_code = o.channel.recv_exit_status()
+    except socket.timeout:
         raise NodeCommandTimeoutError(
             'Timeout reached while execute remote command'
         )
-    if result.return_code != 0:
-        if not catch_exitcodes or result.return_code not in catch_exitcodes:
+    if return_code != 0:
+        if not catch_exitcodes or return_code not in catch_exitcodes:
             raise NodeCommandError(
                 'Remote command `{0}` execution failed (exit code = {1})'
-                .format(command, result.return_code)
+                .format(command, return_code)
             )
-        raise NodeCommandWrongExitCode(code=result.return_code)
+        raise NodeCommandWrongExitCode(code=return_code)
     if jsonresult:
         try:
             result = json.loads(result)
@@ -673,16 +681,24 @@ def execute_run(command, timeout=NODE_COMMAND_TIMEOUT, jsonresult=False,
 def run_remote_command(host_string, command, timeout=NODE_COMMAND_TIMEOUT,
                        jsonresult=False,
                        catch_exitcodes=None):
-    """Executes command on remote host via fabric run.
+    """Executes command on remote host via pooled SSH connection.
     Optionally timeout may be specified.
     If result of execution is expected in json format, then the output will
     be treated as json.
     """
-    with settings(hide(NODE_STATUSES.running, 'warnings', 'stdout', 'stderr'),
-                  host_string=host_string,
-                  warn_only=True):
-        return execute_run(command, timeout=timeout, jsonresult=jsonresult,
-                           catch_exitcodes=catch_exitcodes)
+    try:
+        with ssh_pool.connect(host_string, timeout=timeout) as (ssh, error):
+            if error:
+                raise NodeCommandTimeoutError(
+                    'Timeout reached while execute remote command'
+                )
+            return execute_run(ssh, command, timeout=timeout,
+                               jsonresult=jsonresult,
+                               catch_exitcodes=catch_exitcodes)
+    except (SSHException, socket.error, EOFError):
+        raise NodeCommandTimeoutError(
+            'Timeout reached while execute remote command'
+        )
 
 
 def get_ceph_credentials():
@@ -0,0 +1,142 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+"""Shared cache of kubernetes services indexed by owner.
+
+Services watch listener (see `kubedock.listeners.listen_fabric`) lists all
+services when it connects and then applies every watch event to a Redis
+hash. Services labelled with the owner (`OWNER_LABEL`) are also added to a
+per-owner set, so services of a user are found with one indexed lookup.
+The cache is used only while the listener is connected; otherwise callers
+have to ask kubernetes themselves.
+"""
+
+import json
+import os
+
+import requests
+
+from ..core import ConnectionPool
+from ..utils import get_api_url
+
+#: Label with id of the user who owns the service
+OWNER_LABEL = 'kuberdock-user-uid'
+#: Redis hash of "namespace/name" -> service object in kubernetes
+SERVICES_KEY = 'kd.k8s_services'
+#: Prefix of Redis sets of "namespace/name" of services of an owner
+OWNER_INDEX_PREFIX = 'kd.k8s_services.owner.'
+#: Redis key which exists while the cache is current
+SYNCED_KEY = 'kd.k8s_services.synced'
+#: The cache is considered outdated if the listener has not refreshed the
+#: key for that time, seconds. Services are not updated regularly, so the
+#: listener refreshes it on heartbeats too.
+SYNCED_TTL = 120
+
+
+def _service_key(service):
+    metadata = service['metadata']
+    return '{0}/{1}'.format(metadata.get('namespace'), metadata['name'])
+
+
+def _owner(service):
+    return (service['metadata'].get('labels') or {}).get(OWNER_LABEL)
+
+
+class ServiceInformer(object):
+    """Reads the cache and, being used as a notifier of services watch
+    listener, updates it.
+    """
+
+    def __init__(self):
+        self._list_version = None
+
+    def get_by_owner(self, owner_id):
+        """Returns list of services of the owner or None if the cache is
+        not current.
+        """
+        owner_id = str(owner_id)
+        conn = ConnectionPool.get_connection()
+        pipe = conn.pipeline(transaction=False)
+        pipe.exists(SYNCED_KEY)
+        pipe.smembers(OWNER_INDEX_PREFIX + owner_id)
+        synced, keys = pipe.execute()
+        if not synced:
+            return None
+        if not keys:
+            return []
+        services = [json.loads(service)
+                    for service in conn.hmget(SERVICES_KEY, sorted(keys))
+                    if service is not None]
+        # index is not cleaned up if the label is changed, until relisting
+        return [service for service in services
+                if _owner(service) == owner_id]
+
+    def connected(self):
+        response = requests.get(get_api_url('services', namespace=False))
+        response.raise_for_status()
+        data = response.json()
+        # events up to this version are already taken into account
+        self._list_version = int(data['metadata']['resourceVersion'])
+        conn = ConnectionPool.get_connection()
+        pipe = conn.pipeline()
+        pipe.delete(SERVICES_KEY,
+                    *conn.scan_iter(OWNER_INDEX_PREFIX + '*'))
+        for service in data.get('items') or []:
+            self._add(pipe, service)
+        pipe.setex(SYNCED_KEY, SYNCED_TTL, os.getpid())
+        pipe.execute()
+
+    def notify(self, events):
+        if self._list_version is None:
+            return
+        pipe = ConnectionPool.get_connection().pipeline()
+        for event in events:
+            service = event['object']
+            version = int(service['metadata']['resourceVersion'])
+            if version <= self._list_version:
+                continue
+            if event['type'] == 'DELETED':
+                key = _service_key(service)
+                pipe.hdel(SERVICES_KEY, key)
+                if _owner(service):
+                    pipe.srem(OWNER_INDEX_PREFIX + _owner(service), key)
+            else:
+                self._add(pipe, service)
+        pipe.setex(SYNCED_KEY, SYNCED_TTL, os.getpid())
+        pipe.execute()
+
+    def heartbeat(self):
+        if self._list_version is not None:
+            ConnectionPool.get_connection().setex(
+                SYNCED_KEY, SYNCED_TTL, os.getpid())
+
+    def disconnected(self):
+        self._list_version = None
+        ConnectionPool.get_connection().delete(SYNCED_KEY)
+
+    @staticmethod
+    def _add(pipe, service):
+        key = _service_key(service)
+        pipe.hset(SERVICES_KEY, key, json.dumps(service))
+        if _owner(service):
+            pipe.sadd(OWNER_INDEX_PREFIX + _owner(service), key)
+
+
+informer = ServiceInformer()
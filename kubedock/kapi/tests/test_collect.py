@@ -19,6 +19,9 @@
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
 import copy
+import json
+import subprocess
+import sys
 import unittest
 
 import mock
@@ -61,9 +64,9 @@ class TestStatItem(unittest.TestCase):
         self.assertTrue(_Node.get_all.called)
         self.assertEqual(nodes, [{'_ip': n} for n in self._NODES_DATA])
 
-    @mock.patch('kubedock.kapi.collect.ssh_connect')
+    @mock.patch('kubedock.kapi.collect.ssh_pool')
     @mock.patch('kubedock.kapi.collect.requests')
-    def test_extend_nodes(self, _req, ssh_connect_mock):
+    def test_extend_nodes(self, _req, ssh_pool_mock):
         rv = mock.MagicMock(status_code=200,
                             **{'json.return_value': copy.deepcopy(
                                 self._CADVISOR_REPLY)})
@@ -73,11 +76,62 @@ class TestStatItem(unittest.TestCase):
         received = [copy.deepcopy(self._BASE_NODE_DATA)
                     for i in range(len(self._NODES_DATA))]
         # skip data collected via ssh
-        ssh_connect_mock.return_value = (None, 'some error')
+        ssh_pool_mock.connect.return_value.__enter__.return_value = (
+            None, 'some error')
         nodes = collect.extend_nodes([{'_ip': n} for n in self._NODES_DATA])
         self.assertEqual(_req.get.call_args_list, expected)
         self.assertEqual(nodes, received)
-        # TODO: add tests for data filled via ssh commands
+
+    @mock.patch('kubedock.kapi.collect.ssh_pool')
+    @mock.patch('kubedock.kapi.collect.requests')
+    def test_extend_nodes_facts(self, _req, ssh_pool_mock):
+        _req.get.return_value = mock.MagicMock(status_code=200, **{
+            'json.return_value': copy.deepcopy(self._CADVISOR_REPLY)})
+        facts = {
+            'cores': [0, '4\n'],
+            'kernel': [0, '3.10.0-327.el7.x86_64\n'],
+            'cpu': [0, '%Cpu(s):  1.5 us,  0.5 sy, 98.0 id\n'],
+            'memory': [0, (
+                '      total    used\n'
+                'Mem:   1000     600\n'
+                'Swap:   200       0\n')],
+            'containers_running': [0, '5\n'],
+            'containers_total': [0, '7\n'],
+            'user_containers_running': [1, ''],
+            'pods': [0, '3\n'],
+            'docker': [0, '1.12.1-5.el7'],
+            'la': [0, '0.10 0.20 0.30 1/100 1234\n'],
+        }
+        stdout = mock.Mock(**{
+            'read.return_value': json.dumps(facts),
+            'channel.recv_exit_status.return_value': 0})
+        ssh = mock.Mock(**{'exec_command.return_value': (None, stdout, None)})
+        ssh_pool_mock.connect.return_value.__enter__.return_value = (
+            ssh, None)
+
+        nodes = collect.extend_nodes([{'_ip': n} for n in self._NODES_DATA])
+        expected = dict(self._BASE_NODE_DATA, **{
+            'cores': 4, 'kernel': '3.10.0-327.el7.x86_64',
+            'cpu': {'us': 1.5, 'sy': 0.5, 'id': 98.0},
+            'memory': {'total': '1000', 'used': '600'},
+            'swap': {'total': '200', 'used': '0'},
+            'containers': {NODE_STATUSES.running: 5, 'total': 7},
+            'user_containers': {},
+            'pods': 3, 'docker': '1.12.1-5.el7', 'la': [0.1, 0.2, 0.3],
+        })
+        self.assertEqual(nodes, [expected, expected])
+        # only one command per node
+        self.assertEqual(ssh.exec_command.call_count, len(self._NODES_DATA))
+        self.assertEqual(
+            sorted(c[0][0] for c in ssh_pool_mock.connect.call_args_list),
+            self._NODES_DATA)
+
+    def test_node_facts_script(self):
+        commands = {'a': 'echo 1', 'b': 'echo 2; exit 3'}
+        script = collect.NODE_FACTS_SCRIPT % json.dumps(commands)
+        output = subprocess.check_output([sys.executable, '-c', script])
+        self.assertEqual(json.loads(output),
+                         {'a': [0, '1\n'], 'b': [3, '2\n']})
 
     @mock.patch('kubedock.kapi.collect.UserCollection')
     def test_get_users(self, _users):
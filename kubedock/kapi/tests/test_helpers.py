@@ -123,17 +123,44 @@ class TestServices(unittest.TestCase):
             [helpers.LABEL_SELECTOR_PODS.format('pod_id'),
              helpers.LABEL_SELECTOR_TYPE.format('public')])
 
-    @mock.patch.object(helpers.User, 'pods_to_dict')
-    @mock.patch.object(helpers.User, 'get')
+    @mock.patch.object(helpers.service_informer, 'informer')
     @mock.patch.object(helpers.Services, '_get')
-    def test_get_by_user(self, mock_get, mock_u_get, mock_u_pods):
-        services = helpers.Services()
-        mock_u_get.return_value = helpers.User
-        mock_u_pods.return_value = [{'id': 'pod_id'}]
+    def test_get_by_user(self, mock_get, mock_informer):
+        mock_informer.get_by_owner.return_value = None
+        services = helpers.Services('public')
         services.get_by_user(3)
+        mock_informer.get_by_owner.assert_called_once_with(3)
         mock_get.assert_called_once_with(
-            [helpers.LABEL_SELECTOR_PODS.format('pod_id')])
+            [helpers.LABEL_SELECTOR_USER.format(3),
+             helpers.LABEL_SELECTOR_TYPE.format('public')])
 
+    @mock.patch.object(helpers.service_informer, 'informer')
+    @mock.patch.object(helpers.Services, '_get')
+    def test_get_by_user_from_cache(self, mock_get, mock_informer):
+        def service(pod_id, svc_type):
+            return {'metadata': {'labels': {
+                helpers.KUBERDOCK_POD_UID: pod_id,
+                helpers.KUBERDOCK_TYPE: svc_type}}}
+
+        mock_informer.get_by_owner.return_value = [
+            service('pod1', 'public'), service('pod1', 'local'),
+            service('pod2', 'public')]
+        services = helpers.Services('public')
+        self.assertEqual(services.get_by_user(3),
+                         {'pod1': service('pod1', 'public'),
+                          'pod2': service('pod2', 'public')})
+        self.assertFalse(mock_get.called)
+
+    def test_get_template_with_owner(self):
+        services = helpers.Services('public')
+        template = services.get_template('pod_id', [{'port': 80}],
+                                         owner_id=3)
+        self.assertEqual(template['metadata']['labels'], {
+            helpers.KUBERDOCK_POD_UID: 'pod_id',
+            helpers.KUBERDOCK_TYPE: 'public',
+            helpers.KUBERDOCK_USER_UID: '3'})
+        self.assertEqual(template['spec']['selector'],
+                         {helpers.KUBERDOCK_POD_UID: 'pod_id'})
 
 if __name__ == '__main__':
     unittest.main()
@@ -484,6 +484,42 @@ class TestImages(unittest.TestCase):
         check_registry_status.assert_called_once_with(image.full_registry)
 
 
+class TestCheckContainersBatch(DBTestCase):
+    @mock.patch.object(Image, '_check_availability', autospec=True)
+    def test_check_containers_batch(self, check_availability_mock):
+        def check_availability(image, registries, fast=True):
+            if image.repo == 'u1/private':
+                raise ImageNotAvailable(image)
+            if image.repo == 'library/alpine':
+                return {}
+            return True if fast else NGINX_IMAGE_INFO['config']
+        check_availability_mock.side_effect = check_availability
+
+        container = {'name': 'n', 'command': ['c']}
+        secrets = [('uname1', 'pwd1', 'quay.io')]
+        errors = Image.check_containers_batch([
+            ([dict(container, image='nginx'),
+              dict(container, image='nginx', command=[])], []),
+            ([dict(container, image='nginx')], []),
+            ([dict(container, image='nginx'),
+              dict(container, image='u1/private')], secrets),
+            ([dict(container, image='alpine', command=[])], []),
+            ([], []),
+        ])
+
+        self.assertEqual(errors[:2], [None, None])
+        self.assertIsInstance(errors[2], ImageNotAvailable)
+        self.assertIsInstance(errors[3], CommandIsMissing)
+        self.assertIsNone(errors[4])
+        # every image is checked once per set of secrets
+        calls = sorted((args[0].repo, kwargs['fast']) for args, kwargs
+                       in check_availability_mock.call_args_list)
+        self.assertEqual(calls, [
+            ('library/alpine', False), ('library/nginx', False),
+            ('library/nginx', True), ('library/nginx', True),
+            ('u1/private', True)])
+
+
 class TestCheckRegistryStatus(unittest.TestCase):
     v2_is_supported = {'docker-distribution-api-version': 'registry/2.0'}
 
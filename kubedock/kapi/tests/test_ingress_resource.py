@@ -87,5 +87,27 @@ class TestCreateIngress(TestCase):
         self.assertFalse(res)
 
 
+class TestCreateIngressHttp(TestCase):
+    @mock.patch.object(ingress_resource.IngressResourceClient, 'get')
+    @mock.patch.object(ingress_resource.IngressResourceClient, 'create')
+    def test_create(self, create_mock, get_mock):
+        ingress_resource.create_ingress_http(
+            'ns', 'service', 'pod.example.com', 'custom.com')
+        resources = [c[0][0] for c in create_mock.call_args_list]
+        self.assertEqual([r.name for r in resources],
+                         ['http', 'http-pod.example.com'])
+        self.assertEqual(resources[1].rules[0]['host'], 'custom.com')
+        self.assertFalse(get_mock.called)
+
+    @mock.patch.object(ingress_resource.IngressResourceClient, 'create')
+    def test_already_exists(self, create_mock):
+        create_mock.side_effect = \
+            ingress_resource.IngressResourceAlreadyExists
+        ingress_resource.create_ingress_http(
+            'ns', 'service', 'pod.example.com', 'custom.com')
+        create_mock.assert_called_once_with(mock.ANY)
+        self.assertEqual(create_mock.call_args[0][0].name, 'http')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -26,10 +26,10 @@ import mock
 import responses
 from flask import current_app
 
-from kubedock.core import db
+from kubedock.core import ConnectionPool, db
 from kubedock.exceptions import APIError
 from kubedock.kapi import ippool
-from kubedock.kapi.node import Node as K8SNode
+from kubedock.kapi.node import FREE_IPS_PENDING_KEY, Node as K8SNode
 from kubedock.pods.models import IPPool
 from kubedock.testutils.fixtures import K8SAPIStubs, pod
 from kubedock.testutils.testcases import DBTestCase, attr
@@ -51,6 +51,18 @@ class TestIpPool(DBTestCase):
 
         current_app.config['FIXED_IP_POOLS'] = True
 
+        # publish changes of free public IP counters immediately
+        self.addCleanup(ConnectionPool.get_connection().delete,
+                        FREE_IPS_PENDING_KEY)
+        patcher = mock.patch(
+            'kubedock.kapi.node.publish_free_public_ip_count_task')
+        patcher.start().apply_async.side_effect = self._publish_counter
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _publish_counter(args, **kwargs):
+        K8SNode(*args).publish_free_public_ip_count()
+
     def test_get_returns_emtpy_list_by_default(self):
         res = ippool.IpAddrPool().get()
         self.assertEqual(res, [])
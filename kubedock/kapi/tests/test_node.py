@@ -19,12 +19,17 @@
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
 import json
-import responses
 
+import mock
+import responses
 from flask import current_app
 
+from kubedock.core import ConnectionPool
 from kubedock.exceptions import APIError
-from kubedock.kapi.node import Node, NodeExceptionUpdateFailure
+from kubedock.kapi import node as k8s_node
+from kubedock.kapi.node import (
+    Node, NodeExceptionNegativeFreeIPCount, NodeExceptionUpdateFailure)
+from kubedock.pods.models import IPPool
 from kubedock.testutils.fixtures import K8SAPIStubs
 from kubedock.testutils.testcases import DBTestCase
 
@@ -36,6 +41,20 @@ class TestNode(DBTestCase):
         self.stubs.node_info_in_k8s_api(self.node.hostname)
         current_app.config['FIXED_IP_POOLS'] = True
 
+        self.redis = ConnectionPool.get_connection()
+        self.redis.delete(k8s_node.FREE_IPS_PENDING_KEY,
+                          k8s_node.FREE_IPS_SCHEDULED_PREFIX + 'node1')
+        self.addCleanup(self.redis.delete, k8s_node.FREE_IPS_PENDING_KEY,
+                        k8s_node.FREE_IPS_SCHEDULED_PREFIX + 'node1')
+        patcher = mock.patch.object(k8s_node,
+                                    'publish_free_public_ip_count_task')
+        self.publish_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _annotated_count(self):
+        return self.stubs.nodes[self.node.hostname]['metadata'][
+            'annotations'][Node.FREE_PUBLIC_IP_COUNTER_FIELD]
+
     @responses.activate
     def test_public_ip_counter_update_sends_correct_request_to_api(self):
         self.stubs.node_info_update_in_k8s_api(self.node.hostname)
@@ -56,22 +75,69 @@ class TestNode(DBTestCase):
         delta = 5
         initial_ip_count = self.node.free_public_ip_count
         self.node.increment_free_public_ip_count(delta)
+        self.node.publish_free_public_ip_count()
         expected_count = initial_ip_count + delta
 
         self.assertEqual(self.node.free_public_ip_count, expected_count)
-        actual_count = self.stubs.nodes[self.node.hostname]['metadata'][
-            'annotations'][
-            Node.FREE_PUBLIC_IP_COUNTER_FIELD]
+        self.assertEqual(self._annotated_count(), str(expected_count))
+
+    @responses.activate
+    def test_increment_free_public_ip_count_coalesces_changes(self):
+        self.stubs.node_info_update_in_k8s_api(self.node.hostname)
+
+        for delta in (1, 3, 2):
+            self.node.increment_free_public_ip_count(delta)
+        self.assertEqual(len(responses.calls), 0)
+        self.publish_task.apply_async.assert_called_once_with(
+            ('node1',), countdown=k8s_node.FREE_IPS_PUBLISH_DELAY)
 
-        self.assertEqual(actual_count, str(expected_count))
+        self.node.publish_free_public_ip_count()
+        self.assertEqual(self._annotated_count(), '6')
+        self.assertEqual(len(responses.calls), 2)
+
+        # publishing is scheduled again for the next changes
+        self.node.increment_free_public_ip_count(-1)
+        self.assertEqual(self.publish_task.apply_async.call_count, 2)
+        self.node.publish_free_public_ip_count()
+        self.assertEqual(self._annotated_count(), '5')
+
+    @responses.activate
+    def test_increment_free_public_ip_count_fails_if_count_is_negative(self):
+        self.stubs.node_info_update_in_k8s_api(self.node.hostname)
+        self.node.increment_free_public_ip_count(1)
+
+        with self.assertRaises(NodeExceptionNegativeFreeIPCount):
+            self.node.increment_free_public_ip_count(-2)
+        self.node.increment_free_public_ip_count(-1)
+        self.assertEqual(
+            self.redis.hget(k8s_node.FREE_IPS_PENDING_KEY, 'node1'), '0')
 
     @responses.activate
     def test_increment_free_public_ip_fails_if_unable_update_max_retry_times(
             self):
         self.stubs.node_info_update_in_k8s_api(self.node.hostname, True)
+        self.node.increment_free_public_ip_count(1)
 
         with self.assertRaises(NodeExceptionUpdateFailure):
-            self.node.increment_free_public_ip_count(1)
+            self.node.publish_free_public_ip_count()
+        # the change is published later
+        self.assertEqual(
+            self.redis.hget(k8s_node.FREE_IPS_PENDING_KEY, 'node1'), '1')
+
+    @responses.activate
+    def test_publish_free_public_ip_count_reconciles_drifted_counter(self):
+        db_node = self.fixtures.node(hostname='node1')
+        self.db.session.add(IPPool(network=u'192.168.2.0/30', node=db_node))
+        self.db.session.commit()
+        self.stubs.node_info_update_in_k8s_api(self.node.hostname)
+        self.node.update_free_public_ip_count(1)
+
+        # the counter would become negative
+        self.redis.hincrby(k8s_node.FREE_IPS_PENDING_KEY, 'node1', -2)
+        self.node.publish_free_public_ip_count()
+        self.assertEqual(self._annotated_count(), '4')
+        self.assertEqual(
+            self.redis.hget(k8s_node.FREE_IPS_PENDING_KEY, 'node1'), '0')
 
     @responses.activate
     def test_update_data_on_k8s_succeeds_if_update_succeeded(self):
@@ -0,0 +1,80 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+import json
+import unittest
+
+import responses
+
+from kubedock.core import ConnectionPool
+from kubedock.kapi import node_informer
+from kubedock.testutils.testcases import DBTestCase
+from kubedock.utils import get_api_url
+
+
+def k8s_node(name, version, ready='True'):
+    return {'metadata': {'name': name, 'resourceVersion': str(version)},
+            'status': {'conditions': [{'type': 'Ready', 'status': ready}]}}
+
+
+class TestNodeInformer(DBTestCase):
+    def setUp(self):
+        self.informer = node_informer.NodeInformer()
+        self.addCleanup(ConnectionPool.get_connection().delete,
+                        node_informer.NODES_KEY, node_informer.SYNCED_KEY)
+
+    def _connect(self, *nodes):
+        responses.add(
+            responses.GET, get_api_url('nodes', namespace=False),
+            body=json.dumps({'metadata': {'resourceVersion': '10'},
+                             'items': list(nodes)}))
+        self.informer.connected()
+
+    @responses.activate
+    def test_serves_nodes_while_connected(self):
+        self.assertIsNone(self.informer.get_all())
+        self.assertEqual(self.informer.get('node1'), (False, None))
+
+        self._connect(k8s_node('node1', 5), k8s_node('node2', 7))
+        self.assertItemsEqual(self.informer.get_all(),
+                              [k8s_node('node1', 5), k8s_node('node2', 7)])
+        self.assertEqual(self.informer.get('node1'),
+                         (True, k8s_node('node1', 5)))
+        self.assertEqual(self.informer.get('node3'), (True, None))
+
+        self.informer.disconnected()
+        self.assertIsNone(self.informer.get_all())
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_applies_watch_events(self):
+        self._connect(k8s_node('node1', 5), k8s_node('node2', 7))
+        self.informer.notify([
+            # already listed
+            {'type': 'DELETED', 'object': k8s_node('node1', 9)},
+            {'type': 'MODIFIED', 'object': k8s_node('node2', 11, 'False')},
+            {'type': 'ADDED', 'object': k8s_node('node3', 12)},
+            {'type': 'DELETED', 'object': k8s_node('node2', 13, 'False')},
+        ])
+        self.assertItemsEqual(self.informer.get_all(),
+                              [k8s_node('node1', 5), k8s_node('node3', 12)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -225,6 +225,65 @@ class TestNodeUtils(DBTestCase):
         res = node_utils._get_k8s_node_by_host(host2)
         self.assertEqual(res, valid_answer)
 
+    @mock.patch.object(node_utils.node_informer, 'informer')
+    def test_k8s_nodes_are_taken_from_informer(self, informer_mock):
+        k8s_node = {'metadata': {'name': 'host1'}}
+        informer_mock.get.return_value = (True, k8s_node)
+        informer_mock.get_all.return_value = [k8s_node]
+        self.assertEqual(node_utils._get_k8s_node_by_host('host1'), k8s_node)
+        self.assertEqual(node_utils.get_all_nodes(), [k8s_node])
+
+        informer_mock.get.return_value = (True, None)
+        self.assertEqual(node_utils._get_k8s_node_by_host('host1'),
+                         {'status': 'Failure'})
+
+    def test_install_log_tail(self):
+        log_file = os.path.join(self.tempdir, 'install-{0}.log')
+        with open(log_file.format('host1'), 'w') as f:
+            f.write('line1\nline2\nline3\n')
+
+        with mock.patch.object(node_utils, 'NODE_INSTALL_LOG_FILE', log_file):
+            with mock.patch.object(node_utils, 'NODE_INSTALL_LOG_TAIL_SIZE',
+                                   10):
+                self.assertEqual(
+                    node_utils.get_install_log(NODE_STATUSES.pending,
+                                               'host1'),
+                    '...\nline3\n')
+            self.assertEqual(
+                node_utils.read_install_log('host1', limit=10),
+                {'log': 'ne2\nline3\n', 'offset': 8, 'size': 18})
+            self.assertEqual(
+                node_utils.read_install_log('host1', offset=6, limit=5),
+                {'log': 'line2', 'offset': 6, 'size': 18})
+            self.assertEqual(
+                node_utils.read_install_log('host1', offset=0, limit=-1),
+                {'log': 'l', 'offset': 0, 'size': 18})
+            self.assertIsNone(node_utils.read_install_log('host2'))
+            self.assertEqual(
+                node_utils.get_install_log(NODE_STATUSES.pending, 'host2'),
+                'No install log available for this node.\n')
+
+    @mock.patch.object(node_utils.Node, 'get_by_id')
+    def test_install_log_size_is_bounded(self, get_by_id_mock):
+        get_by_id_mock.return_value.hostname = 'host1'
+        log_file = os.path.join(self.tempdir, 'install-{0}.log')
+        with open(log_file.format('host1'), 'w') as f:
+            f.write('line1\nline2\nline3\n')
+
+        log_file_patch = mock.patch.object(
+            node_utils, 'NODE_INSTALL_LOG_FILE', log_file)
+        tail_size_patch = mock.patch.object(
+            node_utils, 'NODE_INSTALL_LOG_TAIL_SIZE', 5)
+        with log_file_patch, tail_size_patch:
+            for limit in (0, None, 100):
+                self.assertEqual(
+                    node_utils.get_node_install_log(1, offset=0, limit=limit),
+                    {'log': 'line1', 'offset': 0, 'size': 18})
+            # negative limit must not read the whole log
+            self.assertEqual(
+                node_utils.get_node_install_log(1, offset=-5, limit=-1),
+                {'log': 'l', 'offset': 0, 'size': 18})
+
     @mock.patch.object(node_utils.socket, 'gethostbyname')
     def test__fix_missed_nodes(self, gethostbyname_mock):
         """Test for kapi.node_utils._fix_missed_nodes function."""
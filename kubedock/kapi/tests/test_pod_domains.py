@@ -22,7 +22,9 @@ from collections import namedtuple
 import unittest
 import mock
 
-from kubedock.testutils.testcases import FlaskTestCase
+from kubedock.core import db
+from kubedock.domains.models import BaseDomain, PodDomain
+from kubedock.testutils.testcases import DBTestCase, FlaskTestCase
 from kubedock.testutils import create_app
 from kubedock.exceptions import PodDomainExists
 
@@ -139,33 +141,37 @@ class TestSetPodDomain(TestCase):
             ((pod_domain, False), self.sub_domain_name)
         )
 
+
+class TestGetUniqueDomainName(DBTestCase):
+    def setUp(self):
+        self.base_domain = BaseDomain(name='base.domain')
+        other_domain = BaseDomain(name='other.domain')
+        db.session.add_all([self.base_domain, other_domain])
+        db.session.flush()
+        db.session.add_all([
+            PodDomain(name='user-pod', base_domain=self.base_domain),
+            PodDomain(name='user-podabc123', base_domain=self.base_domain),
+            PodDomain(name='user-pod2', base_domain=other_domain),
+        ])
+        db.session.commit()
+
+    def test_free_basename(self):
+        self.assertEqual(pod_domains._get_unique_domain_name(
+            'user-pod2', self.base_domain.id), 'user-pod2')
+
     @mock.patch.object(pod_domains, 'randstr')
-    @mock.patch.object(pod_domains, 'PodDomain')
-    def test_get_unique_domain_name(self, pod_domain_mock, randstr_mock):
-        query_first_mock = mock.Mock()
-        pod_domain_mock.query.filter_by.return_value.first = query_first_mock
-        query_first_mock.return_value = None
-        dname = 'qwerty1234'
-        domain_id = 22
-        res = pod_domains._get_unique_domain_name(dname, domain_id)
-        self.assertEqual(res, dname)
-        pod_domain_mock.query.filter_by.assert_called_once_with(
-            name=dname, domain_id=domain_id)
-        pod_domain_mock.query.filter_by.reset_mock()
-
-        # if the first call returns som object, the to basename must be
-        # appended random suffix
-        query_first_mock.reset_mock()
-        query_first_mock.side_effect = ['something', 'somethingelse', None]
-        random_suffix = 'sfsfd'
-        randstr_mock.return_value = random_suffix
-        res = pod_domains._get_unique_domain_name(dname, domain_id)
-        self.assertEqual(dname + random_suffix, res)
+    def test_random_suffix(self, randstr_mock):
+        randstr_mock.side_effect = ['abc123', 'xyz789']
+        res = pod_domains._get_unique_domain_name(
+            'user-pod', self.base_domain.id)
+        self.assertEqual(res, 'user-podxyz789')
         self.assertEqual(randstr_mock.call_count, 2)
-        self.assertEqual(pod_domain_mock.query.filter_by.call_count, 3)
-        pod_domain_mock.query.filter_by.assert_called_with(
-            name=dname + random_suffix, domain_id=domain_id)
 
+    @mock.patch.object(pod_domains, 'randstr')
+    def test_no_free_name(self, randstr_mock):
+        randstr_mock.return_value = 'abc123'
+        self.assertIsNone(pod_domains._get_unique_domain_name(
+            'user-pod', self.base_domain.id))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,131 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from kubedock.core import ConnectionPool
+from kubedock.exceptions import APIError
+from kubedock.kapi import pod_events, podcollection
+from kubedock.testutils.testcases import DBTestCase
+
+
+def pod_event(pod_id):
+    return {'type': 'MODIFIED', 'object': {'metadata': {
+        'labels': {pod_events.POD_UID_LABEL: pod_id}}}}
+
+
+class TestPodEventWaiters(DBTestCase):
+    def setUp(self):
+        self.waiters = pod_events.PodEventWaiters()
+        self.notifier = pod_events.WatchNotifier()
+        self.addCleanup(self.notifier.disconnected)
+
+    def test_event_wakes_up_waiter(self):
+        with self.waiters.register('pod-1') as event1, \
+                self.waiters.register('pod-2') as event2:
+            self.assertTrue(self.waiters._subscribe())
+            self.notifier.notify([pod_event('pod-1'), {'object': {
+                'metadata': {'name': 'not a pod of kuberdock'}}}])
+            self.assertTrue(event1.wait(1))
+            self.assertFalse(event2.is_set())
+        self.assertEqual(self.waiters._events, {})
+
+    def test_available_only_with_listener(self):
+        self.assertFalse(self.waiters.available())
+        self.notifier.connected()
+        self.assertTrue(self.waiters.available())
+        self.notifier.disconnected()
+        self.assertFalse(self.waiters.available())
+
+    def test_listener_key_expires(self):
+        conn = ConnectionPool.get_connection()
+        self.notifier.connected()
+        self.assertTrue(0 < conn.ttl(pod_events.LISTENER_KEY) <=
+                        pod_events.LISTENER_TTL)
+        conn.expire(pod_events.LISTENER_KEY, 1)
+        self.notifier.notify([pod_event('pod-1')])
+        self.assertGreater(conn.ttl(pod_events.LISTENER_KEY), 1)
+        conn.expire(pod_events.LISTENER_KEY, 1)
+        self.notifier.heartbeat()
+        self.assertGreater(conn.ttl(pod_events.LISTENER_KEY), 1)
+
+    def test_resubscribe_after_failure(self):
+        self.assertTrue(self.waiters._subscribe())
+        thread = self.waiters._thread
+        with mock.patch.object(self.waiters, '_notify',
+                               side_effect=ValueError):
+            self.notifier.notify([pod_event('pod-1')])
+            thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.waiters._subscribe())
+        self.assertIsNot(self.waiters._thread, thread)
+
+
+class TestWaitPodStatus(DBTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(podcollection, 'DBPod')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(podcollection, 'db')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(podcollection, 'PodCollection')
+        self.get_by_id = patcher.start().return_value._get_by_id
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(pod_events, 'waiters')
+        self.waiters = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.event = self.waiters.register.return_value.__enter__.return_value
+
+    def _pod_statuses(self, *statuses):
+        self.get_by_id.side_effect = [mock.Mock(status=status)
+                                      for status in statuses]
+
+    def test_waits_for_events(self):
+        self.waiters.available.return_value = True
+        self._pod_statuses('pending', 'pending', 'running')
+        pod = podcollection.wait_pod_status('pod-1', 'running')
+        self.assertEqual(pod.status, 'running')
+        self.waiters.register.assert_called_once_with('pod-1')
+        self.assertEqual(self.event.wait.call_count, 2)
+        self.event.wait.assert_called_with(pod_events.RECHECK_INTERVAL)
+        self.assertEqual(self.event.clear.call_count, 3)
+
+    def test_polls_without_listener(self):
+        self.waiters.available.return_value = False
+        self._pod_statuses('pending', 'running')
+        podcollection.wait_pod_status('pod-1', 'running', interval=3)
+        self.event.wait.assert_called_once_with(3)
+
+    @mock.patch.object(podcollection, 'time')
+    def test_timeout(self, time_mock):
+        self.waiters.available.return_value = True
+        time_mock.time.side_effect = [100, 100.5, 101]
+        self.get_by_id.return_value = mock.Mock(status='pending')
+        with self.assertRaises(APIError):
+            podcollection.wait_pod_status('pod-1', 'running', interval=1,
+                                          max_retries=1)
+        self.event.wait.assert_called_once_with(0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -325,6 +325,9 @@ class TestPodCollectionRunService(unittest.TestCase, TestCaseMixin):
                 service['spec']['selector']['kuberdock-pod-uid'], pod_id)
             self.assertEqual(
                 service['metadata']['labels']['kuberdock-pod-uid'], pod_id)
+            self.assertEqual(
+                service['metadata']['labels']['kuberdock-user-uid'],
+                str(pod_owner.id))
             service_type = service['metadata']['labels']['kuberdock-type']
             self.assertTrue(
                 service_type in (helpers.LOCAL_SVC_TYPE, PUBLIC_SVC_TYPE))
@@ -1194,6 +1197,50 @@ class TestPodCollectionAdd(DBTestCase, TestCaseMixin):
         self.assertFalse(_add_pod.called)
 
 
+class TestPodCollectionAddBatch(DBTestCase, TestCaseMixin):
+    def setUp(self):
+        self.mock_methods(podcollection.PodCollection, '_get_namespaces',
+                          '_get_pods', '_merge', '_preprocess_new_pod',
+                          '_add_pod')
+        self.mock_methods(podcollection, '_check_license')
+        self.mock_methods(podcollection.Image, 'check_containers_batch')
+        self.user, _ = self.fixtures.user_fixtures()
+        self.pod_collection = podcollection.PodCollection(self.user)
+        podcollection.PodCollection._preprocess_new_pod.side_effect = \
+            lambda params, **kwargs: (params, ())
+
+    def test_failed_pods_do_not_abort_others(self):
+        secret = {'username': 'u', 'password': 'p'}
+        pods = [{'name': name, 'containers': [
+            {'image': 'quay.io/' + name, 'secret': secret}]}
+            for name in ('a', 'b', 'c', 'd')]
+        image_error = APIError('Image is not available')
+        podcollection.Image.check_containers_batch.return_value = [
+            None, image_error, None, None]
+        add_error = APIError('Pod exists')
+        self.pod_collection._add_pod.side_effect = [
+            {'id': 'a'}, add_error, ValueError('unexpected')]
+
+        results = self.pod_collection.add_batch(pods)
+
+        self.assertEqual(results[:3], [
+            ({'id': 'a'}, None), (None, image_error), (None, add_error)])
+        self.assertIsNone(results[3][0])
+        self.assertEqual(results[3][1].status_code, 500)
+        podcollection._check_license.assert_called_once_with()
+        podcollection.Image.check_containers_batch.assert_called_once_with([
+            (pod['containers'], [('u', 'p', 'https://quay.io')])
+            for pod in pods])
+        # images are checked already
+        self.pod_collection._preprocess_new_pod.assert_called_with(
+            pods[3], skip_check=False, check_images=False)
+        self.assertEqual(self.pod_collection._add_pod.call_count, 3)
+
+    def test_owner_required(self):
+        with self.assertRaises(podcollection.InsufficientData):
+            podcollection.PodCollection().add_batch([{'containers': []}])
+
+
 class TestPodCollectionUpdate(unittest.TestCase, TestCaseMixin):
     def setUp(self):
         # mock all these methods to prevent any accidental calls
@@ -1758,6 +1805,72 @@ class TestPodCollectionGetSecrets(unittest.TestCase, TestCaseMixin):
             self.pod_collection.get_secrets(pod)
 
 
+class TestPodCollectionDump(unittest.TestCase, TestCaseMixin):
+    def setUp(self):
+        # mock all these methods to prevent any accidental calls
+        self.mock_methods(podcollection.PodCollection, '_get_namespaces',
+                          '_get_pods', '_merge', '_get_owned')
+        self.pod_collection = podcollection.PodCollection()
+
+    @mock.patch.object(podcollection.KubeQuery, 'get')
+    def test_get_all_secrets(self, get_mock):
+        data = {'.dockercfg': (
+            'eyJxdWF5LmlvIjogeyJhdXRoIjogImRYTmxjbTVoYldVeE9uQ'
+            'mhjM04zYjNKa01RPT0iLCAiZW1haWwiOiAiYUBhLmEiIH19')}
+        get_mock.return_value = {'kind': 'SecretList', 'items': [
+            {'data': data, 'type': 'kubernetes.io/dockercfg',
+             'metadata': {'name': 'secret-1', 'namespace': 'ns1'}},
+            {'data': data, 'type': 'kubernetes.io/dockercfg',
+             'metadata': {'name': 'secret-2', 'namespace': 'ns1'}},
+            {'data': data, 'type': 'kubernetes.io/dockercfg',
+             'metadata': {'name': 'secret-1', 'namespace': 'ns2'}},
+            {'data': {}, 'type': 'Opaque',
+             'metadata': {'name': 'secret-3', 'namespace': 'ns2'}},
+        ]}
+        secret = helpers.K8sSecretsBuilder.parse_secret_data(data)
+
+        self.assertEqual(Pod.get_all_secrets(), {
+            'ns1': {'secret-1': secret, 'secret-2': secret},
+            'ns2': {'secret-1': secret},
+        })
+        get_mock.assert_called_once_with(
+            ['secrets'], {'fieldSelector': 'type=kubernetes.io/dockercfg'})
+
+    @mock.patch.object(Pod, 'get_all_secrets')
+    def test_iter_dump(self, get_all_secrets_mock):
+        pods = [mock.Mock(), mock.Mock(), mock.Mock()]
+        pods[1].owner.is_internal.return_value = True
+        for pod in pods[::2]:
+            pod.owner.is_internal.return_value = False
+        self.pod_collection._get_owned.return_value = pods
+
+        dumps = self.pod_collection.iter_dump()
+        get_all_secrets_mock.assert_called_once_with()
+        self.assertEqual(list(dumps), [pods[0].dump.return_value,
+                                       pods[2].dump.return_value])
+        for pod in pods[::2]:
+            pod.dump.assert_called_once_with(
+                get_all_secrets_mock.return_value)
+        self.assertFalse(pods[1].dump.called)
+
+        get_all_secrets_mock.reset_mock()
+        self.pod_collection._get_owned.return_value = []
+        self.assertEqual(list(self.pod_collection.iter_dump()), [])
+        self.assertFalse(get_all_secrets_mock.called)
+
+    def test_dump_uses_all_secrets(self):
+        owner = mock.Mock(**{'is_internal.return_value': False})
+        pod = fake_pod(use_parents=(Pod,), id=str(uuid4()),
+                       namespace='ns1', owner=owner)
+        with mock.patch.object(Pod, 'as_dict'), \
+                mock.patch.object(Pod, 'get_volumes'), \
+                mock.patch.object(Pod, 'get_secrets') as get_secrets_mock:
+            dump = pod.dump({'ns1': {'secret-1': 'data'}})
+            self.assertEqual(dump['k8s_secrets'], {'secret-1': 'data'})
+            self.assertEqual(pod.dump({})['k8s_secrets'], {})
+            self.assertFalse(get_secrets_mock.called)
+
+
 @mock.patch.object(podcollection.PodCollection, '_get_by_id')
 class TestPodCollectionCheckUpdates(unittest.TestCase, TestCaseMixin):
     def setUp(self):
@@ -177,6 +177,79 @@ class TestPodIsBaseOfTemplate(unittest.TestCase):
         tpl = apps.PredefinedApp.get(1).get_filled_template_for_plan(0, values)
         self.assertTrue(apps.PredefinedApp.get(1).is_template_for(tpl))
 
+    def test_template_is_reused_for_many_pods(self):
+        app = apps.PredefinedApp.get(1)
+        for plan_id, size in ((0, 10), (1, 20), (0, 30)):
+            tpl = apps.PredefinedApp.get(1).get_filled_template_for_plan(
+                plan_id, {'MYSQL_PD_SIZE': size})
+            self.assertTrue(app.is_template_for(tpl))
+
+    def test_changed_data_is_not_derived(self):
+        app = apps.PredefinedApp.get(1)
+        tpl = app.get_filled_template_for_plan(0, {'MYSQL_PD_SIZE': 32})
+        tpl['spec']['template']['spec']['containers'][0]['image'] = 'nginx'
+        self.assertFalse(app.is_template_for(tpl))
+
+    def test_unknown_package_is_not_derived(self):
+        app = apps.PredefinedApp.get(1)
+        tpl = app.get_filled_template_for_plan(0, {})
+        tpl['kuberdock']['appPackage']['name'] = 'XXL'
+        self.assertFalse(app.is_template_for(tpl))
+
+    def test_entities_without_app_variables(self):
+        app = apps.PredefinedApp.get(1)
+        tpl = app.get_filled_template_for_plan(0, {'WPENV1': 5})
+        del tpl['appVariables']
+        self.assertTrue(app.is_template_for(tpl))
+
+        env = tpl['spec']['template']['spec']['containers'][0]['env']
+        env[1]['value'] = 6
+        self.assertFalse(app.is_template_for(tpl))
+
+    @mock.patch.object(apps.PredefinedApp.TemplateMatcher, 'match_filled')
+    def test_other_structure_rejected_by_fingerprint(self, match_filled):
+        app = apps.PredefinedApp.get(1)
+        tpl = app.get_filled_template_for_plan(0, {})
+        tpl['spec']['template']['spec']['volumes'].pop()
+        self.assertFalse(app.is_template_for(tpl))
+        self.assertFalse(match_filled.called)
+
+
+class TestTemplateCatalogueBenchmark(unittest.TestCase):
+    """
+    Looks up the app behind every pod in a catalogue of 200 apps.
+    Most apps are expected to be rejected by the fingerprint, so only a few
+    full template walks are made per lookup.
+    """
+    apps_count = 200
+    shapes_count = 20
+
+    def setUp(self):
+        self.catalogue = []
+        for i in range(self.apps_count):
+            volumes = ''.join(
+                '        - name: cache-{0}\n'
+                '          emptyDir: {{}}\n'.format(j)
+                for j in range(i % self.shapes_count))
+            tpl = VALID_TEMPLATE1.replace(
+                'wordpress:4.6', 'wordpress:4.6-{0}-apache'.format(i)).replace(
+                '      volumes:\n', '      volumes:\n' + volumes)
+            self.catalogue.append(apps.PredefinedApp(
+                id=i, name='app{0}'.format(i), template=tpl))
+
+    def test_lookup_in_catalogue(self):
+        derived = [app.get_filled_template_for_plan(0, {'MYSQL_PD_SIZE': 5})
+                   for app in self.catalogue]
+        matcher = apps.PredefinedApp.TemplateMatcher
+        with mock.patch.object(matcher, 'match_filled',
+                               autospec=True,
+                               side_effect=matcher.match_filled) as walk:
+            for app, tpl in zip(self.catalogue, derived):
+                self.assertIs(apps.PredefinedApp.find_template_for(
+                    tpl, self.catalogue), app)
+        per_shape = self.apps_count / self.shapes_count
+        self.assertLessEqual(walk.call_count, self.apps_count * per_shape)
+
 
 @mock.patch('kubedock.kapi.apps.PredefinedAppModel')
 class TestHowTemplateIsPreprocessed(unittest.TestCase):
@@ -487,6 +560,60 @@ class TestStartPodFromYAML(DBTestCase):
             check_new_pod_data.return_value, dry_run=True)
 
 
+def yaml_doc(kind, name):
+    return {'kind': kind, 'apiVersion': 'v1', 'metadata': {'name': name}}
+
+
+class TestSplitPodDocuments(unittest.TestCase):
+    def test_split(self):
+        pod1, pod2 = yaml_doc('Pod', 'a'), yaml_doc('Pod', 'b')
+        rc = yaml_doc('ReplicationController', 'c')
+        service1, service2 = yaml_doc('Service', 'a'), yaml_doc('Service', 'c')
+        self.assertEqual(
+            apps.split_pod_documents(
+                [None, pod1, service1, pod2, service2, rc, None]),
+            [[pod1, service1], [pod2, service2], [rc]])
+
+    def test_empty(self):
+        self.assertEqual(apps.split_pod_documents([None]), [])
+
+
+@mock.patch('kubedock.kapi.apps.PodCollection')
+@mock.patch('kubedock.kapi.apps.check_new_pod_data')
+@mock.patch('kubedock.kapi.apps.dispatch_kind')
+class TestStartPodsFromYAML(DBTestCase):
+    def setUp(self):
+        self.user, _ = self.fixtures.user_fixtures()
+
+    def test_per_document_results(self, dispatch_kind, check_new_pod_data,
+                                  PodCollection):
+        docs = [yaml_doc('Pod', name) for name in ('a', 'b', 'c')]
+        dispatch_kind.side_effect = lambda group: group[0]['metadata']
+        check_new_pod_data.side_effect = [
+            {'name': 'a'}, apps.ValidationError('invalid'), {'name': 'c'}]
+        PodCollection.return_value.add_batch.return_value = [
+            ({'id': 'pod-a'}, None),
+            (None, apps.APIError('failed', type='CreationError'))]
+
+        results = apps.start_pods_from_yaml(docs, self.user)
+
+        self.assertEqual(results[0], {'pod': {'id': 'pod-a'}})
+        self.assertEqual(results[1]['error']['type'], 'ValidationError')
+        self.assertEqual(results[2]['error'], {
+            'data': 'failed', 'type': 'CreationError', 'details': {}})
+        # one validation context for all pods of the user
+        contexts = {kwargs['context']
+                    for args, kwargs in check_new_pod_data.call_args_list}
+        self.assertEqual(len(contexts), 1)
+        PodCollection.return_value.add_batch.assert_called_once_with(
+            [{'name': 'a'}, {'name': 'c'}])
+
+    def test_no_pods(self, dispatch_kind, check_new_pod_data, PodCollection):
+        with self.assertRaises(apps.ValidationError):
+            apps.start_pods_from_yaml([None], self.user)
+        self.assertFalse(PodCollection.called)
+
+
 def fake_pod(**kwargs):
     parents = kwargs.pop('use_parents', ())
     return type('Pod', parents,
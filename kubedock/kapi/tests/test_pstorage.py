@@ -21,6 +21,7 @@
 """Tests for kapi.pstorage module."""
 
 import json
+import socket
 import unittest
 import uuid
 
@@ -45,6 +46,39 @@ class TestCase(FlaskTestCase):
 class TestPstorageFuncs(DBTestCase):
     """Tests for kapi.pstorage independent functions."""
 
+    @mock.patch.object(pstorage, 'ssh_pool')
+    def test_run_remote_command(self, ssh_pool_mock):
+        stdout = mock.Mock()
+        stdout.read.return_value = '{"a": 1}\r\n'
+        stdout.channel.recv_exit_status.return_value = 0
+        ssh = mock.Mock()
+        ssh.exec_command.return_value = (mock.Mock(), stdout, mock.Mock())
+        lease = ssh_pool_mock.connect.return_value.__enter__
+        lease.return_value = (ssh, None)
+
+        res = pstorage.run_remote_command('node1', "echo 'x'", timeout=5,
+                                          jsonresult=True)
+        self.assertEqual(res, {'a': 1})
+        ssh_pool_mock.connect.assert_called_once_with('node1', timeout=5)
+        ssh.exec_command.assert_called_once_with(
+            "/bin/bash -l -c 'echo '\"'\"'x'\"'\"''", timeout=5,
+            get_pty=True)
+
+        stdout.channel.recv_exit_status.return_value = 2
+        with self.assertRaises(pstorage.NodeCommandWrongExitCode) as err:
+            pstorage.run_remote_command('node1', 'ls', catch_exitcodes=[2])
+        self.assertEqual(err.exception.code, 2)
+        with self.assertRaises(pstorage.NodeCommandError):
+            pstorage.run_remote_command('node1', 'ls')
+
+        ssh.exec_command.side_effect = socket.timeout()
+        with self.assertRaises(pstorage.NodeCommandTimeoutError):
+            pstorage.run_remote_command('node1', 'ls')
+
+        lease.return_value = (None, 'Connection refused')
+        with self.assertRaises(pstorage.NodeCommandTimeoutError):
+            pstorage.run_remote_command('node1', 'ls')
+
     @mock.patch.object(pstorage, 'run_remote_command')
     def test_get_all_ceph_drives(self, run_mock):
         image1 = 'q1'
@@ -0,0 +1,119 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest
+
+import responses
+
+from kubedock.core import ConnectionPool
+from kubedock.kapi import service_informer
+from kubedock.testutils.testcases import DBTestCase
+from kubedock.utils import get_api_url
+
+
+def k8s_service(name, version, owner=None, namespace='ns'):
+    labels = {'kuberdock-pod-uid': namespace}
+    if owner is not None:
+        labels[service_informer.OWNER_LABEL] = str(owner)
+    return {'metadata': {'name': name, 'namespace': namespace,
+                         'resourceVersion': str(version), 'labels': labels}}
+
+
+class TestServiceInformer(DBTestCase):
+    def setUp(self):
+        self.informer = service_informer.ServiceInformer()
+        conn = ConnectionPool.get_connection()
+        self.addCleanup(
+            lambda: conn.delete(
+                service_informer.SERVICES_KEY, service_informer.SYNCED_KEY,
+                *conn.keys(service_informer.OWNER_INDEX_PREFIX + '*')))
+
+    def _connect(self, *services):
+        responses.add(
+            responses.GET, get_api_url('services', namespace=False),
+            body=json.dumps({'metadata': {'resourceVersion': '10'},
+                             'items': list(services)}))
+        self.informer.connected()
+
+    @responses.activate
+    def test_serves_services_of_owner_while_connected(self):
+        self.assertIsNone(self.informer.get_by_owner(1))
+
+        self._connect(k8s_service('svc1', 5, owner=1),
+                      k8s_service('svc2', 6, owner=1, namespace='ns2'),
+                      k8s_service('svc3', 7, owner=2),
+                      k8s_service('svc4', 8))
+        self.assertItemsEqual(
+            self.informer.get_by_owner(1),
+            [k8s_service('svc1', 5, owner=1),
+             k8s_service('svc2', 6, owner=1, namespace='ns2')])
+        self.assertEqual(self.informer.get_by_owner('2'),
+                         [k8s_service('svc3', 7, owner=2)])
+        self.assertEqual(self.informer.get_by_owner(3), [])
+
+        self.informer.disconnected()
+        self.assertIsNone(self.informer.get_by_owner(1))
+
+    @responses.activate
+    def test_applies_watch_events(self):
+        self._connect(k8s_service('svc1', 5, owner=1),
+                      k8s_service('svc2', 6, owner=1))
+        self.informer.notify([
+            # already listed
+            {'type': 'DELETED', 'object': k8s_service('svc1', 9, owner=1)},
+            {'type': 'DELETED', 'object': k8s_service('svc2', 11, owner=1)},
+            {'type': 'ADDED', 'object': k8s_service('svc3', 12, owner=1)},
+            {'type': 'MODIFIED', 'object': k8s_service('svc1', 13, owner=2)},
+        ])
+        self.assertEqual(self.informer.get_by_owner(1),
+                         [k8s_service('svc3', 12, owner=1)])
+        self.assertEqual(self.informer.get_by_owner(2),
+                         [k8s_service('svc1', 13, owner=2)])
+
+    @responses.activate
+    def test_relisting_drops_outdated_index(self):
+        self._connect(k8s_service('svc1', 5, owner=1))
+        responses.reset()
+        self._connect(k8s_service('svc2', 6, owner=2))
+        conn = ConnectionPool.get_connection()
+        self.assertFalse(
+            conn.exists(service_informer.OWNER_INDEX_PREFIX + '1'))
+        self.assertEqual(self.informer.get_by_owner(1), [])
+
+    @responses.activate
+    def test_cache_expires_without_heartbeats(self):
+        conn = ConnectionPool.get_connection()
+        self._connect(k8s_service('svc1', 5, owner=1))
+        self.assertTrue(
+            0 < conn.ttl(service_informer.SYNCED_KEY) <=
+            service_informer.SYNCED_TTL)
+
+        # heartbeats of a quiet listener keep the cache current
+        conn.expire(service_informer.SYNCED_KEY, 1)
+        self.informer.heartbeat()
+        self.assertGreater(conn.ttl(service_informer.SYNCED_KEY), 1)
+
+        # if the listener has died without disconnecting, the key expires
+        conn.delete(service_informer.SYNCED_KEY)
+        self.assertIsNone(self.informer.get_by_owner(1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -368,6 +368,36 @@ class TestUpdateStates(DBTestCase):
         self.assertEqual(cs1.end_time, cs2.start_time)
 
 
+class TestGetOpenContainerStates(DBTestCase):
+    def test_next_start_time(self):
+        pod1, pod2 = self.fixtures.pod(), self.fixtures.pod()
+        t = datetime(2016, 10, 1, 12)
+        ps1 = usage.PodState(pod_id=pod1.id, kube_id=pod1.kube_id,
+                             start_time=t).save()
+        ps2 = usage.PodState(pod_id=pod1.id, kube_id=pod1.kube_id,
+                             start_time=t + timedelta(hours=1)).save()
+        ps3 = usage.PodState(pod_id=pod2.id, kube_id=pod2.kube_id,
+                             start_time=t).save()
+
+        def CS(pod_state, name, start, end=None):
+            return usage.ContainerState(
+                pod_state=pod_state, container_name=name, docker_id=name,
+                start_time=t + timedelta(minutes=start),
+                end_time=end and t + timedelta(minutes=end)).save()
+
+        cs1 = CS(ps1, 'first', 0)
+        CS(ps1, 'second', 0, 10)
+        cs2 = CS(ps2, 'first', 60)
+        CS(ps2, 'first', 90, 100)
+        cs3 = CS(ps3, 'first', 20)
+
+        self.assertItemsEqual(usage.get_open_container_states(), [
+            (cs1, pod1.id, t + timedelta(minutes=60)),
+            (cs2, pod1.id, t + timedelta(minutes=90)),
+            (cs3, pod2.id, None),
+        ])
+
+
 if __name__ == '__main__':
     # logging.basicConfig(stream=sys.stderr)
     # logging.getLogger('TestPodCollection.test_pod').setLevel(logging.DEBUG)
@@ -57,6 +57,8 @@ def update_states(k8s_pod, event_type=None, event_time=None):
         http://kubernetes.io/v1.1/docs/api-reference/v1/definitions.html#_v1_pod
     :param event_type: k8s event type or None
     :param event_time: optional, used as the best version of "current" time
+    :param commit: handled by `atomic`: pass False to do the work in
+        a savepoint of the caller's transaction without committing it
     :returns: set of updated/created ContainerState
     """
     updated_CS = set()
@@ -255,3 +257,36 @@ def fix_pods_timeline_heavy():
 
     redis.delete('fix_pods_timeline_heavy')
     return updated_CS
+
+
+def get_open_container_states():
+    """Get all ContainerStates which are not closed yet together with pod id
+    and start time of the next state of the same container (or None).
+    :returns: list of (ContainerState, pod_id, next_start_time)
+    """
+    pods_with_open_states = db.session.query(PodState.pod_id).join(
+        ContainerState
+    ).filter(
+        ContainerState.end_time.is_(None)
+    )
+    next_start_time = db.func.lead(ContainerState.start_time).over(
+        partition_by=(PodState.pod_id, ContainerState.container_name),
+        order_by=ContainerState.start_time,
+    )
+    timeline = db.session.query(
+        ContainerState.container_name, ContainerState.docker_id,
+        ContainerState.kubes, ContainerState.start_time, PodState.pod_id,
+        next_start_time.label('next_start_time'),
+    ).join(PodState).filter(
+        PodState.pod_id.in_(pods_with_open_states)
+    ).subquery()
+    return db.session.query(
+        ContainerState, timeline.c.pod_id, timeline.c.next_start_time
+    ).join(timeline, db.and_(
+        ContainerState.container_name == timeline.c.container_name,
+        ContainerState.docker_id == timeline.c.docker_id,
+        ContainerState.kubes == timeline.c.kubes,
+        ContainerState.start_time == timeline.c.start_time,
+    )).filter(
+        ContainerState.end_time.is_(None)
+    ).all()
@@ -42,18 +42,19 @@ class InfluxDBUnexpectedAnswer(InfluxDBError):
         super(InfluxDBUnexpectedAnswer, self).__init__(message)
 
 
-def _query(query_str):
+def _query(query_str, epoch=None):
     url = 'http://{host}:{port}/query' \
         .format(host=settings.INFLUXDB_HOST,
                 port=settings.INFLUXDB_PORT)
     params = {
         'q': query_str,
         'chunked': 'false',
-        # 'epoch': 's',
         'db': settings.INFLUXDB_DATABASE,
         'u': settings.INFLUXDB_USER,
         'p': settings.INFLUXDB_PASSWORD
     }
+    if epoch is not None:
+        params['epoch'] = epoch
     try:
         r = requests.get(
             url=url,
@@ -66,7 +67,16 @@ def _query(query_str):
         raise InfluxDBUnexpectedAnswer(e), None, sys.exc_info()[2]
 
 
+def _get_rollup_tier(start, end):
+    # rollups import this module
+    from kubedock.kubedata import rollups
+    return rollups, rollups.get_tier(start, end)
+
+
 def get_node_stat(nodename, start, end):
+    rollups, tier = _get_rollup_tier(start, end)
+    if tier is not None:
+        return rollups.get_node_stat(tier, nodename, start, end)
     b = QueryBuilder(start, end)
     f = node_filter(nodename)
     query_str = ' '.join((
@@ -96,6 +106,9 @@ def get_node_stat(nodename, start, end):
 
 
 def get_pod_stat(pod_name, start, end):
+    rollups, tier = _get_rollup_tier(start, end)
+    if tier is not None:
+        return rollups.get_pod_stat(tier, pod_name, start, end)
     b = QueryBuilder(start, end)
     f = pod_filter(pod_name)
     query_str = ' '.join((
@@ -121,6 +134,10 @@ def get_pod_stat(pod_name, start, end):
 
 
 def get_container_stat(pod_name, container_name, start, end):
+    rollups, tier = _get_rollup_tier(start, end)
+    if tier is not None:
+        return rollups.get_container_stat(
+            tier, pod_name, container_name, start, end)
     b = QueryBuilder(start, end)
     f = container_filter(pod_name, container_name)
     query_str = ' '.join((
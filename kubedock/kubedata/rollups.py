@@ -0,0 +1,339 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+"""Rollups of Heapster stats.
+
+Heapster writes stats to InfluxDB at raw resolution, so reading them for a
+long range is slow and returns too many points. `rollup_stats` task
+averages Heapster series into 5-minute rows per host, pod and container
+(`StatWrap5Min`) and then averages these rows into hourly and daily tiers.
+Stats for long ranges are read from the tiers (see `get_tier`).
+"""
+
+import calendar
+import json
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+
+from ..core import ConnectionPool, ExclusiveLock, db
+from ..kd_celery import celery
+from ..stats import StatWrap5Min, StatWrapHour, StatWrapDay
+from .kubestat import Point, _query
+
+#: Heapster measurement -> column of a tier
+MEASUREMENTS = (
+    ('cpu/usage_rate', 'cpu'),
+    ('memory/usage', 'memory'),
+    ('network/rx_rate', 'rxb'),
+    ('network/tx_rate', 'txb'),
+    ('cpu/request', 'cpu_limit'),
+    ('memory/request', 'memory_limit'),
+)
+#: Filesystem measurements are grouped by resource_id and saved to fs_data
+FS_MEASUREMENTS = ('filesystem/usage', 'filesystem/limit')
+#: Tiers from the finest, every tier is rolled up from the previous one
+TIERS = (StatWrap5Min, StatWrapHour, StatWrapDay)
+#: Rows older than that are deleted, seconds (None means forever)
+RETENTION = {
+    StatWrap5Min: 7 * 24 * 60 * 60,
+    StatWrapHour: 180 * 24 * 60 * 60,
+    StatWrapDay: None,
+}
+#: Ranges longer than that are read from the tier instead of the
+#: previous one (or from raw Heapster data), seconds
+TIER_MIN_RANGE = {
+    StatWrap5Min: 3 * 60 * 60,
+    StatWrapHour: 2 * 24 * 60 * 60,
+    StatWrapDay: 60 * 24 * 60 * 60,
+}
+#: A window is rolled up when Heapster has had that long to write its
+#: points, seconds
+ROLLUP_DELAY = 2 * 60
+#: How far back Heapster data is rolled up, seconds. Limits the first run
+#: and catching up after downtime.
+MAX_HEAPSTER_RANGE = 24 * 60 * 60
+PROGRESS_KEY_PREFIX = 'kd.stats_rollup.'
+LOCK_NAME = 'STATS_ROLLUP'
+LOCK_TTL = 30 * 60
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _floor(timestamp, period):
+    return timestamp - timestamp % period
+
+
+def _timestamp(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+
+class _Averages(object):
+    """Averages of values of a row, None values are skipped."""
+
+    def __init__(self):
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(int)
+
+    def add(self, name, value):
+        if value is not None:
+            self._sums[name] += value
+            self._counts[name] += 1
+
+    def get(self, name):
+        count = self._counts.get(name)
+        return self._sums[name] / count if count else None
+
+    def to_row(self, key):
+        time_window, host, unit_name, container = key
+        row = {'time_window': time_window, 'host': host,
+               'unit_name': unit_name, 'container': container}
+        for _, column in MEASUREMENTS:
+            row[column] = self.get(column)
+        for column in ('cpu', 'memory', 'rxb', 'txb'):
+            if row[column] is None:
+                row[column] = 0.0
+        fs_data = {}
+        for name in self._counts:
+            if isinstance(name, tuple):
+                resource_id, index = name
+                fs_data.setdefault(resource_id, [None, None])[index] = \
+                    self.get(name)
+        row['fs_data'] = json.dumps(fs_data) if fs_data else None
+        return row
+
+
+def _heapster_query(measurement, start, end, group_by):
+    return (
+        'select mean(value) from "{measurement}" '
+        "where (type = 'node' or type = 'pod' or type = 'pod_container') "
+        'and time >= {start}s and time < {end}s '
+        'group by time({period}s), {group_by} fill(none);'.format(
+            measurement=measurement, start=start, end=end,
+            period=StatWrap5Min.period,
+            group_by=', '.join('"{0}"'.format(tag) for tag in group_by)))
+
+
+def _row_key(time_window, tags):
+    """Key of a row for tags of Heapster series.
+    Hosts have empty pod and container, pods have empty container.
+    """
+    type_ = tags.get('type')
+    unit_name = container = ''
+    if type_ != 'node':
+        unit_name = tags.get('namespace_name') or ''
+    if type_ == 'pod_container':
+        container = tags.get('container_name') or ''
+    return (_floor(time_window, StatWrap5Min.period),
+            tags.get('nodename') or '', unit_name, container)
+
+
+def fetch_heapster_rows(start, end):
+    """Averages Heapster series over 5-minute windows in [start, end).
+
+    :param start: unix timestamp, multiple of 5 minutes
+    :param end: unix timestamp, multiple of 5 minutes
+    :return: list of dicts of `StatWrap5Min` columns
+    """
+    tags = ('type', 'nodename', 'namespace_name', 'container_name')
+    names = [column for _, column in MEASUREMENTS] + \
+        [(None, index) for index, _ in enumerate(FS_MEASUREMENTS)]
+    query_str = ' '.join(
+        [_heapster_query(measurement, start, end, tags)
+         for measurement, _ in MEASUREMENTS] +
+        [_heapster_query(measurement, start, end, tags + ('resource_id',))
+         for measurement in FS_MEASUREMENTS])
+    results = _query(query_str, epoch='s')['results']
+    rows = defaultdict(_Averages)
+    for name, result in zip(names, results):
+        for series in result.get('series', ()):
+            series_tags = series.get('tags') or {}
+            value_name = name
+            if isinstance(name, tuple):
+                value_name = (series_tags.get('resource_id'), name[1])
+            for time_window, value in series['values']:
+                rows[_row_key(time_window, series_tags)].add(
+                    value_name, value)
+    return [averages.to_row(key) for key, averages in rows.iteritems()]
+
+
+def aggregate_rows(source, model, start, end):
+    """Averages rows of `source` tier in [start, end) over periods of
+    `model` tier.
+
+    :return: list of dicts of `model` columns
+    """
+    rows = defaultdict(_Averages)
+    query = source.query.filter(source.time_window >= start,
+                                source.time_window < end)
+    for item in query:
+        row = rows[(_floor(item.time_window, model.period),
+                    item.host, item.unit_name, item.container)]
+        for _, column in MEASUREMENTS:
+            row.add(column, getattr(item, column))
+        if item.fs_data:
+            for resource_id, values in json.loads(item.fs_data).iteritems():
+                for index, value in enumerate(values):
+                    row.add((resource_id, index), value)
+    return [averages.to_row(key) for key, averages in rows.iteritems()]
+
+
+def _progress_key(model):
+    return PROGRESS_KEY_PREFIX + model.__tablename__
+
+
+def get_rolled_until(model):
+    """Returns the end of the last rolled up range of the tier (unix
+    timestamp) or None if nothing has been rolled up yet.
+    """
+    value = ConnectionPool.get_connection().get(_progress_key(model))
+    if value is not None:
+        return int(value)
+    last = db.session.query(db.func.max(model.time_window)).scalar()
+    return None if last is None else last + model.period
+
+
+def _save(model, start, end, rows):
+    # windows are rolled up when they are complete, so rows are never
+    # updated, but a range is rolled up again if saving of progress failed
+    model.query.filter(model.time_window >= start,
+                       model.time_window < end).delete()
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
+    db.session.commit()
+    ConnectionPool.get_connection().set(_progress_key(model), end)
+
+
+def _rollup_heapster(now):
+    model = StatWrap5Min
+    end = _floor(now - ROLLUP_DELAY, model.period)
+    start = get_rolled_until(model)
+    start = end - MAX_HEAPSTER_RANGE if start is None \
+        else max(start, end - MAX_HEAPSTER_RANGE)
+    if start < end:
+        _save(model, start, end, fetch_heapster_rows(start, end))
+
+
+def _rollup_tier(source, model):
+    source_end = get_rolled_until(source)
+    if source_end is None:
+        return
+    end = _floor(source_end, model.period)
+    start = get_rolled_until(model)
+    if start is None:
+        first = db.session.query(db.func.min(source.time_window)).scalar()
+        if first is None:
+            return
+        start = _floor(first, model.period)
+    if start < end:
+        _save(model, start, end, aggregate_rows(source, model, start, end))
+
+
+def _cleanup(model, now):
+    retention = RETENTION[model]
+    if retention is not None:
+        model.query.filter(model.time_window < now - retention).delete()
+        db.session.commit()
+
+
+def rollup(now=None):
+    """Rolls up all complete windows of all tiers and deletes outdated
+    rows.
+    """
+    now = int(time.time()) if now is None else now
+    _rollup_heapster(now)
+    for source, model in zip(TIERS, TIERS[1:]):
+        _rollup_tier(source, model)
+    for model in TIERS:
+        _cleanup(model, now)
+
+
+@celery.task(ignore_result=True)
+def rollup_stats():
+    lock = ExclusiveLock(LOCK_NAME, ttl=LOCK_TTL)
+    if not lock.lock():
+        current_app.logger.warning('Previous stats rollup is in progress')
+        return
+    try:
+        rollup()
+    finally:
+        lock.release()
+
+
+def get_tier(start, end):
+    """Returns the coarsest tier suitable for the range, or None if the
+    range is short enough to be read from Heapster directly.
+
+    :param start: naive UTC datetime
+    :param end: naive UTC datetime
+    """
+    length = (end - start).total_seconds()
+    tier = None
+    for model in TIERS:
+        if length > TIER_MIN_RANGE[model]:
+            tier = model
+    return tier
+
+
+def _get_stat(model, start, end, host=None, unit_name='', container=''):
+    start = _floor(_timestamp(start), model.period)
+    query = model.query.filter(
+        model.time_window >= start, model.time_window < _timestamp(end),
+        model.unit_name == unit_name, model.container == container)
+    if host is not None:
+        query = query.filter(model.host == host)
+    data = defaultdict(list)
+    fs_data = defaultdict(lambda: ([], []))
+    for row in query.order_by(model.time_window):
+        time_ = datetime.utcfromtimestamp(row.time_window).strftime(
+            TIME_FORMAT)
+        for measurement, column in MEASUREMENTS:
+            value = getattr(row, column)
+            if value is not None:
+                data[measurement].append(Point(time_, value))
+        if row.fs_data:
+            for resource_id, values in json.loads(row.fs_data).iteritems():
+                for points, value in zip(fs_data[resource_id], values):
+                    if value is not None:
+                        points.append(Point(time_, value))
+    result = {measurement: data[measurement]
+              for measurement, _ in MEASUREMENTS}
+    for index, measurement in enumerate(FS_MEASUREMENTS):
+        result[measurement] = [
+            {'resource_id': resource_id, 'values': fs_data[resource_id][index]}
+            for resource_id in sorted(fs_data)]
+    return result
+
+
+def get_node_stat(model, nodename, start, end):
+    """Same as `kubestat.get_node_stat`, but reads the tier."""
+    return _get_stat(model, start, end, host=nodename)
+
+
+def get_pod_stat(model, pod_name, start, end):
+    """Same as `kubestat.get_pod_stat`, but reads the tier."""
+    return _get_stat(model, start, end, unit_name=pod_name)
+
+
+def get_container_stat(model, pod_name, container_name, start, end):
+    """Same as `kubestat.get_container_stat`, but reads the tier."""
+    return _get_stat(model, start, end, unit_name=pod_name,
+                     container=container_name)
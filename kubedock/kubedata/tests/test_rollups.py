@@ -0,0 +1,194 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import json
+import re
+import unittest
+import urlparse
+from datetime import datetime, timedelta
+
+import responses
+
+from kubedock import settings
+from kubedock.core import ConnectionPool, db
+from kubedock.kubedata import kubestat, rollups
+from kubedock.stats import StatWrap5Min, StatWrapHour, StatWrapDay
+from kubedock.testutils.testcases import DBTestCase
+
+DAY = 1499990400  # 2017-07-14 00:00:00 UTC
+# heapster data of DAY is rolled up by the first run, the day is complete
+NOW = DAY + 24 * 60 * 60 + rollups.ROLLUP_DELAY
+INFLUXDB_URL = 'http://{0}:{1}/query'.format(settings.INFLUXDB_HOST,
+                                             settings.INFLUXDB_PORT)
+
+
+class FakeInfluxDB(object):
+    """Answers rollup queries with series of `measurements`:
+    {measurement: [(tags, [[time, mean], ...]), ...]}.
+    """
+
+    def __init__(self, measurements):
+        self.measurements = measurements
+        self.queries = []
+
+    def __call__(self, request):
+        params = urlparse.parse_qs(urlparse.urlparse(request.url).query)
+        self.queries.append(params)
+        results = []
+        for statement in params['q'][0].split(';'):
+            match = re.search(r'from "([^"]+)".*time >= (\d+)s '
+                              r'and time < (\d+)s', statement)
+            if match is None:
+                continue
+            measurement, start, end = match.groups()
+            series = []
+            for tags, values in self.measurements.get(measurement, ()):
+                values = [value for value in values
+                          if int(start) <= value[0] < int(end)]
+                if values:
+                    series.append({'name': measurement, 'tags': tags,
+                                   'columns': ['time', 'mean'],
+                                   'values': values})
+            results.append({'series': series} if series else {})
+        return 200, {}, json.dumps({'results': results})
+
+
+class TestRollups(DBTestCase):
+    def setUp(self):
+        self.addCleanup(ConnectionPool.get_connection().delete,
+                        *[rollups._progress_key(model)
+                          for model in rollups.TIERS])
+        node = {'type': 'node', 'nodename': 'node1'}
+        pod = {'type': 'pod', 'nodename': 'node1', 'namespace_name': 'pod1'}
+        container = {'type': 'pod_container', 'nodename': 'node1',
+                     'namespace_name': 'pod1', 'container_name': 'web'}
+        self.influxdb = FakeInfluxDB({
+            'cpu/usage_rate': [
+                (node, [[DAY, 100], [DAY + 300, 300]]),
+                (pod, [[DAY, 50]]),
+                (container, [[DAY, 40]]),
+            ],
+            'memory/request': [(pod, [[DAY, 1024]])],
+            'filesystem/usage': [
+                (dict(node, resource_id='/dev/sda1'), [[DAY, 10]])],
+            'filesystem/limit': [
+                (dict(node, resource_id='/dev/sda1'), [[DAY, 100]])],
+        })
+        responses.add_callback(responses.GET, INFLUXDB_URL, self.influxdb)
+
+    @responses.activate
+    def test_rollup_fills_all_tiers(self):
+        rollups.rollup(now=NOW)
+
+        params = self.influxdb.queries[0]
+        self.assertEqual(params['epoch'], ['s'])
+        self.assertIn('group by time(300s)', params['q'][0])
+
+        rows = {(row.time_window, row.unit_name, row.container): row
+                for row in StatWrap5Min.query}
+        self.assertEqual(len(rows), 4)
+        node = rows[(DAY, '', '')]
+        self.assertEqual((node.host, node.cpu, node.memory_limit),
+                         ('node1', 100, None))
+        self.assertEqual(json.loads(node.fs_data), {'/dev/sda1': [10, 100]})
+        self.assertEqual(rows[(DAY + 300, '', '')].cpu, 300)
+        pod = rows[(DAY, 'pod1', '')]
+        self.assertEqual((pod.cpu, pod.memory, pod.memory_limit),
+                         (50, 0, 1024))
+        self.assertEqual(rows[(DAY, 'pod1', 'web')].cpu, 40)
+
+        for model in (StatWrapHour, StatWrapDay):
+            rows = {(row.unit_name, row.container): row
+                    for row in model.query}
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(rows[('', '')].time_window, DAY)
+            self.assertEqual(rows[('', '')].cpu, 200)
+            self.assertEqual(json.loads(rows[('', '')].fs_data),
+                             {'/dev/sda1': [10, 100]})
+            self.assertEqual(rows[('pod1', '')].memory_limit, 1024)
+
+    @responses.activate
+    def test_windows_are_rolled_up_once(self):
+        rollups.rollup(now=NOW)
+        rollups.rollup(now=NOW + 60)
+        self.assertEqual(len(self.influxdb.queries), 1)
+
+        rollups.rollup(now=NOW + 5 * 60)
+        self.assertEqual(len(self.influxdb.queries), 2)
+        end = DAY + 24 * 60 * 60
+        self.assertIn('time >= {0}s and time < {1}s'.format(end, end + 300),
+                      self.influxdb.queries[1]['q'][0])
+        self.assertEqual(StatWrapHour.query.count(), 3)
+
+    @responses.activate
+    def test_outdated_rows_are_deleted(self):
+        db.session.add(StatWrap5Min(time_window=DAY - 8 * 24 * 60 * 60,
+                                    host='node1', unit_name='', container=''))
+        db.session.commit()
+        rollups.rollup(now=NOW)
+        self.assertEqual(StatWrap5Min.query.filter(
+            StatWrap5Min.time_window < DAY).count(), 0)
+        self.assertEqual(StatWrapDay.query.filter(
+            StatWrapDay.time_window < DAY).count(), 1)
+
+
+class TestRollupsReading(DBTestCase):
+    def test_get_tier(self):
+        end = datetime(2017, 7, 14)
+        self.assertIsNone(rollups.get_tier(end - timedelta(hours=1), end))
+        self.assertIs(rollups.get_tier(end - timedelta(hours=12), end),
+                      StatWrap5Min)
+        self.assertIs(rollups.get_tier(end - timedelta(days=7), end),
+                      StatWrapHour)
+        self.assertIs(rollups.get_tier(end - timedelta(days=365), end),
+                      StatWrapDay)
+
+    @responses.activate
+    def test_long_ranges_are_read_from_tiers(self):
+        for hour in range(3):
+            db.session.add(StatWrapHour(
+                time_window=DAY + hour * 3600, host='node1', unit_name='pod1',
+                container='', cpu=hour, memory_limit=1024))
+        db.session.add(StatWrapHour(
+            time_window=DAY, host='node1', unit_name='', container='',
+            cpu=500, fs_data=json.dumps({'/dev/sda1': [10, None]})))
+        db.session.commit()
+        start = datetime.utcfromtimestamp(DAY + 3600)
+        end = start + timedelta(days=7)
+
+        data = kubestat.get_pod_stat('pod1', start, end)
+        self.assertEqual(
+            [(p.time, p.value) for p in data['cpu/usage_rate']],
+            [('2017-07-14T01:00:00Z', 1), ('2017-07-14T02:00:00Z', 2)])
+        self.assertEqual(len(data['memory/request']), 2)
+        self.assertEqual(data['network/rx_rate'][0].value, 0)
+
+        data = kubestat.get_node_stat('node1', start - timedelta(hours=1),
+                                      end)
+        self.assertEqual([p.value for p in data['cpu/usage_rate']], [500])
+        self.assertEqual(data['memory/request'], [])
+        self.assertEqual(data['filesystem/limit'],
+                         [{'resource_id': '/dev/sda1', 'values': []}])
+        self.assertEqual(data['filesystem/usage'][0]['values'][0].value, 10)
+        self.assertEqual(len(responses.calls), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,14 +22,16 @@ import gevent
 import json
 import os
 import requests
+from collections import defaultdict
 from datetime import datetime
+from gevent.select import select
 from socket import error as socket_error
 from paramiko.ssh_exception import SSHException
 from websocket import (create_connection, WebSocketException,
                        WebSocketConnectionClosedException)
 
 from flask import current_app
-from .core import ConnectionPool, ssh_connect, db
+from .core import ConnectionPool, ssh_pool, db
 from .billing.models import Kube
 from .nodes.models import Node
 from .pods.models import Pod, PersistentDisk
@@ -46,6 +48,7 @@ from .kapi.lbpoll import LoadBalanceService
 from .kapi.pstorage import (
     get_storage_class_by_volume_info, LocalStorage, STORAGE_CLASS)
 from .kapi import helpers
+from .kapi import node_informer, pod_events, service_informer
 from . import tasks
 
 
@@ -60,6 +63,14 @@ ETCD_POD_STATES = 'pod_states'
 ETCD_POD_STATES_URL = ETCD_URL.format('/'.join([
     ETCD_KUBERDOCK, ETCD_POD_STATES]))
 MAX_ATTEMPTS = 10
+# Max number of watch events processed in one transaction
+MAX_BATCH_SIZE = 500
+# Notifiers of listeners get a heartbeat if there were no events for that
+# number of seconds, so they can tell a quiet watch from a dead listener
+HEARTBEAT_INTERVAL = 30
+# Fs limits for containers of a node are collected during this number of
+# seconds and then applied by one call of fslimit.py
+FSLIMIT_DELAY = 1.5
 # How ofter we will send error about listener reconnection to sentry
 ERROR_TIMEOUT = 3 * 60  # in seconds
 LISTENER_PROBLEM_MSG = ("Problems in the listeners module have been "
@@ -123,7 +134,9 @@ def process_pods_event(data, app, event_time=None, live=True):
 
     host = pod['spec'].get('nodeName')
 
-    update_states(pod, event_type=event_type, event_time=event_time)
+    # transaction is managed by the caller (see process_records)
+    update_states(pod, event_type=event_type, event_time=event_time,
+                  commit=False)
 
     if event_type == 'MODIFIED':
         # fs limits
@@ -140,30 +153,28 @@ def process_pods_event(data, app, event_time=None, live=True):
                 container_id = container['containerID'].split('docker://')[-1]
                 containers[container_name] = container_id
         if containers:
-            set_limit(host, pod_id, containers, app)
+            fs_limits.schedule(host, pod_id, containers, app)
+    elif event_type == 'DELETED':
+        fs_limits.forget(host, [
+            container['containerID'].split('docker://')[-1]
+            for container in pod['status'].get('containerStatuses', [])
+            if 'containerID' in container])
 
 
-# TODO: put it in some other place if needed.
-# It was moved from utils to resolve
-# circular imports (Kube model)
-def set_limit(host, pod_id, containers, app):
-    ssh, errors = ssh_connect(host)
-    if errors:
-        current_app.logger.warning(
-            "Can't connect to {}, {}".format(host, errors))
-        return False
-    spaces = dict(
+def get_kube_spaces():
+    return dict(
         (i, (s, u)) for i, s, u in Kube.query.values(
             Kube.id, Kube.disk_space, Kube.disk_space_units
         )
     )  # workaround
 
-    pod = Pod.query.filter_by(id=pod_id).first()
-
-    if pod is None:
-        unregistered_pod_warning(pod_id)
-        return False
 
+def get_pod_limits(pod, containers, spaces):
+    """Returns list of (container id, disk space limit) for the pod.
+    :param pod: Pod model instance
+    :param containers: dict of container names to container ids
+    :param spaces: result of `get_kube_spaces`
+    """
     config = json.loads(pod.config)
     kube_type = pod.kube_id
     # kube = Kube.query.get(kube_type) this query raises an exception
@@ -180,23 +191,108 @@ def set_limit(host, pod_id, containers, app):
             disk_space_unit = ''
         disk_space_str = '{0}{1}'.format(disk_space, disk_space_unit)
         limits.append((containers[container_name], disk_space_str))
+    return limits
+
+
+class FsLimitBatcher(object):
+    """Debounces setting of fs limits for containers.
+    Containers of all pods of a node are collected for `delay` seconds and
+    then limits are applied by one call of fslimit.py. Limits which were
+    already applied are remembered per node and are not applied again.
+    """
+
+    def __init__(self, delay=FSLIMIT_DELAY):
+        self.delay = delay
+        # host -> {pod_id: {container_name: container_id}}
+        self._pending = {}
+        # host -> {container_id: limit}
+        self._applied = defaultdict(dict)
+
+    def schedule(self, host, pod_id, containers, app):
+        applied = self._applied.get(host, {})
+        containers = dict((name, container_id)
+                          for name, container_id in containers.iteritems()
+                          if container_id not in applied)
+        if not containers:
+            return
+        pending = self._pending.get(host)
+        if pending is None:
+            pending = self._pending[host] = {}
+            gevent.spawn_later(self.delay, self.flush, host, app)
+        pending.setdefault(pod_id, {}).update(containers)
+
+    def forget(self, host, container_ids):
+        applied = self._applied.get(host)
+        if applied:
+            for container_id in container_ids:
+                applied.pop(container_id, None)
+
+    def flush(self, host, app):
+        pending = self._pending.pop(host, None)
+        if not pending:
+            return True
+        with app.app_context():
+            spaces = get_kube_spaces()
+            pods = Pod.query.filter(Pod.id.in_(pending.keys()))
+            applied = self._applied[host]
+            limits = []
+            found = set()
+            for pod in pods:
+                found.add(pod.id)
+                limits.extend(
+                    (container_id, limit) for container_id, limit
+                    in get_pod_limits(pod, pending[pod.id], spaces)
+                    if applied.get(container_id) != limit)
+            for pod_id in set(pending) - found:
+                unregistered_pod_warning(pod_id)
+            if not limits:
+                return True
+            if not apply_limits(host, limits):
+                return False
+            applied.update(limits)
+        return True
+
+
+fs_limits = FsLimitBatcher()
+
+
+# TODO: put it in some other place if needed.
+# It was moved from utils to resolve
+# circular imports (Kube model)
+def set_limit(host, pod_id, containers, app):
+    spaces = get_kube_spaces()
+
+    pod = Pod.query.filter_by(id=pod_id).first()
+
+    if pod is None:
+        unregistered_pod_warning(pod_id)
+        return False
+
+    return apply_limits(host, get_pod_limits(pod, containers, spaces))
+
+
+def apply_limits(host, limits):
+    """Runs fslimit.py on the host for list of (container id, limit)."""
     limits_repr = ' '.join('='.join(limit) for limit in limits)
     try:
-        _, o, e = ssh.exec_command(
-            'python /var/lib/kuberdock/scripts/fslimit.py containers '
-            '{0}'.format(limits_repr)
-        )
-        exit_status = o.channel.recv_exit_status()
-        if exit_status > 0:
-            current_app.logger.error(
-                'Error fslimit.py with exit status {}, {},{}'.format(
-                    exit_status, o.read(), e.read()))
-            return False
+        with ssh_pool.connect(host) as (ssh, errors):
+            if errors:
+                current_app.logger.warning(
+                    "Can't connect to {}, {}".format(host, errors))
+                return False
+            _, o, e = ssh.exec_command(
+                'python /var/lib/kuberdock/scripts/fslimit.py containers '
+                '{0}'.format(limits_repr)
+            )
+            exit_status = o.channel.recv_exit_status()
+            if exit_status > 0:
+                current_app.logger.error(
+                    'Error fslimit.py with exit status {}, {},{}'.format(
+                        exit_status, o.read(), e.read()))
+                return False
     except SSHException:
         current_app.logger.warning("Can't set fslimit", exc_info=True)
         return False
-    finally:
-        ssh.close()
     return True
 
 
@@ -505,7 +601,112 @@ def prelist_version(url):
                         'Request result is {0}'.format(res.text))
 
 
-def listen_fabric(watch_url, list_url, func, k8s_json_object_hook=None):
+def get_event_object_key(data):
+    """Returns key that identifies object of the watch event."""
+    metadata = data['object']['metadata']
+    return metadata.get('uid') or (metadata.get('namespace'),
+                                   metadata.get('name'))
+
+
+def get_event_type(data):
+    return data['type']
+
+
+def get_event_version(data):
+    return int(data['object']['metadata']['resourceVersion'])
+
+
+def get_pod_transition(data):
+    """Returns part of the pod event that is important for `update_states`:
+    event type, pod phase and container states. Pod events with the same
+    transition differ only in details which the latest of them has anyway.
+    """
+    status = data['object'].get('status', {})
+    return data['type'], status.get('phase'), status.get('startTime'), tuple(
+        (container.get('name'), container.get('containerID'),
+         tuple(sorted(container.get('state') or {})),
+         tuple(sorted(container.get('lastState') or {})))
+        for container in status.get('containerStatuses') or [])
+
+
+def coalesce_events(events, key=get_event_object_key, transition_key=None):
+    """Collapses events of the same object to the latest one.
+    If `transition_key` is passed, events of the object are collapsed only
+    while the transition key stays the same, so all transitions are kept.
+
+    :param events: events in order they were received
+    :param key: callable that returns key of the event object
+    :param transition_key: optional callable that returns the event state
+    :returns: list of the remaining events in order they were received
+    """
+    result = []
+    latest = {}
+    for event in events:
+        object_key = key(event)
+        state = transition_key(event) if transition_key is not None else None
+        if object_key in latest and latest[object_key][0] == state:
+            result[latest[object_key][1]] = None
+        latest[object_key] = (state, len(result))
+        result.append(event)
+    return [event for event in result if event is not None]
+
+
+def has_pending_messages(ws, timeout=0):
+    """Checks if the next message may be received from websocket
+    without waiting (or waiting at most `timeout` seconds)."""
+    sock = ws.sock
+    if sock is None:
+        return False
+    if getattr(sock, 'pending', None) is not None and sock.pending():
+        return True
+    return bool(select([sock], [], [], timeout)[0])
+
+
+def recv_batch(ws, max_size=MAX_BATCH_SIZE):
+    """Waits for a message and takes all messages that are already available.
+
+    :returns: list of received messages
+    """
+    batch = [ws.recv()]
+    while len(batch) < max_size and has_pending_messages(ws):
+        batch.append(ws.recv())
+    return batch
+
+
+def process_events_batch(func, batch, app, skip_failed=False):
+    """Processes events one by one in one transaction.
+
+    :param skip_failed: process every event in a separate transaction and
+        skip failed ones instead of failing the whole batch
+    """
+    # Because listeners aren't managed by flask we
+    # have to do all transaction management manually
+    if not skip_failed:
+        with session_scope(db.session):
+            for data in batch:
+                func(data, app)
+        return
+    for data in batch:
+        try:
+            with session_scope(db.session):
+                func(data, app)
+        except Exception:
+            send_event_to_role(
+                'notify:error', {'message': LISTENER_PROBLEM_MSG}, 'Admin')
+            current_app.logger.error(
+                'skip event {}'.format(data), exc_info=True)
+
+
+def listen_fabric(watch_url, list_url, func, k8s_json_object_hook=None,
+                  notifier=None):
+    """Makes listener of k8s watch which processes events by `func`.
+
+    :param notifier: optional object which is told when the watch is
+        connected or disconnected, gets every processed batch of events and
+        a heartbeat every HEARTBEAT_INTERVAL seconds without events (see
+        `pod_events.WatchNotifier`, `node_informer.NodeInformer`,
+        `service_informer.ServiceInformer`)
+    """
     fn_name = func.func_name
     redis_key = 'LAST_EVENT_' + fn_name
 
@@ -529,6 +730,8 @@ def listen_fabric(watch_url, list_url, func, k8s_json_object_hook=None):
                         # Only after connection to ensure last_saved was correct
                         # before save it to redis
                         redis.set(redis_key, last_saved)
+                        if notifier is not None:
+                            notifier.connected()
                     except (socket_error, WebSocketException) as e:
                         now = datetime.now()
                         logger = current_app.logger.warning
@@ -541,40 +744,51 @@ def listen_fabric(watch_url, list_url, func, k8s_json_object_hook=None):
                         gevent.sleep(0.1)
                         continue
                     while True:
-                        content = ws.recv()
-                        data = json.loads(content,
-                                          object_hook=k8s_json_object_hook)
-                        if data['type'].lower() == 'error' and \
-                           '401' in data['object']['message']:
+                        if notifier is not None and ws.sock is not None and \
+                                not has_pending_messages(
+                                    ws, timeout=HEARTBEAT_INTERVAL):
+                            notifier.heartbeat()
+                            continue
+                        batch, rewind = [], False
+                        for content in recv_batch(ws):
+                            data = json.loads(content,
+                                              object_hook=k8s_json_object_hook)
+                            if data['type'].lower() == 'error' and \
+                               '401' in data['object']['message']:
+                                rewind = True
+                                break
+                            data = filter_event(data, app)
+                            if data:
+                                batch.append(data)
+                        last_saved = int(redis.get(redis_key) or '0')
+                        batch = [event for event in batch
+                                 if get_event_version(event) > last_saved]
+                        if batch:
+                            process_events_batch(
+                                func, coalesce_events(
+                                    batch, transition_key=get_event_type),
+                                app,
+                                skip_failed=retry >= MAX_ATTEMPTS)
+                            redis.set(redis_key, max(
+                                get_event_version(event) for event in batch))
+                            if notifier is not None:
+                                notifier.notify(batch)
+                        elif notifier is not None:
+                            notifier.heartbeat()
+                        retry = 0
+                        if rewind:
                             # Rewind to earliest possible
                             new_version = str(int(prelist_version(list_url)) -
                                               MAX_ETCD_VERSIONS)
                             redis.set(redis_key, new_version)
                             break
-                        data = filter_event(data, app)
-                        if not data:
-                            continue
-                        evt_version = data['object']['metadata']['resourceVersion']
-                        last_saved = redis.get(redis_key)
-                        if int(evt_version) > int(last_saved or '0'):
-                            if retry < MAX_ATTEMPTS:
-                                # Because listeners aren't managed by flask we
-                                # have to do all transaction management manually
-                                with session_scope(db.session):
-                                    func(data, app)
-                            else:
-                                send_event_to_role(
-                                    'notify:error',
-                                    {'message': LISTENER_PROBLEM_MSG},
-                                    'Admin')
-                                current_app.logger.error(
-                                    'skip event {}'.format(data), exc_info=True)
-
-                            redis.set(redis_key, evt_version)
-                        retry = 0
                 except KeyboardInterrupt:
+                    if notifier is not None:
+                        notifier.disconnected()
                     break
                 except Exception as e:
+                    if notifier is not None:
+                        notifier.disconnected()
                     retry += 1
                     if not (isinstance(e, WebSocketConnectionClosedException)
                             and e.message == 'Connection is already closed.'):
@@ -676,62 +890,86 @@ def listen_fabric_etcd(url):
 
 
 def process_records(app, nodes):
+    """Processes pod events stored in etcd in one transaction.
+    Repeated events of the same pod are collapsed keeping all transitions
+    needed to build pod timeline."""
+    # TODO: for now send all prelist event to process,
+    # but there are no need to send old events to frontend,
+    # just need to save them to db. Need to have separate method
+    # or filter old events by time.
+    records = []
     for node in nodes:
-        # TODO: for now send all prelist event to process,
-        # but there are no need to send old events to frontend,
-        # just need to save them to db. Need to have separate method
-        # or filter old events by time.
         try:
-            key = node['key']
-            for _ in range(MAX_ATTEMPTS):
-                _, ts = key.rsplit('/', 1)
-                obj = node['value']
-                k8s_obj = json.loads(obj, object_hook=k8s_json_object_hook)
-                k8s_obj = filter_event(k8s_obj, app)
-                event_time = datetime.fromtimestamp(float(ts))
-                if k8s_obj is not None:
-                    try:
-                        process_pods_event(k8s_obj, app, event_time, live=True)
-                        break
-                    except Exception:
-                        current_app.logger.warning(
-                            "Error while process event {}".format(node),
-                            exc_info=True)
-
-            else:
-                # max_attempts exceeded, we skip event
-                send_event_to_role(
-                    'notify:error', {'message': LISTENER_PROBLEM_MSG}, 'Admin')
-                current_app.logger.error(
-                    'skip event {}'.format(node), exc_info=True)
+            _, ts = node['key'].rsplit('/', 1)
+            k8s_obj = json.loads(node['value'],
+                                 object_hook=k8s_json_object_hook)
+            k8s_obj = filter_event(k8s_obj, app)
+            if k8s_obj is not None:
+                records.append((k8s_obj, datetime.fromtimestamp(float(ts))))
         except:
             current_app.logger.exception(
                 "Error while parse event {}".format(node))
-        finally:
-            # at the end we remove node anyway
-            r = requests.delete(ETCD_URL.format(key))
+    records = coalesce_events(
+        records, key=lambda record: get_event_object_key(record[0]),
+        transition_key=lambda record: get_pod_transition(record[0]))
+    try:
+        try:
+            with session_scope(db.session):
+                for k8s_obj, event_time in records:
+                    process_pods_event(k8s_obj, app, event_time, live=True)
+        except Exception:
+            current_app.logger.warning(
+                "Error while process events batch, process them one by one",
+                exc_info=True)
+            for k8s_obj, event_time in records:
+                process_record(k8s_obj, app, event_time)
+    finally:
+        # at the end we remove nodes anyway
+        etcd = requests.Session()
+        for node in nodes:
+            r = etcd.delete(ETCD_URL.format(node['key']))
             # don't know what we can do more, just log it
             if not r.ok:
                 current_app.logger.warning(
                     "error while delete:{}".format(r.text))
 
 
+def process_record(k8s_obj, app, event_time):
+    """Processes one pod event in a separate transaction with retries."""
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            with session_scope(db.session):
+                process_pods_event(k8s_obj, app, event_time, live=True)
+            return
+        except Exception:
+            current_app.logger.warning(
+                "Error while process event {}".format(k8s_obj),
+                exc_info=True)
+    # max_attempts exceeded, we skip event
+    send_event_to_role(
+        'notify:error', {'message': LISTENER_PROBLEM_MSG}, 'Admin')
+    current_app.logger.error('skip event {}'.format(k8s_obj))
+
+
 listen_pods = listen_fabric(
     get_api_url('pods', namespace=False, watch=True),
     get_api_url('pods', namespace=False),
-    process_pods_event_k8s
+    process_pods_event_k8s,
+    notifier=pod_events.WatchNotifier()
 )
 
 listen_services = listen_fabric(
     get_api_url('services', namespace=False, watch=True),
     get_api_url('services', namespace=False),
-    process_service_event_k8s
+    process_service_event_k8s,
+    notifier=service_informer.informer
 )
 
 listen_nodes = listen_fabric(
     get_api_url('nodes', namespace=False, watch=True),
     get_api_url('nodes', namespace=False),
-    process_nodes_event
+    process_nodes_event,
+    notifier=node_informer.informer
 )
 
 listen_events = listen_fabric(
@@ -28,10 +28,17 @@ from .kapi.network_policies import (
     get_dns_policy_config,
     get_logs_policy_config,
     get_master_host_endpoint,
+    get_node_allowed_ports_policy,
+    get_node_host_endpoint_policy,
+    get_pod_restricted_ports_policy,
     get_rhost_policy,
     get_tiers,
 )
-from .kapi.node_utils import complete_calico_node_config
+from .kapi.node_utils import (
+    ETCD_ENDPOINT_TO_HOST_ACTION_KEY,
+    NODES_POLICY_COUNT,
+    get_calico_host_endpoint,
+)
 from .kapi.nodes import (
     KUBERDOCK_DNS_POD_NAME,
     get_kuberdock_logs_pod_name,
@@ -40,82 +47,158 @@ from .nodes.models import Node, RegisteredHost
 from .pods.models import Pod
 from .restricted_ports.models import RestrictedPort
 from .settings import (
+    ETCD_ALLOWED_PORT_KEY_PATH,
     ETCD_CALICO_POLICY_PATH,
     ETCD_CALICO_V_PATH,
     ETCD_NETWORK_POLICY_HOSTS_KEY,
+    ETCD_NETWORK_POLICY_NODES_KEY,
     ETCD_NETWORK_POLICY_SERVICE_KEY,
+    ETCD_RESTRICTED_PORT_KEY_PATH,
     ETCD_HOST,
     ETCD_PORT,
 )
 from .users.models import User
 from .utils import get_hostname
 
+ETCD_CALICO_HOST_PATH = ETCD_CALICO_V_PATH + '/host'
 
-def create_network_policies():
-    client = etcd.Client(host=ETCD_HOST, port=ETCD_PORT)
 
-    # master endpoint
-    master_hostname = get_hostname()
-    master_endpoint_key = '/'.join([ETCD_CALICO_V_PATH,
-                                    'host', master_hostname,
-                                    'endpoint', master_hostname])
-    master_endpoint = get_master_host_endpoint()
-    client.write(master_endpoint_key, json.dumps(master_endpoint))
-
-    # populate policies
-    for tier_name, tier in get_tiers().items():
-        tier_key = '/'.join([ETCD_CALICO_POLICY_PATH, tier_name])
-        tier_metadata = '/'.join([tier_key, 'metadata'])
-        tier_policy = '/'.join([tier_key, 'policy'])
+def _host_endpoint_key(hostname):
+    return '/'.join([ETCD_CALICO_HOST_PATH, hostname, 'endpoint', hostname])
+
 
-        try:
-            client.delete(tier_key, recursive=True)
-        except etcd.EtcdKeyNotFound:
-            pass
+def _host_config_key(hostname, name):
+    return '/'.join([ETCD_CALICO_HOST_PATH, hostname, 'config', name])
 
-        client.write(tier_metadata, json.dumps({'order': tier['order']}))
 
+def get_policies_tree(tiers):
+    """Builds desired content of calico tiers which are managed by KuberDock:
+    tiers metadata and policies, policies of nodes, registered hosts,
+    allowed and restricted ports and service pods.
+
+    :param tiers: tiers config (see `get_tiers`)
+    :returns: dict of etcd key -> value
+    """
+    tree = {}
+    for tier_name, tier in tiers.items():
+        tier_key = '/'.join([ETCD_CALICO_POLICY_PATH, tier_name])
+        tree[tier_key + '/metadata'] = json.dumps({'order': tier['order']})
         for policy_name, policy in tier.get('policies', {}).items():
-            policy_key = '/'.join([tier_policy, policy_name])
-            client.write(policy_key, json.dumps(policy))
+            tree['/'.join([tier_key, 'policy', policy_name])] = \
+                json.dumps(policy)
 
-    # nodes policies
-    for node in Node.query:
-        complete_calico_node_config(node.hostname, node.ip)
+    nodes = Node.query.all()
+    for node in nodes:
+        policies = get_node_host_endpoint_policy(node.hostname, node.ip)
+        for i in range(NODES_POLICY_COUNT):
+            key = '{0}/{1}-{2}'.format(ETCD_NETWORK_POLICY_NODES_KEY, i,
+                                       node.hostname)
+            tree[key] = json.dumps(policies[i])
 
-    # rhosts policies
     for rhost in RegisteredHost.query:
-        rhost_policy_key = '/'.join([ETCD_NETWORK_POLICY_HOSTS_KEY,
-                                     rhost.host])
-        rhost_policy = get_rhost_policy(rhost.host, rhost.tunnel_ip)
-        client.write(rhost_policy_key, json.dumps(rhost_policy))
+        key = '/'.join([ETCD_NETWORK_POLICY_HOSTS_KEY, rhost.host])
+        tree[key] = json.dumps(get_rhost_policy(rhost.host, rhost.tunnel_ip))
 
-    # allowed ports policy
     if AllowedPort.query.first():
-        allowed_ports._set_allowed_ports_etcd()
+        tree[ETCD_ALLOWED_PORT_KEY_PATH] = json.dumps(
+            get_node_allowed_ports_policy(
+                allowed_ports._get_allowed_ports_rules()))
 
-    # restricted ports policy
     if RestrictedPort.query.first():
-        restricted_ports._set_restricted_ports_etcd()
+        tree[ETCD_RESTRICTED_PORT_KEY_PATH] = json.dumps(
+            get_pod_restricted_ports_policy(
+                restricted_ports._get_restricted_ports_rules()))
 
     # service pods policies
     owner = User.get_internal()
+    logs_pods = set(get_kuberdock_logs_pod_name(node.hostname)
+                    for node in nodes)
+    service_pods = Pod.query.filter(
+        Pod.owner_id == owner.id,
+        Pod.name.in_(logs_pods | {KUBERDOCK_DNS_POD_NAME}))
+    for pod in service_pods:
+        if pod.name == KUBERDOCK_DNS_POD_NAME:
+            policy = get_dns_policy_config(owner.id, pod.id)
+        else:
+            policy = get_logs_policy_config(owner.id, pod.id, pod.name)
+        key = '/'.join([ETCD_NETWORK_POLICY_SERVICE_KEY, pod.name])
+        tree[key] = json.dumps(policy)
+    return tree
+
+
+def get_hosts_tree():
+    """Builds desired calico config of master and nodes host endpoints.
+
+    :returns: dict of etcd key -> value
+    """
+    master_hostname = get_hostname()
+    tree = {
+        _host_endpoint_key(master_hostname):
+            json.dumps(get_master_host_endpoint()),
+    }
+    for node in Node.query:
+        tree[_host_endpoint_key(node.hostname)] = json.dumps(
+            get_calico_host_endpoint(node.ip))
+        tree[_host_config_key(node.hostname,
+                              ETCD_ENDPOINT_TO_HOST_ACTION_KEY)] = 'DROP'
+    return tree
+
+
+def read_tree(client, path):
+    """Reads all values under the path with one recursive request.
+
+    :returns: dict of etcd key -> value
+    """
+    try:
+        result = client.read(path, recursive=True)
+    except etcd.EtcdKeyNotFound:
+        return {}
+    return {leaf.key: leaf.value for leaf in result.leaves if not leaf.dir}
+
+
+def _same_value(current, desired):
+    if current == desired:
+        return True
+    try:
+        return json.loads(current) == json.loads(desired)
+    except (TypeError, ValueError):
+        return False
+
+
+def sync_tree(client, current, desired, managed_prefixes=()):
+    """Writes keys which differ from the desired tree, then deletes keys
+    under `managed_prefixes` which are not in the desired tree. Policies are
+    never missing in between, since new ones are written first.
+
+    :returns: tuple of numbers of written and deleted keys
+    """
+    written = deleted = 0
+    for key, value in sorted(desired.iteritems()):
+        if key not in current or not _same_value(current[key], value):
+            client.write(key, value)
+            written += 1
+    for key in sorted(current):
+        if key not in desired and key.startswith(managed_prefixes):
+            try:
+                client.delete(key)
+            except etcd.EtcdKeyNotFound:
+                pass
+            deleted += 1
+    return written, deleted
 
-    # dns pod policy
-    dns_pod = Pod.query.filter_by(name=KUBERDOCK_DNS_POD_NAME,
-                                  owner=owner).first()
-    if dns_pod:
-        dns_policy_key = '/'.join([ETCD_NETWORK_POLICY_SERVICE_KEY,
-                                   KUBERDOCK_DNS_POD_NAME])
-        dns_policy = get_dns_policy_config(owner.id, dns_pod.id)
-        client.write(dns_policy_key, json.dumps(dns_policy))
 
-    # logs pods policies
-    for node in Node.query:
-        pod_name = get_kuberdock_logs_pod_name(node.hostname)
-        pod = Pod.query.filter_by(name=pod_name, owner=owner).first()
-        if pod:
-            logs_policy_key = '/'.join([ETCD_NETWORK_POLICY_SERVICE_KEY,
-                                        pod_name])
-            logs_policy = get_logs_policy_config(owner.id, pod.id, pod_name)
-            client.write(logs_policy_key, json.dumps(logs_policy))
+def create_network_policies():
+    """Brings calico policies managed by KuberDock to the desired state.
+    Only changed keys are written.
+    """
+    client = etcd.Client(host=ETCD_HOST, port=ETCD_PORT)
+
+    hosts = get_hosts_tree()
+    sync_tree(client, read_tree(client, ETCD_CALICO_HOST_PATH), hosts)
+
+    tiers = get_tiers()
+    policies = get_policies_tree(tiers)
+    managed = tuple('/'.join([ETCD_CALICO_POLICY_PATH, tier_name]) + '/'
+                    for tier_name in tiers)
+    sync_tree(client, read_tree(client, ETCD_CALICO_POLICY_PATH), policies,
+              managed_prefixes=managed)
@@ -184,6 +184,14 @@ KUBE_NP_BASE_URL = 'apis'
 
 # If None, defaults will be used
 SSH_KEY_FILENAME = '/var/lib/nginx/.ssh/id_rsa'
+# Pool of SSH connections to nodes (see core.SSHConnectionPool).
+# Max number of simultaneously opened channels per node. Should be less than
+# MaxSessions in sshd config of nodes (10 by default).
+SSH_POOL_MAX_CHANNELS = 8
+# Connections which were not used for this number of seconds are closed
+SSH_POOL_IDLE_TIMEOUT = 300
+# Interval of keep-alive packets in seconds, 0 - disabled
+SSH_POOL_KEEPALIVE_INTERVAL = 30
 
 INFLUXDB_HOST = os.environ.get('INFLUXDB_HOST', '127.0.0.1')
 INFLUXDB_PORT = 8086
@@ -249,8 +257,17 @@ CELERYBEAT_SCHEDULE = {
         'task': 'kubedock.kapi.podcollection.pod_set_unpaid_state_task',
         'schedule': timedelta(minutes=5)
     },
+    'publish-free-public-ip-counts': {
+        'task': 'kubedock.kapi.node.publish_pending_free_public_ip_counts',
+        'schedule': timedelta(minutes=1)
+    },
+    'rollup-stats': {
+        'task': 'kubedock.kubedata.rollups.rollup_stats',
+        'schedule': timedelta(minutes=5)
+    },
 }
-CELERY_IMPORTS = ('kubedock.kapi.podcollection', 'kubedock.kapi.ingress')
+CELERY_IMPORTS = ('kubedock.kapi.podcollection', 'kubedock.kapi.ingress',
+                  'kubedock.kapi.node', 'kubedock.kubedata.rollups')
 # Do not store results too long. Default is 1 day.
 CELERY_TASK_RESULT_EXPIRES = 60 * 60
 
@@ -258,10 +275,17 @@ ONLINE_LAST_MINUTES = 5
 
 NODE_INSTALL_TASK_ID = 'add-new-node-with-hostname-{0}-and-id-{1}'
 NODE_INSTALL_LOG_FILE = '/var/log/kuberdock/node-install-log-{0}.log'
+# Max size of node install log part returned at once, bytes
+NODE_INSTALL_LOG_TAIL_SIZE = 16 * 1024
 UPDATE_LOG_FILE = '/var/log/kuberdock/update.log'
 MAINTENANCE_LOCK_FILE = '/var/lib/kuberdock/maintenance.lock'
 UPDATES_RELOAD_LOCK_FILE = '/var/lib/kuberdock/updates-reload.lock'
 UPDATES_PATH = '/var/opt/kuberdock/kubedock/updates/scripts'
+# Max number of nodes upgraded at the same time
+NODE_UPGRADE_CONCURRENCY = 5
+# Node upgrade which is not finished in this number of seconds is terminated
+# and the node is considered as failed
+NODE_UPGRADE_TIMEOUT = 60 * 60
 KUBERDOCK_SERVICE = 'emperor.uwsgi'
 KUBERDOCK_SETTINGS_FILE = '/etc/sysconfig/kuberdock/kuberdock.conf'
 NODE_DATA_DIR = '/var/lib/kuberdock'
@@ -350,6 +374,10 @@ CALICO_NETWORK = '10.1.0.0/16'
 # Enable /hosted/ url
 ISV_MODE_ENABLED = False
 
+# Collect per-endpoint latency and numbers of SQL/Redis/k8s/SSH calls
+# (see kubedock.instrumentation)
+INSTRUMENTATION_ENABLED = False
+
 # Import hoster settings in update case
 
 
@@ -400,6 +428,9 @@ if cp.read(KUBERDOCK_SETTINGS_FILE) and cp.has_section('main'):
             'main', 'AWS_DEFAULT_EBS_VOLUME_IOPS')
     if cp.has_option('main', 'CALICO_NETWORK'):
         CALICO_NETWORK = cp.get('main', 'CALICO_NETWORK')
+    if cp.has_option('main', 'INSTRUMENTATION_ENABLED'):
+        INSTRUMENTATION_ENABLED = cp.getboolean(
+            'main', 'INSTRUMENTATION_ENABLED')
 
 # Import local settings
 try:
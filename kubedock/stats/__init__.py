@@ -18,4 +18,4 @@
 # You should have received a copy of the GNU General Public License
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
-from .models import StatWrap5Min
+from .models import StatWrap5Min, StatWrapHour, StatWrapDay
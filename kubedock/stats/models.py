@@ -21,16 +21,19 @@
 from ..core import db
 
 
-class StatWrap5Min(db.Model):
-    __tablename__ = 'stat_wrap_5min'
-    __table_args__ = (
-        db.PrimaryKeyConstraint(
-            'time_window',
-            'host',
-            'unit_name',
-            'container',
-            name='window_entry'),
-    )
+def _window_entry(name):
+    return db.PrimaryKeyConstraint(
+        'time_window', 'host', 'unit_name', 'container', name=name)
+
+
+class StatWrapMixin(object):
+    """Averaged usage of a host (empty `unit_name` and `container`), a pod
+    (empty `container`) or a container of a pod during `period` seconds
+    starting from `time_window` (unix timestamp).
+    `fs_data` is json of {resource_id: [usage, limit]} for hosts.
+    """
+    period = None
+
     time_window = db.Column(db.Integer, nullable=False)
     host = db.Column(db.String(64), nullable=False)
     unit_name = db.Column(db.String(255), nullable=False, index=True)
@@ -40,3 +43,23 @@ class StatWrap5Min(db.Model):
     rxb = db.Column(db.Float, nullable=False, default=0.0)
     txb = db.Column(db.Float, nullable=False, default=0.0)
     fs_data = db.Column(db.Text, nullable=True)
+    cpu_limit = db.Column(db.Float, nullable=True)
+    memory_limit = db.Column(db.Float, nullable=True)
+
+
+class StatWrap5Min(StatWrapMixin, db.Model):
+    __tablename__ = 'stat_wrap_5min'
+    __table_args__ = (_window_entry('window_entry'),)
+    period = 5 * 60
+
+
+class StatWrapHour(StatWrapMixin, db.Model):
+    __tablename__ = 'stat_wrap_hour'
+    __table_args__ = (_window_entry('hour_window_entry'),)
+    period = 60 * 60
+
+
+class StatWrapDay(StatWrapMixin, db.Model):
+    __tablename__ = 'stat_wrap_day'
+    __table_args__ = (_window_entry('day_window_entry'),)
+    period = 24 * 60 * 60
@@ -19,7 +19,8 @@
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
 import json
-from ..core import db
+
+from ..core import db, PubSubCache
 from ..exceptions import APIError
 
 
@@ -60,10 +61,10 @@ class SystemSettings(db.Model):
 
     @classmethod
     def get_by_name(cls, name):
-        entry = cls.query.filter_by(name=name).first()
-        if entry is None:
+        value = settings_cache.get(name)
+        if value is None:
             return ''
-        return entry.value
+        return value
 
     @classmethod
     def set(cls, id, value):
@@ -81,3 +82,21 @@ class SystemSettings(db.Model):
         entry.value = value
         if commit:
             db.session.commit()
+
+
+class SettingsCache(PubSubCache):
+    """Per-process cache of all system settings values."""
+    channel = 'kd.system_settings.invalidate'
+    models = (SystemSettings,)
+
+    def load(self):
+        return dict(db.session.query(SystemSettings.name,
+                                     SystemSettings.value))
+
+    def get(self, name):
+        """Returns value of the setting or None if there is no such setting.
+        """
+        return self.get_data().get(name)
+
+
+settings_cache = SettingsCache()
@@ -0,0 +1,92 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+import mock
+
+from ...core import ConnectionPool
+from ...testutils.testcases import DBTestCase
+from ..models import SystemSettings, settings_cache
+
+
+def get_message(pubsub, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        message = pubsub.get_message()
+        if message is not None:
+            return message
+        time.sleep(0.01)
+
+
+class TestSettingsCache(DBTestCase):
+    def setUp(self):
+        # settings were created by fixtures in the current (never really
+        # committed in tests) transaction
+        self.db.session().info.pop(settings_cache.session_flag, None)
+        self.billing_type = SystemSettings.get_by_name('billing_type')
+
+    def _count_queries(self):
+        return mock.patch.object(self.db.session, 'query',
+                                 wraps=self.db.session.query)
+
+    def test_values_are_cached(self):
+        with self._count_queries() as query_mock:
+            self.assertEqual(SystemSettings.get_by_name('billing_type'),
+                             self.billing_type)
+            self.assertEqual(SystemSettings.get_by_name('unknown'), '')
+        self.assertFalse(query_mock.called)
+
+    def test_invalidation_is_received(self):
+        ConnectionPool.get_connection().publish(settings_cache.channel, '')
+        with self._count_queries() as query_mock:
+            SystemSettings.get_by_name('billing_type')
+            SystemSettings.get_by_name('billing_type')
+        self.assertEqual(query_mock.call_count, 1)
+
+    def test_uncommitted_changes_are_not_cached(self):
+        SystemSettings.set_by_name('billing_type', 'whmcs', commit=False)
+        with self._count_queries() as query_mock:
+            self.assertEqual(SystemSettings.get_by_name('billing_type'),
+                             'whmcs')
+            self.assertEqual(SystemSettings.get_by_name('billing_type'),
+                             'whmcs')
+        self.assertEqual(query_mock.call_count, 2)
+
+        self.db.session.rollback()
+        self.assertEqual(SystemSettings.get_by_name('billing_type'),
+                         self.billing_type)
+
+    def test_commit_publishes_invalidation(self):
+        pubsub = ConnectionPool.get_connection().pubsub(
+            ignore_subscribe_messages=True)
+        pubsub.subscribe(settings_cache.channel)
+        self.addCleanup(pubsub.close)
+        SystemSettings.set_by_name('billing_type', 'whmcs')
+        # only a savepoint was committed in tests
+        self.assertIsNone(get_message(pubsub, 0.1))
+
+        session = self.db.session()
+        with mock.patch('kubedock.core._is_root_transaction',
+                        return_value=True):
+            session.commit()
+        self.assertNotIn(settings_cache.session_flag, session.info)
+        message = get_message(pubsub, 1)
+        self.assertEqual(message['channel'], settings_cache.channel)
@@ -33,7 +33,7 @@ from flask import current_app
 from sqlalchemy import event
 
 from . import dns_management
-from .core import db, ssh_connect
+from .core import db, ssh_connect, ssh_pool, ConnectionPool
 from .kapi.collect import collect, send
 from .kapi.helpers import KubeQuery, raise_if_failure
 from .kapi.node import Node as K8SNode
@@ -43,7 +43,7 @@ from .kapi.node_utils import (
 from .kapi.pstorage import (
     delete_persistent_drives, remove_drives_marked_for_deletion,
     check_namespace_exists)
-from .kapi.usage import update_states
+from .kapi.usage import update_states, get_open_container_states
 from .kd_celery import celery, exclusive_task
 from .models import Pod, ContainerState, PodState, PersistentDisk, User
 from .nodes.models import Node, NodeAction, NodeFlag, NodeFlagNames
@@ -58,9 +58,17 @@ from .system_settings.models import SystemSettings
 from .users.models import SessionData
 from .utils import (
     update_dict, get_api_url, send_event, send_event_to_role, send_logs,
-    k8s_json_object_hook, get_timezone, NODE_STATUSES, POD_STATUSES
+    k8s_json_object_hook, get_timezone, NODE_STATUSES, POD_STATUSES,
+    PhaseTimer, report_metrics
 )
 
+# Redis hash of pod id -> resourceVersion of k8s pod processed by the last run
+# of fix_pods_timeline. It expires, so all pods are checked from time to time.
+PODS_TIMELINE_VERSIONS_KEY = 'kd.fix_pods_timeline.versions'
+#: Exists until the next full check of pods timeline is due
+PODS_TIMELINE_FULL_CHECK_KEY = 'kd.fix_pods_timeline.full_check'
+PODS_TIMELINE_FULL_CHECK_INTERVAL = 60 * 60  # in seconds
+
 
 class NodeInstallException(Exception):
     pass
@@ -457,15 +465,20 @@ def get_node_interface(data, node_ip):
 
 @celery.task()
 @exclusive_task(60 * 30)
-def fix_pods_timeline():
+def fix_pods_timeline(full=False):
     """
     Create ContainerStates that wasn't created and
     close the ones that must be closed.
     Close PodStates that wasn't closed.
+    Only pods which were changed (have another resourceVersion) since the
+    previous run are checked, unless `full` is set or the previous full
+    check was more than PODS_TIMELINE_FULL_CHECK_INTERVAL ago.
     """
-    t = [time.time()]
-    css = ContainerState.query.filter(ContainerState.end_time.is_(None))
-    t.append(time.time())
+    timer = PhaseTimer()
+    redis = ConnectionPool.get_connection()
+    if not full and not redis.exists(PODS_TIMELINE_FULL_CHECK_KEY):
+        full = True
+    versions = {} if full else redis.hgetall(PODS_TIMELINE_VERSIONS_KEY)
     # get pods from k8s
     # we need to get only KuberDock pods
     pods = KubeQuery().get(['pods'], {'labelSelector': 'kuberdock-pod-uid'})
@@ -474,29 +487,33 @@ def fix_pods_timeline():
         pod['metadata']['labels']['kuberdock-pod-uid']:
             k8s_json_object_hook(pod) for pod in pods.get('items', [])}
     now = datetime.utcnow().replace(microsecond=0)
-    t.append(time.time())
+    timer.phase('get_pods')
 
     updated_CS = set()
-    for k8s_pod in pods.itervalues():
+    new_versions = {}
+    checked_pods = 0
+    for pod_id, k8s_pod in pods.iteritems():
+        version = k8s_pod['metadata'].get('resourceVersion')
+        if version is not None:
+            new_versions[pod_id] = version
+            if versions.get(pod_id) == version:
+                continue  # was already checked by the previous run
+        checked_pods += 1
         updated_CS.update(update_states(k8s_pod, event_time=now))
-    t.append(time.time())
+    timer.phase('update_states')
 
-    for cs in css:
+    for cs, pod_id, next_start_time in get_open_container_states():
         if cs in updated_CS:
             # pod was found in db and k8s,
             # and k8s have info about this container
             continue  # ContainerState was fixed in update_states()
-        cs_next = ContainerState.query.join(PodState).filter(
-            PodState.pod_id == cs.pod_state.pod_id,
-            ContainerState.container_name == cs.container_name,
-            ContainerState.start_time > cs.start_time,
-        ).order_by(ContainerState.start_time).first()
-        if cs_next:
-            cs.fix_overlap(cs_next.start_time)
-        elif pods.get(cs.pod_state.pod_id) is None:
+        if next_start_time is not None:
+            cs.fix_overlap(next_start_time)
+        elif pod_id not in pods:
             # it's the last CS and pod not found in k8s
             cs.end_time = now
             cs.exit_code, cs.reason = ContainerState.REASONS.pod_was_stopped
+    timer.phase('close_container_states')
 
     # Close states for deleted pods if not closed.
     # Actually it is needed to be run once, but let it be run regularly.
@@ -511,15 +528,25 @@ def fix_pods_timeline():
         ps.end_time = datetime.utcnow()
         closed_states += 1
 
+    timer.phase('close_pod_states')
+
     try:
         db.session.commit()
     except Exception:
         db.session.rollback()
         raise
-    t.append(time.time())
-    current_app.logger.debug('Fixed pods timeline: {0}'.format(
-        ['{0:.3f}'.format(t2 - t1) for t1, t2 in zip(t[:-1], t[1:])]))
-    current_app.logger.debug('Closed %s pod_states', closed_states)
+    pipe = redis.pipeline()
+    pipe.delete(PODS_TIMELINE_VERSIONS_KEY)
+    if new_versions:
+        pipe.hmset(PODS_TIMELINE_VERSIONS_KEY, new_versions)
+    if full:
+        pipe.set(PODS_TIMELINE_FULL_CHECK_KEY, now.isoformat(),
+                 ex=PODS_TIMELINE_FULL_CHECK_INTERVAL)
+    pipe.execute()
+    timer.phase('commit')
+    report_metrics('fix_pods_timeline', dict(
+        timer.timings, pods=len(pods), checked_pods=checked_pods,
+        closed_pod_states=closed_states, full=int(full)))
 
 
 def add_k8s_node_labels(nodename, labels):
@@ -569,15 +596,15 @@ def check_if_node_down(hostname):
     # In some cases kubelet doesn't post it's status, and restart may help
     # to make it alive. It's a workaround for kubelet bug.
     # TODO: research the bug and remove the workaround
-    ssh, error_message = ssh_connect(hostname, timeout=3)
-    if error_message:
-        current_app.logger.debug(
-            'Failed connect to node %s: %s',
-            hostname, error_message
-        )
-        return
-    i, o, e = ssh.exec_command('systemctl restart kubelet')
-    exit_status = o.channel.recv_exit_status()
+    with ssh_pool.connect(hostname, timeout=3) as (ssh, error_message):
+        if error_message:
+            current_app.logger.debug(
+                'Failed connect to node %s: %s',
+                hostname, error_message
+            )
+            return
+        i, o, e = ssh.exec_command('systemctl restart kubelet')
+        exit_status = o.channel.recv_exit_status()
     if exit_status != 0:
         current_app.logger.debug(
             'Failed to restart kubelet on node: %s, exit status: %s',
@@ -596,13 +623,12 @@ def process_node_actions(action_type=None, node_host=None):
     if node_host is not None:
         actions = actions.filter(NodeAction.host == node_host)
     for action in actions:
-        ssh, error_message = ssh_connect(action.host)
-        if error_message:
-            continue
-        i, o, e = ssh.exec_command(action.command)
-        if o.channel.recv_exit_status() == 0:
-            db.session.delete(action)
-        ssh.close()
+        with ssh_pool.connect(action.host) as (ssh, error_message):
+            if error_message:
+                continue
+            i, o, e = ssh.exec_command(action.command)
+            if o.channel.recv_exit_status() == 0:
+                db.session.delete(action)
     db.session.commit()
 
 
@@ -18,9 +18,12 @@
 # You should have received a copy of the GNU General Public License
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
+import socket
 import unittest
 import time
 
+import mock
+
 from kubedock.testutils.testcases import FlaskTestCase
 from kubedock.testutils import create_app
 from kubedock import core
@@ -84,5 +87,121 @@ class TestExclusiveLock(TestCase):
         self.assertTrue(lock4.lock())
 
 
+class TestSSHConnectionPool(unittest.TestCase):
+    """Tests for core.SSHConnectionPool class."""
+
+    def setUp(self):
+        patcher = mock.patch.object(core, 'ssh_connect')
+        self.ssh_connect_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ssh_connect_mock.side_effect = lambda host, timeout: (
+            mock.Mock(), None)
+        self.pool = core.SSHConnectionPool(
+            max_channels=2, idle_timeout=60, keepalive=30)
+
+    def test_connection_is_reused(self):
+        with self.pool.connect('node1') as (ssh1, error):
+            self.assertIsNone(error)
+        with self.pool.connect('node1') as (ssh2, error):
+            self.assertIsNone(error)
+        self.assertIs(ssh1, ssh2)
+        self.ssh_connect_mock.assert_called_once_with('node1', 10)
+        ssh1.get_transport.return_value.set_keepalive.assert_called_once_with(
+            30)
+        self.assertFalse(ssh1.close.called)
+
+        with self.pool.connect('node2', timeout=3) as (ssh3, error):
+            self.assertIsNot(ssh1, ssh3)
+        self.ssh_connect_mock.assert_called_with('node2', 3)
+        metrics = self.pool.get_metrics()
+        self.assertEqual(metrics['connected'], 2)
+        self.assertEqual(metrics['reused'], 1)
+        self.assertEqual(metrics['connections'], 2)
+        self.assertEqual(metrics['channels'], 0)
+
+    def test_inactive_connection_is_replaced(self):
+        with self.pool.connect('node1') as (ssh1, _):
+            pass
+        ssh1.get_transport.return_value.is_active.return_value = False
+        with self.pool.connect('node1') as (ssh2, _):
+            pass
+        self.assertIsNot(ssh1, ssh2)
+        self.assertTrue(ssh1.close.called)
+        self.assertEqual(self.pool.get_metrics()['broken'], 1)
+
+    def test_connection_is_dropped_on_ssh_error(self):
+        with self.assertRaises(socket.error):
+            with self.pool.connect('node1') as (ssh1, _):
+                raise socket.error('connection reset')
+        self.assertTrue(ssh1.close.called)
+        with self.pool.connect('node1') as (ssh2, _):
+            self.assertIsNot(ssh1, ssh2)
+
+        # other errors do not affect the connection
+        with self.assertRaises(ValueError):
+            with self.pool.connect('node1') as (ssh3, _):
+                raise ValueError()
+        self.assertIs(ssh2, ssh3)
+        self.assertFalse(ssh3.close.called)
+
+    def test_failed_connection_is_not_cached(self):
+        self.ssh_connect_mock.side_effect = None
+        self.ssh_connect_mock.return_value = (mock.Mock(), 'refused')
+        with self.pool.connect('node1') as (_, error):
+            self.assertEqual(error, 'refused')
+        with self.pool.connect('node1') as (_, error):
+            self.assertEqual(error, 'refused')
+        self.assertEqual(self.ssh_connect_mock.call_count, 2)
+        metrics = self.pool.get_metrics()
+        self.assertEqual(metrics['failed'], 2)
+        self.assertEqual(metrics['connections'], 0)
+
+    @mock.patch.object(core.time, 'time')
+    def test_idle_connections_are_evicted(self, time_mock):
+        time_mock.return_value = 1000
+        with self.pool.connect('node1') as (ssh1, _):
+            time_mock.return_value = 2000
+            # leased connection is never evicted
+            self.pool.evict_idle()
+            self.assertFalse(ssh1.close.called)
+        time_mock.return_value = 2030
+        with self.pool.connect('node2') as (ssh2, _):
+            pass
+        self.assertFalse(ssh1.close.called)
+        time_mock.return_value = 2061
+        self.pool.evict_idle()
+        self.assertTrue(ssh1.close.called)
+        self.assertFalse(ssh2.close.called)
+        self.assertEqual(self.pool.get_metrics()['evicted'], 1)
+
+    def test_channels_limit(self):
+        with self.pool.connect('node1'):
+            with self.pool.connect('node1'):
+                self.assertEqual(self.pool.get_metrics()['channels'], 2)
+                entry = self.pool._hosts['node1']
+                self.assertFalse(entry.channels.acquire(False))
+            self.assertTrue(entry.channels.acquire(False))
+            entry.channels.release()
+
+    @mock.patch.object(core.os, 'getpid')
+    def test_pool_is_reset_after_fork(self, getpid_mock):
+        getpid_mock.return_value = self.pool._pid
+        with self.pool.connect('node1') as (ssh1, _):
+            pass
+        getpid_mock.return_value = self.pool._pid + 1
+        with self.pool.connect('node1') as (ssh2, _):
+            pass
+        self.assertIsNot(ssh1, ssh2)
+        # connection of the parent process is not closed
+        self.assertFalse(ssh1.close.called)
+
+    def test_close_all(self):
+        with self.pool.connect('node1') as (ssh1, _):
+            pass
+        self.pool.close_all()
+        self.assertTrue(ssh1.close.called)
+        self.assertEqual(self.pool.get_metrics()['connections'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -30,6 +30,7 @@ import uuid
 
 from .. import listeners
 from ..settings import NODE_LOCAL_STORAGE_PREFIX
+from ..usage import models as usage_models
 from ..testutils.testcases import DBTestCase
 
 
@@ -169,8 +170,8 @@ class TestPodEventK8s(DBTestCase):
 class TestSetLimit(unittest.TestCase):
     @mock.patch('kubedock.listeners.Pod')
     @mock.patch('kubedock.listeners.Kube')
-    @mock.patch('kubedock.listeners.ssh_connect')
-    def test_set_limit(self, ssh_connect_mock, kube_mock, pod_mock):
+    @mock.patch('kubedock.listeners.ssh_pool')
+    def test_set_limit(self, ssh_pool_mock, kube_mock, pod_mock):
         host = 'node'
         pod_id = 'abcd'
         containers = OrderedDict([('second', 'ipsum'), ('first', 'lorem')])
@@ -192,12 +193,13 @@ class TestSetLimit(unittest.TestCase):
 
         ssh = mock.Mock()
         ssh.exec_command.return_value = (mock.Mock(), stdout, mock.Mock())
-        ssh_connect_mock.return_value = (ssh, 'ignore this message')
+        lease = ssh_pool_mock.connect.return_value.__enter__
+        lease.return_value = (ssh, 'ignore this message')
 
         res = listeners.set_limit(host, pod_id, containers, app)
         self.assertFalse(res)
 
-        ssh_connect_mock.return_value = (ssh, None)
+        lease.return_value = (ssh, None)
         res = listeners.set_limit(host, pod_id, containers, app)
         self.assertFalse(res)
 
@@ -212,10 +214,223 @@ class TestSetLimit(unittest.TestCase):
         )
         self.assertEqual(ssh.exec_command.call_count, 2)
 
-        ssh_connect_mock.assert_called_with(host)
-        self.assertEqual(ssh_connect_mock.call_count, 3)
+        ssh_pool_mock.connect.assert_called_with(host)
+        self.assertEqual(ssh_pool_mock.connect.call_count, 3)
+        self.assertFalse(ssh.close.called)
 
 
+class TestFsLimitBatcher(unittest.TestCase):
+    def setUp(self):
+        patchers = {
+            'pod': mock.patch.object(listeners, 'Pod'),
+            'kube': mock.patch.object(listeners, 'Kube'),
+            'ssh_pool': mock.patch.object(listeners, 'ssh_pool'),
+            'spawn_later': mock.patch.object(listeners.gevent,
+                                             'spawn_later'),
+        }
+        self.mocks = dict((name, patcher.start())
+                          for name, patcher in patchers.iteritems())
+        for patcher in patchers.itervalues():
+            self.addCleanup(patcher.stop)
+        self.mocks['kube'].query.values.return_value = (1, 1, 'GB'),
+        self.pods = dict(
+            (pod_id, type('Pod', (), {
+                'id': pod_id, 'kube_id': 1,
+                'config': json.dumps({'containers': [
+                    {'name': 'first', 'kubes': 1},
+                    {'name': 'second', 'kubes': 2},
+                ]}),
+            })) for pod_id in ('pod1', 'pod2'))
+        pod_mock = self.mocks['pod']
+        pod_mock.query.filter.side_effect = lambda *args: [
+            self.pods[pod_id] for pod_id in pod_mock.id.in_.call_args[0][0]]
+
+        self.stdout = mock.Mock()
+        self.stdout.channel.recv_exit_status.return_value = 0
+        self.ssh = mock.Mock()
+        self.ssh.exec_command.return_value = (mock.Mock(), self.stdout,
+                                              mock.Mock())
+        self.mocks['ssh_pool'].connect.return_value.__enter__.return_value = (
+            self.ssh, None)
+        self.app = flask.Flask(__name__)
+        self.batcher = listeners.FsLimitBatcher(delay=1)
+
+    def _applied_limits(self):
+        command = self.ssh.exec_command.call_args[0][0]
+        return sorted(command.split(' containers ')[1].split())
+
+    def test_limits_are_batched_per_node(self):
+        spawn_later = self.mocks['spawn_later']
+        self.batcher.schedule('node1', 'pod1', {'first': 'c1'}, self.app)
+        self.batcher.schedule('node1', 'pod2', {'first': 'c3',
+                                                'second': 'c4'}, self.app)
+        self.batcher.schedule('node1', 'pod1', {'first': 'c1',
+                                                'second': 'c2'}, self.app)
+        spawn_later.assert_called_once_with(1, self.batcher.flush, 'node1',
+                                            self.app)
+
+        self.assertTrue(self.batcher.flush('node1', self.app))
+        self.assertEqual(self.ssh.exec_command.call_count, 1)
+        self.assertEqual(self._applied_limits(),
+                         ['c1=1g', 'c2=2g', 'c3=1g', 'c4=2g'])
+
+    def test_applied_limits_are_skipped(self):
+        spawn_later = self.mocks['spawn_later']
+        self.batcher.schedule('node1', 'pod1', {'first': 'c1'}, self.app)
+        self.batcher.flush('node1', self.app)
+
+        self.batcher.schedule('node1', 'pod1', {'first': 'c1'}, self.app)
+        self.assertEqual(spawn_later.call_count, 1)
+        # the same container on another node
+        self.batcher.schedule('node2', 'pod1', {'first': 'c1'}, self.app)
+        self.assertEqual(spawn_later.call_count, 2)
+
+        self.batcher.schedule('node1', 'pod1', {'first': 'c1',
+                                                'second': 'c2'}, self.app)
+        self.batcher.flush('node1', self.app)
+        self.assertEqual(self._applied_limits(), ['c2=2g'])
+
+        # nothing is pending
+        self.assertTrue(self.batcher.flush('node1', self.app))
+        self.assertEqual(self.ssh.exec_command.call_count, 2)
+
+        self.batcher.forget('node1', ['c1'])
+        self.batcher.schedule('node1', 'pod1', {'first': 'c1'}, self.app)
+        self.batcher.flush('node1', self.app)
+        self.assertEqual(self._applied_limits(), ['c1=1g'])
+
+    def test_failed_limits_are_not_cached(self):
+        self.stdout.channel.recv_exit_status.return_value = 1
+        self.batcher.schedule('node1', 'pod1', {'first': 'c1'}, self.app)
+        self.assertFalse(self.batcher.flush('node1', self.app))
+
+        self.stdout.channel.recv_exit_status.return_value = 0
+        self.batcher.schedule('node1', 'pod1', {'first': 'c1'}, self.app)
+        self.assertEqual(self.mocks['spawn_later'].call_count, 2)
+        self.assertTrue(self.batcher.flush('node1', self.app))
+        self.assertEqual(self._applied_limits(), ['c1=1g'])
+
+
+def _pod_event(name, event_type='MODIFIED', version=1, container_state=None):
+    container_state = container_state or {'running': {}}
+    return {
+        'type': event_type,
+        'object': {
+            'metadata': {'name': name, 'namespace': 'ns',
+                         'resourceVersion': str(version)},
+            'status': {'phase': 'Running', 'containerStatuses': [{
+                'name': 'c1', 'containerID': 'docker://1',
+                'state': container_state, 'lastState': {}}]},
+        },
+    }
+
+
+class TestCoalesceEvents(unittest.TestCase):
+
+    def test_latest_event_is_kept(self):
+        events = [_pod_event('a', version=1), _pod_event('b', version=2),
+                  _pod_event('a', version=3), _pod_event('a', version=4)]
+        self.assertEqual(listeners.coalesce_events(events),
+                         [events[1], events[3]])
+
+    def test_transitions_are_kept(self):
+        events = [_pod_event('a', version=1),
+                  _pod_event('a', version=2),
+                  _pod_event('a', version=3,
+                             container_state={'terminated': {}}),
+                  _pod_event('a', version=4,
+                             container_state={'terminated': {}}),
+                  _pod_event('a', 'DELETED', version=5,
+                             container_state={'terminated': {}})]
+        self.assertEqual(
+            listeners.coalesce_events(
+                events, transition_key=listeners.get_pod_transition),
+            [events[1], events[3], events[4]])
+
+    def test_event_types_are_kept(self):
+        events = [_pod_event('a', 'ADDED', version=1),
+                  _pod_event('a', version=2), _pod_event('a', version=3)]
+        self.assertEqual(
+            listeners.coalesce_events(
+                events, transition_key=listeners.get_event_type),
+            [events[0], events[2]])
+
+
+class TestRecvBatch(unittest.TestCase):
+
+    @mock.patch.object(listeners, 'has_pending_messages')
+    def test_available_messages_are_drained(self, has_pending):
+        ws = mock.Mock()
+        ws.recv.side_effect = ['1', '2', '3']
+        has_pending.side_effect = [True, True, False]
+        self.assertEqual(listeners.recv_batch(ws), ['1', '2', '3'])
+
+    @mock.patch.object(listeners, 'has_pending_messages')
+    def test_batch_size_is_limited(self, has_pending):
+        ws = mock.Mock()
+        ws.recv.side_effect = ['1', '2', '3']
+        has_pending.return_value = True
+        self.assertEqual(listeners.recv_batch(ws, max_size=2), ['1', '2'])
+
+
+@mock.patch.object(listeners, 'requests')
+@mock.patch.object(listeners, 'process_pods_event')
+class TestProcessRecords(DBTestCase):
+
+    @staticmethod
+    def _nodes(*events):
+        return [{'key': '/pod_states/{0}'.format(1000 + i),
+                 'value': json.dumps(event)}
+                for i, event in enumerate(events)]
+
+    def test_events_are_coalesced(self, process_pods_event, requests):
+        nodes = self._nodes(_pod_event('a'), _pod_event('b'),
+                            _pod_event('a'))
+        listeners.process_records(self.app, nodes)
+        self.assertEqual(
+            [c[0][0]['object']['metadata']['name']
+             for c in process_pods_event.call_args_list], ['b', 'a'])
+        self.assertEqual(
+            requests.Session.return_value.delete.call_count, len(nodes))
+
+    def test_failed_batch_is_processed_one_by_one(self, process_pods_event,
+                                                  requests):
+        nodes = self._nodes(_pod_event('a'), _pod_event('b'))
+        process_pods_event.side_effect = [None, Exception, None, None]
+        listeners.process_records(self.app, nodes)
+        self.assertEqual(process_pods_event.call_count, 4)
+
+
+@mock.patch.object(listeners, 'requests')
+@mock.patch.object(listeners, 'send_pod_status_update')
+class TestProcessRecordsUpdatesStates(DBTestCase):
+    """Pod events go through the real `process_pods_event` and
+    `update_states` in the transaction of `process_records`."""
+
+    def test_pod_states_are_saved(self, send_pod_status_update, requests):
+        pod = self.fixtures.pod()
+        self.db.session.commit()
+        pod_id = pod.id
+        event = _pod_event(pod.name, 'ADDED')
+        event['object']['metadata']['labels'] = {'kuberdock-pod-uid': pod_id}
+        event['object']['spec'] = {'nodeName': 'node1'}
+        event['object']['status'].update(startTime='2016-01-01T00:00:00Z')
+        event['object']['status']['containerStatuses'][0]['state'] = {
+            'running': {'startedAt': '2016-01-01T00:00:01Z'}}
+        # app contexts and closing of the session would drop data of
+        # the test transaction
+        with mock.patch.object(self.db.session, 'close'):
+            listeners.process_records(mock.MagicMock(), [
+                {'key': '/pod_states/1000', 'value': json.dumps(event)}])
+
+        pod_state = usage_models.PodState.query.filter_by(
+            pod_id=pod_id).one()
+        self.assertEqual(pod_state.last_event, 'ADDED')
+        self.assertEqual(pod_state.hostname, 'node1')
+        self.assertEqual(usage_models.ContainerState.query.filter_by(
+            pod_state_id=pod_state.id).count(), 1)
+        self.assertTrue(send_pod_status_update.called)
+
 if __name__ == '__main__':
     logging.basicConfig(stream=sys.stderr)
     logging.getLogger(__name__).setLevel(logging.DEBUG)
@@ -0,0 +1,153 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest
+
+import etcd
+import mock
+
+from kubedock import network_policies_utils as utils
+from kubedock.core import db
+from kubedock.settings import (
+    ETCD_CALICO_POLICY_PATH,
+    ETCD_NETWORK_POLICY_NODES_KEY,
+    ETCD_NETWORK_POLICY_SERVICE_KEY,
+)
+from kubedock.testutils import fixtures
+from kubedock.testutils.testcases import DBTestCase
+from kubedock.users.models import User
+
+TIER = ETCD_CALICO_POLICY_PATH + '/kuberdock-nodes'
+
+
+class TestSyncTree(unittest.TestCase):
+    def test_only_changes_are_written(self):
+        client = mock.Mock()
+        current = {
+            TIER + '/metadata': '{"order":  10}',
+            TIER + '/policy/changed': '{"order": 1}',
+            TIER + '/policy/removed': '{}',
+            ETCD_CALICO_POLICY_PATH + '/other/policy/foreign': '{}',
+        }
+        desired = {
+            TIER + '/metadata': json.dumps({'order': 10}),
+            TIER + '/policy/changed': json.dumps({'order': 2}),
+            TIER + '/policy/new': json.dumps({'order': 3}),
+        }
+        self.assertEqual(
+            utils.sync_tree(client, current, desired, (TIER + '/',)), (2, 1))
+        self.assertEqual(client.write.call_args_list, [
+            mock.call(TIER + '/policy/changed', desired[
+                TIER + '/policy/changed']),
+            mock.call(TIER + '/policy/new', desired[TIER + '/policy/new']),
+        ])
+        client.delete.assert_called_once_with(TIER + '/policy/removed')
+
+    def test_read_tree(self):
+        client = mock.Mock()
+        client.read.return_value = etcd.EtcdResult(node={
+            'key': TIER, 'dir': True, 'nodes': [
+                {'key': TIER + '/metadata', 'value': '{}'},
+                {'key': TIER + '/policy', 'dir': True, 'nodes': [
+                    {'key': TIER + '/policy/a', 'value': 'x'}]},
+                {'key': TIER + '/empty', 'dir': True},
+            ]})
+        self.assertEqual(utils.read_tree(client, TIER), {
+            TIER + '/metadata': '{}', TIER + '/policy/a': 'x'})
+        client.read.assert_called_once_with(TIER, recursive=True)
+
+        client.read.side_effect = etcd.EtcdKeyNotFound
+        self.assertEqual(utils.read_tree(client, TIER), {})
+
+
+class TestPoliciesTree(DBTestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            'kubedock.kapi.network_policies.get_calico_ip_tunnel_address',
+            return_value='10.1.0.1')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.nodes = [fixtures.node() for _ in range(3)]
+        db.session.add_all(self.nodes)
+        owner = User.get_internal()
+        self.logs_pod = fixtures.pod(
+            owner=owner,
+            name=utils.get_kuberdock_logs_pod_name(self.nodes[0].hostname))
+        self.dns_pod = fixtures.pod(owner=owner,
+                                    name=utils.KUBERDOCK_DNS_POD_NAME)
+        fixtures.pod(name=utils.KUBERDOCK_DNS_POD_NAME)  # not a service pod
+        db.session.commit()
+
+    def test_policies_tree(self):
+        tiers = {'kuberdock-nodes': {'order': 10, 'policies': {'a': {}}}}
+        tree = utils.get_policies_tree(tiers)
+        self.assertEqual(tree[TIER + '/metadata'], '{"order": 10}')
+        self.assertEqual(tree[TIER + '/policy/a'], '{}')
+        for node in self.nodes:
+            for i in range(utils.NODES_POLICY_COUNT):
+                self.assertIn('{0}/{1}-{2}'.format(
+                    ETCD_NETWORK_POLICY_NODES_KEY, i, node.hostname), tree)
+        service = [key for key in tree
+                   if key.startswith(ETCD_NETWORK_POLICY_SERVICE_KEY)]
+        self.assertItemsEqual(service, [
+            ETCD_NETWORK_POLICY_SERVICE_KEY + '/' + self.logs_pod.name,
+            ETCD_NETWORK_POLICY_SERVICE_KEY + '/' + self.dns_pod.name,
+        ])
+        dns_policy = json.loads(tree[
+            ETCD_NETWORK_POLICY_SERVICE_KEY + '/' + self.dns_pod.name])
+        self.assertIn(self.dns_pod.id, dns_policy['selector'])
+
+    @mock.patch.object(utils, 'get_master_host_endpoint')
+    @mock.patch.object(utils, 'get_hostname')
+    @mock.patch.object(utils, 'get_tiers')
+    @mock.patch.object(utils.etcd, 'Client')
+    def test_create_network_policies(self, client_cls, get_tiers,
+                                     get_hostname, get_master_host_endpoint):
+        get_tiers.return_value = {
+            'kuberdock-nodes': {'order': 10, 'policies': {}}}
+        get_hostname.return_value = 'master'
+        get_master_host_endpoint.return_value = {}
+        client = client_cls.return_value
+        client.read.side_effect = etcd.EtcdKeyNotFound
+        utils.create_network_policies()
+        self.assertEqual(client.read.call_count, 2)
+        written = [c[0][0] for c in client.write.call_args_list]
+        self.assertIn(utils._host_endpoint_key('master'), written)
+        self.assertIn(TIER + '/metadata', written)
+        self.assertFalse(client.delete.called)
+
+        # nothing is written if everything is up to date
+        client.reset_mock()
+        trees = {
+            utils.ETCD_CALICO_HOST_PATH: utils.get_hosts_tree(),
+            ETCD_CALICO_POLICY_PATH: utils.get_policies_tree(
+                get_tiers.return_value),
+        }
+        client.read.side_effect = lambda path, recursive: mock.Mock(leaves=[
+            mock.Mock(key=key, value=value, dir=False)
+            for key, value in trees[path].items()])
+        utils.create_network_policies()
+        self.assertFalse(client.write.called)
+        self.assertFalse(client.delete.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import json
+import sys
+
+import pytest
+
+import node_network_plugin
+
+FAKE_IPSET = '''\
+#!{python}
+"""Fake ipset, which keeps sets in a json file and logs its calls."""
+import json
+import os
+import sys
+
+state_file = os.path.join(os.path.dirname(__file__), 'state.json')
+with open(state_file) as f:
+    state = json.load(f)
+args = sys.argv[1:]
+with open(os.path.join(os.path.dirname(__file__), 'calls'), 'a') as f:
+    f.write(' '.join(args) + '\\n')
+exist = '-exist' in args
+args = [arg for arg in args if arg != '-exist']
+
+
+def fail(msg):
+    sys.stderr.write(msg + '\\n')
+    sys.exit(1)
+
+
+def run(cmd, name, *params):
+    if cmd == 'create':
+        if name in state and not exist:
+            fail('set already exists')
+        state.setdefault(name, {{'type': params[0], 'members': []}})
+    elif name not in state:
+        fail('The set with the given name does not exist')
+    elif cmd == 'flush':
+        state[name]['members'] = []
+    elif cmd == 'add':
+        state[name]['members'].append(params[0])
+    elif cmd == 'swap':
+        if state[name]['type'] != state[params[0]]['type']:
+            fail('The sets cannot be swapped: their type does not match')
+        state[name], state[params[0]] = state[params[0]], state[name]
+    elif cmd == 'destroy':
+        del state[name]
+    else:
+        fail('Unknown command')
+
+
+if args[0] == 'list':
+    if args[1] not in state:
+        fail('The set with the given name does not exist')
+    print('Name: {{0}}'.format(args[1]))
+    print('Type: {{0}}'.format(state[args[1]]['type']))
+    print('Members:')
+    for member in state[args[1]]['members']:
+        print(member)
+elif args[0] == 'restore':
+    for line in sys.stdin:
+        if line.strip():
+            run(*line.split())
+else:
+    run(*args)
+
+with open(state_file, 'w') as f:
+    json.dump(state, f)
+'''
+
+
+@pytest.fixture
+def ipset(tmpdir, monkeypatch):
+    """Fake ipset binary. Returns functions to get state and calls of it."""
+    binary = tmpdir.join('ipset')
+    binary.write(FAKE_IPSET.format(python=sys.executable))
+    binary.chmod(0o755)
+    tmpdir.join('state.json').write('{}')
+    tmpdir.join('calls').write('')
+    monkeypatch.setattr(node_network_plugin, 'IPSET', binary.strpath)
+
+    class FakeIPSet(object):
+        @staticmethod
+        def state():
+            return json.loads(tmpdir.join('state.json').read())
+
+        @staticmethod
+        def calls():
+            return tmpdir.join('calls').read().splitlines()
+
+    return FakeIPSet
+
+
+def test_update_ipset_creates_set_with_one_restore(ipset):
+    node_network_plugin._update_ipset(
+        'kuberdock_user_1', ['10.1.0.3', '10.1.0.2'])
+
+    assert ipset.state() == {
+        'kuberdock_user_1': {'type': 'hash:ip',
+                             'members': ['10.1.0.2', '10.1.0.3']}}
+    assert ipset.calls() == ['list kuberdock_user_1', '-exist restore']
+
+
+def test_update_ipset_does_nothing_if_set_is_actual(ipset):
+    node_network_plugin._update_ipset('kuberdock_nodes', ['192.168.0.1'])
+    node_network_plugin._update_ipset('kuberdock_nodes', {'192.168.0.1'})
+
+    assert ipset.calls() == ['list kuberdock_nodes', '-exist restore',
+                             'list kuberdock_nodes']
+
+
+def test_update_ipset_replaces_members(ipset):
+    node_network_plugin._update_ipset(
+        'kuberdock_user_1', ['10.1.0.1', '10.1.0.2'])
+    node_network_plugin._update_ipset(
+        'kuberdock_user_1', ['10.1.0.2', '10.1.0.3'])
+
+    assert ipset.state() == {
+        'kuberdock_user_1': {'type': 'hash:ip',
+                             'members': ['10.1.0.2', '10.1.0.3']}}
+    assert len(ipset.calls()) == 4
+
+
+def test_update_ipset_logs_failure(ipset, monkeypatch):
+    log = []
+    monkeypatch.setattr(node_network_plugin, 'glog', log.append)
+    # swap of sets of different types fails
+    node_network_plugin._update_ipset('kuberdock_flannel', ['10.254.0.0/16'],
+                                      set_type='hash:net')
+    node_network_plugin._update_ipset('kuberdock_flannel', ['10.1.0.1'],
+                                      set_type='hash:ip')
+    assert len(log) == 1
+    assert 'Failed to update ipset kuberdock_flannel' in log[0]
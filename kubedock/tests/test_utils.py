@@ -28,6 +28,7 @@ import mock
 from ..exceptions import APIError
 from ..login import get_user_role
 from ..testutils.testcases import DBTestCase
+from .. import utils
 from ..utils import (
     atomic,
     get_api_url,
@@ -685,5 +686,83 @@ class TestDomainize(unittest.TestCase):
             self.assertEqual(r, o)
 
 
+def calico_host(hostname, bird_ip=None, tunnel=None, workloads=0):
+    key = '/calico/v1/host/' + hostname
+    nodes = [{'key': key + '/workload', 'dir': True, 'nodes': [
+        {'key': '{0}/workload/{1}'.format(key, i), 'value': '{}'}
+        for i in range(workloads)]}]
+    if bird_ip:
+        nodes.append({'key': key + '/bird_ip', 'value': bird_ip})
+    if tunnel:
+        nodes.append({'key': key + '/config', 'dir': True, 'nodes': [
+            {'key': key + '/config/IpInIpTunnelAddr', 'value': tunnel},
+            {'key': key + '/config/DefaultEndpointToHostAction',
+             'value': 'DROP'}]})
+    return {'key': key, 'dir': True, 'nodes': nodes}
+
+
+@mock.patch.object(utils, 'Etcd')
+class TestCalicoHostIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = utils.CalicoHostIndex()
+
+    def _hosts(self, etcd_mock, *hosts):
+        etcd_mock.return_value.get.return_value = {
+            'node': {'key': '/calico/v1/host', 'dir': True,
+                     'nodes': list(hosts)}}
+
+    def test_lookups_are_served_from_memory(self, etcd_mock):
+        self._hosts(etcd_mock,
+                    calico_host('node1', '192.168.0.1', '10.1.0.1', 10),
+                    calico_host('node2', '192.168.0.2', '10.1.0.2'))
+        self.assertEqual(self.index.find_by_ip('192.168.0.2'), 'node2')
+        self.assertEqual(self.index.get_tunnel_address('node1'), '10.1.0.1')
+        self.assertEqual(self.index.get_bird_ip('node2'), '192.168.0.2')
+        etcd_mock.return_value.get.assert_called_once_with(recursive=True)
+
+    def test_refresh_on_miss_and_expiration(self, etcd_mock):
+        self._hosts(etcd_mock, calico_host('node1', '192.168.0.1'))
+        self.assertIsNone(self.index.find_by_ip('192.168.0.2'))
+        self.assertEqual(etcd_mock.return_value.get.call_count, 1)
+
+        self._hosts(etcd_mock, calico_host('node1', '192.168.0.1'),
+                    calico_host('rhost', '192.168.0.2', '10.1.0.5'))
+        # misses re-read the index at most once per miss_refresh_interval
+        self.assertIsNone(self.index.find_by_ip('192.168.0.2'))
+        self.assertEqual(etcd_mock.return_value.get.call_count, 1)
+        self.index._loaded_at -= self.index.miss_refresh_interval
+        self.assertEqual(self.index.find_by_ip('192.168.0.2'), 'rhost')
+        self.assertEqual(etcd_mock.return_value.get.call_count, 2)
+        self.assertEqual(self.index.find_by_ip('192.168.0.1'), 'node1')
+        self.assertEqual(etcd_mock.return_value.get.call_count, 2)
+
+        self.assertEqual(self.index.get_hosts(), ['node1', 'rhost'])
+        self.assertEqual(etcd_mock.return_value.get.call_count, 2)
+
+        self.index._loaded_at -= self.index.ttl
+        self.assertEqual(self.index.find_by_ip('192.168.0.1'), 'node1')
+        self.assertEqual(etcd_mock.return_value.get.call_count, 3)
+
+    def test_functions(self, etcd_mock):
+        self._hosts(etcd_mock, calico_host('node1', '192.168.0.1', '10.1.0.1'))
+        with mock.patch.object(utils, 'calico_hosts', self.index):
+            self.assertEqual(utils.find_remote_host_tunl_addr('192.168.0.1'),
+                             ('10.1.0.1', None))
+            self.assertEqual(utils.find_remote_host_tunl_addr('192.168.0.9'),
+                             (None, None))
+            self.assertEqual(utils.get_current_calico_hosts(),
+                             (['node1'], None))
+            self.assertEqual(utils.get_calico_ip_tunnel_address('node1'),
+                             '10.1.0.1')
+
+            response = mock.Mock(status_code=404)
+            etcd_mock.return_value.get.side_effect = \
+                utils.requests.exceptions.HTTPError(response=response)
+            self.index._loaded_at -= self.index.miss_refresh_interval
+            self.assertIsNone(utils.get_calico_ip_tunnel_address('node2'))
+            self.assertEqual(utils.find_calico_host_by_ip('192.168.0.9'),
+                             (None, None))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -28,7 +28,7 @@ from flask_testing import TestCase as FlaskBaseTestCase
 from nose.plugins.attrib import attr
 
 from . import create_app, fixtures
-from ..core import db
+from ..core import db, PubSubCache
 from ..utils import atomic
 
 
@@ -78,6 +78,8 @@ class DBTestCase(FlaskTestCase):
             super(DBTestCase, self).run(*args, **kwargs)
         finally:
             self._transaction.rollback()
+            # data of the rolled back transaction might be cached
+            PubSubCache.invalidate_all()
         self._transaction.connection.invalidate()
         self._transaction.connection.close()
         self.db.session.remove()
@@ -22,12 +22,13 @@
 
 import os
 import re
+import socket
 import sys
 import subprocess
-from fabric.api import env, run, output
-from fabric.network import disconnect_all
-from fabric.exceptions import NetworkError, CommandTimeout
-from kubedock.core import ssh_connect
+from multiprocessing.pool import ThreadPool
+from multiprocessing import TimeoutError
+from paramiko import SSHException
+from kubedock.core import ssh_pool
 from kubedock.utils import NODE_STATUSES
 
 if __name__ == '__main__' and __package__ is None:
@@ -36,15 +37,21 @@ if __name__ == '__main__' and __package__ is None:
 
 from kubedock.api import create_app
 from kubedock.users.models import User
+from kubedock.pods.models import Pod
+from kubedock.kapi.helpers import KubeQuery
 from kubedock.kapi.node_utils import get_nodes_collection
-from kubedock.kapi.podcollection import PodCollection
 from kubedock.kapi.nodes import get_kuberdock_logs_pod_name
-from kubedock.updates.helpers import setup_fabric
 from kubedock.settings import KUBERDOCK_INTERNAL_USER
 from kubedock.utils import POD_STATUSES
 
 
 SSH_TIMEOUT = 15
+# Max number of nodes checked at the same time
+CONCURRENCY = 20
+# Every node check consists of ssh connect and 3 commands, each of them is
+# limited by SSH_TIMEOUT. Node which is not checked in this time is
+# considered as unavailable through ssh.
+NODE_CHECK_TIMEOUT = 5 * SSH_TIMEOUT
 MAX_DISK_PERCENTAGE = 90
 MESSAGES = {
     'disk': "\tLow disk space: {}",
@@ -74,28 +81,28 @@ def get_service_state(service):
         return False
 
 
-def get_services_state(services, local=True):
-    if local:
+def run_remote(ssh, command):
+    """Run command on node through ssh connection.
+    :return: tuple (exit code, output)
+    """
+    _, o, _ = ssh.exec_command(command, timeout=SSH_TIMEOUT)
+    output = o.read()
+    return o.channel.recv_exit_status(), output
+
+
+def get_services_state(services, ssh=None):
+    """State of services on master or on node if `ssh` is specified."""
+    if ssh is None:
         try:
             rv = subprocess.check_output(['systemctl', 'is-active'] + services)
         except subprocess.CalledProcessError as e:
             rv = e.output
     else:
-        rv = run('systemctl is-active ' + ' '.join(services),
-                 quiet=True, timeout=SSH_TIMEOUT)
+        _, rv = run_remote(ssh, 'systemctl is-active ' + ' '.join(services))
     status = [status == 'active' for status in rv.splitlines()]
     return dict(zip(services, status))
 
 
-def can_ssh_to_host(hostname):
-    ssh, err = ssh_connect(hostname)
-    if err:
-        return False
-    else:
-        ssh.close()
-        return True
-
-
 def get_node_state(node):
     status = {}
     if node.get('status') == NODE_STATUSES.pending:
@@ -103,48 +110,77 @@ def get_node_state(node):
         return status
     hostname = node['hostname']
     status[NODE_STATUSES.running] = node.get('status') == NODE_STATUSES.running
-    env.host_string = hostname
     try:
         status['ntp'] = False
         status['services'] = False
         # AC-3105 Fix. Check if master can connect to node via ssh.
-        if can_ssh_to_host(hostname):
-            rv = run('ntpstat', quiet=True, timeout=SSH_TIMEOUT)
-            if rv.succeeded:
-                status['ntp'] = True
+        with ssh_pool.connect(hostname, timeout=SSH_TIMEOUT) as (ssh, err):
+            if err:
+                status['ssh'] = False
+                return status
+            code, _ = run_remote(ssh, 'ntpstat')
+            status['ntp'] = code == 0
             status['ssh'] = True
-            stopped = get_stopped_services(node_services, local=False)
+            stopped = get_stopped_services(node_services, ssh=ssh)
             status['services'] = stopped if stopped else True
-            status['disk'] = check_disk_space(local=False)
-        else:
-            status['ssh'] = False
-    except (NetworkError, CommandTimeout):
+            status['disk'] = check_disk_space(ssh=ssh)
+    except (SSHException, socket.error, EOFError):
         status['ssh'] = False
     return status
 
 
 def get_nodes_state():
-    setup_fabric()
+    """Check all nodes concurrently (at most CONCURRENCY at the same time).
+    Node which is not checked in NODE_CHECK_TIMEOUT is considered as
+    unavailable through ssh.
+    """
     nodes = get_nodes_collection()
-    nodes_status = {
-        node['hostname']: get_node_state(node) for node in nodes}
+    if not nodes:
+        return {}
+    pool = ThreadPool(min(len(nodes), CONCURRENCY))
+    try:
+        results = [(node, pool.apply_async(get_node_state, (node,)))
+                   for node in nodes]
+        nodes_status = {}
+        for node, result in results:
+            try:
+                state = result.get(NODE_CHECK_TIMEOUT)
+            except TimeoutError:
+                state = {
+                    NODE_STATUSES.running:
+                        node.get('status') == NODE_STATUSES.running,
+                    'ssh': False, 'ntp': False, 'services': False,
+                }
+            nodes_status[node['hostname']] = state
+    finally:
+        pool.terminate()
     return nodes_status
 
 
 def get_internal_pods_state():
+    """Running state of internal pods by their names. Pods are requested
+    from kubernetes by owner label only, without building PodCollection.
+    """
     ki = User.filter_by(username=KUBERDOCK_INTERNAL_USER).first()
-    pod_statuses = {}
-    for pod in PodCollection(ki).get(as_json=False):
-        pod_statuses[pod['name']] = pod['status'] == POD_STATUSES.running
-    return pod_statuses
-
-
-def get_disk_usage(local=True):
-    if local:
+    db_pods = Pod.query.filter(Pod.owner_id == ki.id,
+                               Pod.status != POD_STATUSES.deleted)
+    k8s_pods = KubeQuery().get(
+        ['pods'], {'labelSelector': 'kuberdock-user-uid={0}'.format(ki.id)})
+    running = set()
+    for k8s_pod in k8s_pods.get('items', []):
+        phase = k8s_pod.get('status', {}).get('phase', '')
+        if phase.lower() == POD_STATUSES.running:
+            running.add(k8s_pod['metadata'].get('labels', {}).get(
+                'kuberdock-pod-uid'))
+    return {pod.name: pod.id in running for pod in db_pods}
+
+
+def get_disk_usage(ssh=None):
+    """Disk usage on master or on node if `ssh` is specified."""
+    if ssh is None:
         rv = subprocess.check_output(['df', '--output=source,pcent,target'])
     else:
-        rv = run("df --output=source,pcent,target", quiet=True,
-                 timeout=SSH_TIMEOUT)
+        _, rv = run_remote(ssh, 'df --output=source,pcent,target')
     lines = rv.splitlines()[1:]
     r = re.compile('((?!tmpfs|cdrom|SEPID).)*$')
     lines = filter(r.match, lines)
@@ -152,14 +188,14 @@ def get_disk_usage(local=True):
     return usage
 
 
-def check_disk_space(local=True):
-    usage = get_disk_usage(local)
+def check_disk_space(ssh=None):
+    usage = get_disk_usage(ssh)
     warn = [disk for disk in usage if int(disk[1][:-1]) > MAX_DISK_PERCENTAGE]
     return ', '.join([' - '.join(disk) for disk in warn]) if warn else True
 
 
-def get_stopped_services(services, local=True):
-    services = get_services_state(services, local)
+def get_stopped_services(services, ssh=None):
+    services = get_services_state(services, ssh)
     stopped = [service for service, status in services.items() if not status]
     return stopped
 
@@ -216,10 +252,7 @@ def check_cluster():
     if nodes:
         msg.append("Nodes errors:")
         msg.append(nodes)
-    store = output.status
-    output.status = False
-    disconnect_all()
-    output.status = store
+    ssh_pool.close_all()
     return os.linesep.join(msg)
 
 
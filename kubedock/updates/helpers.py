@@ -23,17 +23,21 @@ Most of this helper functions should be used for constructing 000XX_update.py
 scripts.
 """
 
+import multiprocessing
 import os
 import re
+import select
 import subprocess
 import time
 
 from fabric.api import run, env, output, local as fabric_local
+from fabric.state import connections
 
 from kubedock import settings
 from kubedock.core import db
 from kubedock.rbac.models import Role
 from kubedock.sessions import SessionData
+from kubedock.updates.models import format_traceback
 from kubedock.utils import send_event_to_role
 
 # For convenience to use in update scripts:
@@ -289,3 +293,134 @@ def fabric_retry(f, cmd, retry_pause, max_retries, exc_message=None, upd=None,
         time.sleep(retry_pause)
     if exc_message:
         raise UpgradeError(exc_message.format(out=out), code=out.return_code)
+
+
+class NodeLog(object):
+    """
+    Replacement of update db record for functions running on a node in a
+    separate process (see :class:`ParallelNodeExecutor`). Messages are
+    printed with hostname prefix and sent to the parent process.
+    """
+
+    def __init__(self, hostname, conn):
+        self.hostname = hostname
+        self.conn = conn
+
+    def print_log(self, *msg):
+        for m in msg:
+            m = m.decode('utf-8') if isinstance(m, str) else unicode(m)
+            print u'\n'.join(u'[{0}] {1}'.format(self.hostname, line)
+                             for line in m.splitlines())
+            self.conn.send(('log', m))
+
+    def capture_traceback(self, header='', footer=''):
+        self.print_log(format_traceback(header, footer))
+
+
+class _NodeJob(object):
+    def __init__(self, hostname, process, conn):
+        self.hostname = hostname
+        self.process = process
+        self.conn = conn
+        self.started = time.time()
+        self.log = []
+        self.result = None
+        self.finished = False
+
+    def receive(self):
+        try:
+            while not self.finished and self.conn.poll():
+                kind, value = self.conn.recv()
+                if kind == 'log':
+                    self.log.append(value)
+                else:
+                    self.result = value
+                    self.finished = True
+        except (EOFError, IOError):
+            # child process has exited without sending result
+            self.finished = True
+            self.result = False
+            self.log.append(u'Process of node {0} exited unexpectedly'
+                            .format(self.hostname))
+
+    def terminate(self, timeout):
+        self.process.terminate()
+        self.finished = True
+        self.result = False
+        self.log.append(u'Node {0} has not finished in {1} seconds. '
+                        u'Terminated.'.format(self.hostname, timeout))
+
+    def close(self):
+        self.conn.close()
+        self.process.join()
+
+
+class ParallelNodeExecutor(object):
+    """
+    Runs `func(hostname, log)` on several nodes at once. Each node is
+    processed in a separate process, because fabric keeps the current host
+    in global `env` (`env.host_string` is set in the process to hostname).
+    `log` has the same `print_log` and `capture_traceback` methods as update
+    db record. If `func` raises an exception, traceback is written to the log
+    and result of the node is False.
+
+    At most `concurrency` nodes are processed at the same time. Node which is
+    not finished in `timeout` seconds is terminated and its result is False.
+    """
+    poll_interval = 1
+
+    def __init__(self, func, concurrency=None, timeout=None):
+        self.func = func
+        self.concurrency = max(
+            concurrency or settings.NODE_UPGRADE_CONCURRENCY, 1)
+        self.timeout = timeout or settings.NODE_UPGRADE_TIMEOUT
+
+    def run(self, hostnames):
+        """
+        Generator of `(hostname, result, log)` in order nodes are finished.
+        `log` is a list of messages of the node.
+        """
+        pending = list(hostnames)
+        running = []
+        while pending or running:
+            while pending and len(running) < self.concurrency:
+                running.append(self._start(pending.pop(0)))
+            select.select([job.conn for job in running], [], [],
+                          self.poll_interval)
+            for job in running[:]:
+                job.receive()
+                if (not job.finished and
+                        time.time() - job.started > self.timeout):
+                    job.terminate(self.timeout)
+                if job.finished:
+                    job.close()
+                    running.remove(job)
+                    yield job.hostname, job.result, job.log
+
+    def _start(self, hostname):
+        # Child process must not use db connections of the parent process,
+        # so close all of them before fork.
+        db.session.commit()
+        db.engine.dispose()
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=self._run_on_node, args=(hostname, reader, writer))
+        process.daemon = True
+        process.start()
+        writer.close()
+        return _NodeJob(hostname, process, reader)
+
+    def _run_on_node(self, hostname, reader, writer):
+        reader.close()
+        # Do not reuse fabric connections of the parent process
+        connections.clear()
+        env.host_string = hostname
+        log = NodeLog(hostname, writer)
+        try:
+            result = self.func(hostname, log)
+        except Exception:
+            log.capture_traceback(
+                'Exception raised on node {0}'.format(hostname))
+            result = False
+        writer.send(('result', result))
+        writer.close()
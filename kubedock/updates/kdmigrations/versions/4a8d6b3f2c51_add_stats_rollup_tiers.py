@@ -0,0 +1,73 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+"""Add limits to stat_wrap_5min, add hourly and daily stats tiers
+
+Revision ID: 4a8d6b3f2c51
+Revises: 11bf9b6a89b2
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4a8d6b3f2c51'
+down_revision = '11bf9b6a89b2'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def _create_tier(table, pk_name):
+    op.create_table(
+        table,
+        sa.Column('time_window', sa.Integer(), nullable=False),
+        sa.Column('host', sa.String(length=64), nullable=False),
+        sa.Column('unit_name', sa.String(length=255), nullable=False),
+        sa.Column('container', sa.String(length=255), nullable=False),
+        sa.Column('cpu', sa.Float(), nullable=False),
+        sa.Column('memory', sa.Float(), nullable=False),
+        sa.Column('rxb', sa.Float(), nullable=False),
+        sa.Column('txb', sa.Float(), nullable=False),
+        sa.Column('fs_data', sa.Text(), nullable=True),
+        sa.Column('cpu_limit', sa.Float(), nullable=True),
+        sa.Column('memory_limit', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('time_window', 'host', 'unit_name',
+                                'container', name=pk_name)
+    )
+    op.create_index('ix_{0}_unit_name'.format(table), table,
+                    ['unit_name'], unique=False)
+    op.create_index('ix_{0}_container'.format(table), table,
+                    ['container'], unique=False)
+
+
+def upgrade():
+    op.add_column('stat_wrap_5min',
+                  sa.Column('cpu_limit', sa.Float(), nullable=True))
+    op.add_column('stat_wrap_5min',
+                  sa.Column('memory_limit', sa.Float(), nullable=True))
+    _create_tier('stat_wrap_hour', 'hour_window_entry')
+    _create_tier('stat_wrap_day', 'day_window_entry')
+
+
+def downgrade():
+    op.drop_table('stat_wrap_day')
+    op.drop_table('stat_wrap_hour')
+    op.drop_column('stat_wrap_5min', 'memory_limit')
+    op.drop_column('stat_wrap_5min', 'cpu_limit')
@@ -198,7 +198,9 @@ def upgrade_nodes(upgrade_node, downgrade_node, db_upd, with_testing,
                   evict_pods=False):
     """
     Do upgrade_node function on each node and fallback to downgrade_node
-    if errors.
+    if errors. Nodes are upgraded in parallel (see
+    settings.NODE_UPGRADE_CONCURRENCY and settings.NODE_UPGRADE_TIMEOUT),
+    failed node does not stop upgrade of other nodes.
     :param upgrade_node: callable in current upgrade script
     :param downgrade_node: callable in current upgrade script
     :param db_upd: db record of current update script
@@ -221,55 +223,40 @@ def upgrade_nodes(upgrade_node, downgrade_node, db_upd, with_testing,
     db_upd.status = UPDATE_STATUSES.nodes_started
     db_upd.print_log('Started nodes upgrade. {0} nodes will be upgraded...'
                      .format(len(nodes)))
-    for node in nodes:
-        if not set_schedulable(node.hostname, False, db_upd):
-            successful = False
-            if not node.upgrade_status == UPDATE_STATUSES.failed_downgrade:
-                node.upgrade_status = UPDATE_STATUSES.failed
-            db.session.add(node)
-            db.session.commit()
-            db_upd.print_log('Failed to make node {0} unschedulable. Skip node.'
-                             .format(node.hostname))
-            continue
+    nodes = {node.hostname: node for node in nodes}
+    nodes_ips = {node.hostname: node.ip for node in nodes.itervalues()}
+
+    def _upgrade_node(hostname, log):
+        # Runs in a separate process for each node, so `log` is used instead
+        # of db_upd here
+        if not set_schedulable(hostname, False, log):
+            log.print_log('Failed to make node {0} unschedulable. Skip node.'
+                          .format(hostname))
+            return None
+        log.print_log('Upgrading {0} ...'.format(hostname))
+        run('yum --enablerepo=kube,kube-testing clean metadata')
+        upgrade_node(log, with_testing, env, node_ip=nodes_ips[hostname])
+        set_schedulable(hostname, True, log)
+        log.print_log('Node {0} successfully upgraded'.format(hostname))
+        return True
 
-        env.host_string = node.hostname
-        node.upgrade_status = UPDATE_STATUSES.started
-        db_upd.print_log('Upgrading {0} ...'.format(node.hostname))
-        try:
-            run('yum --enablerepo=kube,kube-testing clean metadata')
-            upgrade_node(db_upd, with_testing, env, node_ip=node.ip)
-        except Exception as e:
-            successful = False
-            node.upgrade_status = UPDATE_STATUSES.failed
-            db_upd.capture_traceback(
-                'Exception raised during '
-                'upgrade node {0}'.format(node.hostname)
-            )
-            try:
-                # Deprecated. Will be totally removed in AC-5692
-                # downgrade_node(db_upd, with_testing, env, e)
-                pass
-            except Exception as e:
-                node.upgrade_status = UPDATE_STATUSES.failed_downgrade
-                db_upd.capture_traceback(
-                    'Exception raised during '
-                    'downgrade node {0}'.format(node.hostname)
-                )
-            else:
-                # Check here if new master is compatible with old nodes
-                # set_schedulable(node.hostname, True, db_upd)
-                pass
-                # Deprecated. Will be totally removed in AC-5692
-                # db_upd.print_log('Node {0} successfully downgraded'
-                #                  .format(node.hostname))
-        else:
-            set_schedulable(node.hostname, True, db_upd)
+    executor = helpers.ParallelNodeExecutor(_upgrade_node)
+    for hostname, result, log in executor.run(sorted(nodes)):
+        node = nodes[hostname]
+        if result:
             node.upgrade_status = UPDATE_STATUSES.applied
-            db_upd.print_log('Node {0} successfully upgraded'
-                             .format(node.hostname))
-        finally:
-            db.session.add(node)
-            db.session.commit()
+        else:
+            successful = False
+            # Node could not be made unschedulable, so nothing was done and
+            # previous failed_downgrade status is still actual
+            if not (result is None and node.upgrade_status ==
+                    UPDATE_STATUSES.failed_downgrade):
+                node.upgrade_status = UPDATE_STATUSES.failed
+        # Logs of nodes are already printed by their processes, so they are
+        # only saved here. One block per node to not mix logs of nodes.
+        db_upd.append_log(u'=== Node {0} ==='.format(hostname), *log)
+        db.session.add(node)
+        db.session.commit()
     return successful
 
 
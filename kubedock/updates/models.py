@@ -24,6 +24,23 @@ from ..core import db
 from kubedock.models_mixin import BaseModelMixin
 
 
+def format_traceback(header='', footer=''):
+    """Format traceback of the exception being handled for update log."""
+    return (
+        '{0}{1}'
+        '=== Begin of captured traceback ===\n'
+        '{2}'
+        '=== End of captured traceback ==={3}'
+        '{4}'.format(
+            header,
+            '\n' if header else '',
+            traceback.format_exc(),
+            '\n' if footer else '',
+            footer
+        )
+    )
+
+
 class Updates(BaseModelMixin, db.Model):
     __tablename__ = 'updates'
     fname = db.Column(db.Text, primary_key=True, nullable=False)
@@ -47,23 +64,18 @@ class Updates(BaseModelMixin, db.Model):
             m = [i.decode('utf-8') if isinstance(i, str) else unicode(i)
                  for i in msg]
             print u'\n'.join(m)
+            self.append_log(*m)
+
+    def append_log(self, *msg):
+        """Same as `print_log`, but does not print messages to stdout."""
+        if len(msg) > 0:
+            m = [i.decode('utf-8') if isinstance(i, str) else unicode(i)
+                 for i in msg]
             self.log = u'\n'.join(([self.log] if self.log else []) + m) + u'\n'
             self.save()
 
     def capture_traceback(self, header='', footer=''):
-        self.print_log(
-            '{0}{1}'
-            '=== Begin of captured traceback ===\n'
-            '{2}'
-            '=== End of captured traceback ==={3}'
-            '{4}'.format(
-                header,
-                '\n' if header else '',
-                traceback.format_exc(),
-                '\n' if footer else '',
-                footer
-            )
-        )
+        self.print_log(format_traceback(header, footer))
 
     def __repr__(self):
         return "<Update(fname='{0}', status='{1}')>".format(self.fname,
@@ -37,9 +37,11 @@ from kubedock.core import db
 from kubedock.domains.models import BaseDomain, PodDomain
 from kubedock.kapi import ingress, node_utils, nodes
 from kubedock.kapi.configmap import ConfigMapClient, ConfigMapNotFound
-from kubedock.kapi.helpers import KubeQuery
+from kubedock.kapi.helpers import (KUBERDOCK_POD_UID, KUBERDOCK_USER_UID,
+                                   KubeQuery, Services)
 from kubedock.kapi.nodes import KUBERDOCK_DNS_POD_NAME, create_dns_pod
 from kubedock.kapi.podcollection import PodCollection
+from kubedock.kapi.podutils import raise_if_failure
 from kubedock.network_policies_utils import create_network_policies
 from kubedock.nodes.models import Node
 from kubedock.pods.models import Pod
@@ -507,6 +509,63 @@ def _upgrade_220(upd, with_testing, *args, **kwargs):
 def _downgrade_220(upd, with_testing, exception, *args, **kwargs):
     pass
 ##################### END   220 update script #################################
+####$################ BEGIN 221 update script #################################
+def _upgrade_node_221(upd, with_testing, env, *args, **kwargs):
+    pass
+
+
+def _downgrade_node_221(upd, with_testing, env, exception, *args, **kwargs):
+    pass
+
+
+def _upgrade_221(upd, with_testing, *args, **kwargs):
+    upd.print_log('Adding stats rollup tiers...')
+    helpers.upgrade_db(revision='4a8d6b3f2c51')
+
+
+def _downgrade_221(upd, with_testing, exception, *args, **kwargs):
+    upd.print_log('Dropping stats rollup tiers...')
+    helpers.downgrade_db(revision='11bf9b6a89b2')
+##################### END   221 update script #################################
+####$################ BEGIN 222 update script #################################
+def _label_services_with_owners(upd, label=True):
+    services = Services()
+    for svc in services.get_all():
+        labels = svc['metadata'].get('labels') or {}
+        pod_id = labels.get(KUBERDOCK_POD_UID)
+        if pod_id is None or (KUBERDOCK_USER_UID in labels) == label:
+            continue
+        owner_id = None
+        if label:
+            pod = Pod.query.get(pod_id)
+            if pod is None:
+                continue
+            owner_id = str(pod.owner_id)
+        name = svc['metadata']['name']
+        namespace = svc['metadata']['namespace']
+        data = {'metadata': {'labels': {KUBERDOCK_USER_UID: owner_id}}}
+        rv = services.patch(name, namespace, data)
+        raise_if_failure(rv, "Couldn't patch service: {}".format(rv))
+        upd.print_log('Service {0}/{1} is updated'.format(namespace, name))
+
+
+def _upgrade_node_222(upd, with_testing, env, *args, **kwargs):
+    pass
+
+
+def _downgrade_node_222(upd, with_testing, env, exception, *args, **kwargs):
+    pass
+
+
+def _upgrade_222(upd, with_testing, *args, **kwargs):
+    upd.print_log('Labelling services with owners...')
+    _label_services_with_owners(upd)
+
+
+def _downgrade_222(upd, with_testing, exception, *args, **kwargs):
+    upd.print_log('Removing owner labels of services...')
+    _label_services_with_owners(upd, label=False)
+##################### END   222 update script #################################
 
 updates = [
     195,
@@ -520,6 +579,8 @@ updates = [
     213,
     214,
     220,
+    221,
+    222,
 ]
 
 
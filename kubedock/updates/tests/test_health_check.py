@@ -19,8 +19,11 @@
 # along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
 
 import mock
+import socket
 import unittest
 import subprocess
+import threading
+import time
 
 from kubedock.updates import health_check
 from kubedock.kapi import node_utils
@@ -150,6 +153,89 @@ class TestHealthCheck(unittest.TestCase):
         self.assertEquals(len(nodes_state), 2)
         self.assertEquals(nodes_state['node1'], nodes_state['node2'])
 
+    @mock.patch.object(health_check, 'NODE_CHECK_TIMEOUT', 0.5)
+    @mock.patch.object(health_check, 'get_nodes_collection')
+    @mock.patch.object(health_check, 'get_node_state')
+    def test_get_nodes_state_timeout(self, mock_get_node_state,
+                                     mock_node_utils):
+        hung = threading.Event()
+        self.addCleanup(hung.set)
+
+        def get_node_state(node):
+            if node['hostname'] == 'node1':
+                hung.wait(5)
+            return {'ssh': True}
+
+        mock_get_node_state.side_effect = get_node_state
+        mock_node_utils.return_value = [
+            {'hostname': 'node1', 'status': NODE_STATUSES.running},
+            {'hostname': 'node2', 'status': NODE_STATUSES.running}]
+        started = time.time()
+        nodes_state = health_check.get_nodes_state()
+        self.assertLess(time.time() - started, 4)
+        self.assertEqual(nodes_state['node2'], {'ssh': True})
+        self.assertEqual(nodes_state['node1'], {
+            NODE_STATUSES.running: True,
+            'ssh': False, 'ntp': False, 'services': False})
+
+    @mock.patch.object(health_check, 'ssh_pool')
+    def test_get_node_state(self, mock_ssh_pool):
+        ssh = mock.Mock()
+        connect = mock_ssh_pool.connect.return_value.__enter__
+        connect.return_value = (ssh, None)
+        outputs = {
+            'ntpstat': (0, ''),
+            'systemctl is-active ' + ' '.join(health_check.node_services):
+                (3, 'active\nactive\ninactive\nactive\n'),
+            'df --output=source,pcent,target':
+                (0, 'Filesystem Use% Mounted on\n/dev/sda1 10% /\n'),
+        }
+
+        def exec_command(command, timeout):
+            code, output = outputs[command]
+            stdout = mock.Mock()
+            stdout.read.return_value = output
+            stdout.channel.recv_exit_status.return_value = code
+            return None, stdout, None
+
+        ssh.exec_command.side_effect = exec_command
+        node = {'hostname': 'node1', 'status': NODE_STATUSES.running}
+        self.assertEqual(health_check.get_node_state(node), {
+            NODE_STATUSES.running: True, 'ssh': True, 'ntp': True,
+            'services': ['kube-proxy'], 'disk': True})
+        mock_ssh_pool.connect.assert_called_once_with(
+            'node1', timeout=health_check.SSH_TIMEOUT)
+
+        connect.return_value = (None, 'Connection timeout')
+        self.assertEqual(health_check.get_node_state(node), {
+            NODE_STATUSES.running: True, 'ssh': False, 'ntp': False,
+            'services': False})
+
+        connect.return_value = (ssh, None)
+        ssh.exec_command.side_effect = socket.timeout
+        self.assertFalse(health_check.get_node_state(node)['ssh'])
+
+    @mock.patch.object(health_check, 'KubeQuery')
+    @mock.patch.object(health_check, 'Pod')
+    @mock.patch.object(health_check, 'User')
+    def test_get_internal_pods_state(self, mock_user, mock_pod, mock_kq):
+        mock_user.filter_by.return_value.first.return_value.id = 3
+        pods = [mock.Mock(id='uid1'), mock.Mock(id='uid2'),
+                mock.Mock(id='uid3')]
+        for i, pod in enumerate(pods, 1):
+            pod.name = 'pod{0}'.format(i)
+        mock_pod.query.filter.return_value = pods
+        mock_kq.return_value.get.return_value = {'items': [
+            {'metadata': {'labels': {'kuberdock-pod-uid': 'uid1'}},
+             'status': {'phase': 'Running'}},
+            {'metadata': {'labels': {'kuberdock-pod-uid': 'uid2'}},
+             'status': {'phase': 'Pending'}},
+        ]}
+        self.assertEqual(health_check.get_internal_pods_state(),
+                         {'pod1': True, 'pod2': False, 'pod3': False})
+        mock_kq.return_value.get.assert_called_once_with(
+            ['pods'], {'labelSelector': 'kuberdock-user-uid=3'})
+
     @mock.patch.object(health_check.subprocess, 'check_output')
     def test_get_services_state(self, mock_check_output):
         services = ['etcd', 'ntpd']
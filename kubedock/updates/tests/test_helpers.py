@@ -0,0 +1,120 @@
+
+# KuberDock - is a platform that allows users to run applications using Docker
+# container images and create SaaS / PaaS based on these applications.
+# Copyright (C) 2017 Cloud Linux INC
+#
+# This file is part of KuberDock.
+#
+# KuberDock is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# KuberDock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KuberDock; if not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import time
+import unittest
+
+import mock
+from fabric.api import env
+
+from kubedock.updates import helpers
+
+
+class TestParallelNodeExecutor(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(helpers, 'db')
+        self.addCleanup(patcher.stop)
+        self.db = patcher.start()
+
+    def run_executor(self, func, hostnames, **kwargs):
+        executor = helpers.ParallelNodeExecutor(func, **kwargs)
+        executor.poll_interval = 0.05
+        return {hostname: (result, log)
+                for hostname, result, log in executor.run(hostnames)}
+
+    def test_run(self):
+        def func(hostname, log):
+            log.print_log('host {0}'.format(env.host_string), 'done')
+            return hostname != 'node2'
+
+        res = self.run_executor(func, ['node1', 'node2'], concurrency=2)
+        self.assertEqual(res, {
+            'node1': (True, ['host node1', 'done']),
+            'node2': (False, ['host node2', 'done']),
+        })
+        # db connections are closed before each fork
+        self.assertEqual(self.db.engine.dispose.call_count, 2)
+
+    def test_failure_isolation(self):
+        def func(hostname, log):
+            log.print_log('started')
+            if hostname == 'node1':
+                raise Exception('Node is broken')
+            return True
+
+        res = self.run_executor(func, ['node1', 'node2'])
+        self.assertEqual(res['node2'], (True, ['started']))
+        result, log = res['node1']
+        self.assertFalse(result)
+        self.assertEqual(log[0], 'started')
+        self.assertIn('Exception raised on node node1', log[1])
+        self.assertIn('Node is broken', log[1])
+
+    def test_timeout(self):
+        def func(hostname, log):
+            log.print_log('started')
+            if hostname == 'node1':
+                time.sleep(30)
+            return True
+
+        started = time.time()
+        res = self.run_executor(func, ['node1', 'node2'], timeout=0.5)
+        self.assertLess(time.time() - started, 10)
+        self.assertEqual(res['node2'], (True, ['started']))
+        result, log = res['node1']
+        self.assertFalse(result)
+        self.assertEqual(log[0], 'started')
+        self.assertIn('has not finished in 0.5 seconds', log[1])
+
+    def test_unexpected_exit(self):
+        def func(hostname, log):
+            log.print_log('started')
+            os._exit(1)
+
+        res = self.run_executor(func, ['node1'])
+        result, log = res['node1']
+        self.assertFalse(result)
+        self.assertEqual(log[0], 'started')
+        self.assertIn('exited unexpectedly', log[1])
+
+    def test_concurrency(self):
+        running = multiprocessing.Value('i', 0)
+        max_running = multiprocessing.Value('i', 0)
+
+        def func(hostname, log):
+            with running.get_lock():
+                running.value += 1
+                max_running.value = max(max_running.value, running.value)
+            time.sleep(0.2)
+            with running.get_lock():
+                running.value -= 1
+            return True
+
+        hostnames = ['node{0}'.format(i) for i in range(6)]
+        res = self.run_executor(func, hostnames, concurrency=2)
+        self.assertEqual(res, {hostname: (True, []) for hostname in hostnames})
+        self.assertEqual(max_running.value, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
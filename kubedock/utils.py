@@ -29,6 +29,7 @@ import string
 import struct
 import subprocess
 import sys
+import threading
 import time
 from collections import namedtuple
 from contextlib import contextmanager
@@ -42,18 +43,18 @@ import ipaddress
 import requests
 import yaml
 from flask import (current_app, request, jsonify, g, has_app_context, Response,
-                   session, has_request_context)
+                   session, has_request_context, stream_with_context)
 from sqlalchemy.exc import SQLAlchemyError, InvalidRequestError
 from werkzeug.wrappers import Response as ResponseBase
 
 from .core import ssh_connect, db, ConnectionPool
-from .exceptions import APIError, PermissionDenied, NoFreeIPs, NoSuitableNode
+from .exceptions import (
+    APIError, PermissionDenied, NoFreeIPs, NoSuitableNode, api_error_to_dict)
 from .login import current_user, AnonymousUserMixin
 from .rbac.models import Role
 from .settings import (
     KUBE_MASTER_URL, KUBE_BASE_URL, KUBE_API_VERSION, NODE_TOBIND_EXTERNAL_IPS,
-    ETCD_CALICO_HOST_CONFIG_KEY_PATH_TEMPLATE,
-    ETCD_CALICO_HOST_KEY_PATH_TEMPLATE, ETCD_CALICO_URL
+    ETCD_CALICO_URL
 )
 from .users.models import SessionData
 
@@ -619,6 +620,42 @@ class KubeUtils(object):
 
         return wrapper
 
+    @staticmethod
+    def stream_json_list(items):
+        """Streams response in format of `jsonwrap` with list of `items`
+        as data. Items are serialized one by one, so `items` may be a
+        generator.
+        The first item is serialized before the response is started, so an
+        error at this point is returned as usual. If a later item fails,
+        the list is ended with {"error": <error description>}, so the
+        response is still a valid JSON.
+        """
+        items = iter(items)
+        try:
+            first = json.dumps(next(items), cls=current_app.json_encoder)
+        except StopIteration:
+            first = None
+
+        def generate():
+            yield '{"status": "OK", "data": ['
+            if first is not None:
+                yield first
+                try:
+                    for item in items:
+                        yield ', ' + json.dumps(
+                            item, cls=current_app.json_encoder)
+                except Exception as e:
+                    if not isinstance(e, APIError):
+                        current_app.logger.exception(
+                            'Failed to serialize an item of the list')
+                        e = APIError('Unexpected error: {0!r}'.format(e),
+                                     status_code=500)
+                    yield ', ' + json.dumps({'error': api_error_to_dict(e)},
+                                            cls=current_app.json_encoder)
+            yield ']}'
+        return Response(stream_with_context(generate()),
+                        mimetype='application/json')
+
     @classmethod
     def pod_start_permissions(cls, func):
         @wraps(func)
@@ -1055,6 +1092,99 @@ def get_hostname():
         return socket.gethostname()
 
 
+class CalicoHostIndex(object):
+    """Per-process index of calico hosts: bird IP and IPIP tunnel address of
+    every host. It's built from one recursive read of the calico host
+    subtree in etcd. The index is re-read when it's older than `ttl` seconds
+    or when a lookup misses (e.g. a host has just been registered), but not
+    more often than once per `miss_refresh_interval` seconds: misses are
+    usual for addresses which are not calico hosts and every re-read
+    downloads the whole subtree.
+    """
+    ttl = 30
+    miss_refresh_interval = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = None
+        self._by_ip = None
+        self._loaded_at = 0
+
+    def refresh(self):
+        """Re-reads calico hosts from etcd.
+        Raises requests.RequestException if etcd is not available.
+        """
+        try:
+            resp = Etcd(ETCD_CALICO_URL + '/host').get(recursive=True)
+            nodes = resp[u'node'].get(u'nodes', [])
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            nodes = []
+        hosts, by_ip = {}, {}
+        for host in nodes:
+            if not host.get(u'dir'):
+                continue
+            hostname = host[u'key'].rsplit(u'/', 1)[-1]
+            values = self._flatten(host, len(host[u'key']) + 1)
+            hosts[hostname] = {
+                'bird_ip': values.get(u'bird_ip'),
+                'tunnel_address': values.get(
+                    u'config/' + ETCD_KEY_CALICO_HOST_IP_TUNNEL_ADDRESS),
+            }
+            if hosts[hostname]['bird_ip']:
+                by_ip[hosts[hostname]['bird_ip']] = hostname
+        with self._lock:
+            self._hosts, self._by_ip = hosts, by_ip
+            self._loaded_at = time.time()
+
+    @staticmethod
+    def _flatten(node, prefix_len):
+        """Returns values of host keys which are interesting for us."""
+        values = {}
+        stack = list(node.get(u'nodes', []))
+        while stack:
+            item = stack.pop()
+            key = item[u'key'][prefix_len:]
+            if item.get(u'dir'):
+                # skip heavy workload and endpoint subtrees
+                if key == u'config':
+                    stack.extend(item.get(u'nodes', []))
+            else:
+                values[key] = item.get(u'value')
+        return values
+
+    def _lookup(self, func):
+        with self._lock:
+            loaded = self._hosts is not None
+            age = time.time() - self._loaded_at
+        if not loaded or age >= self.ttl:
+            self.refresh()
+            return func()
+        result = func()
+        if result is None and age >= self.miss_refresh_interval:
+            self.refresh()
+            result = func()
+        return result
+
+    def get_hosts(self):
+        return self._lookup(lambda: sorted(self._hosts))
+
+    def get_bird_ip(self, hostname):
+        return self._lookup(
+            lambda: self._hosts.get(hostname, {}).get('bird_ip'))
+
+    def get_tunnel_address(self, hostname):
+        return self._lookup(
+            lambda: self._hosts.get(hostname, {}).get('tunnel_address'))
+
+    def find_by_ip(self, bird_ip):
+        return self._lookup(lambda: self._by_ip.get(bird_ip))
+
+
+calico_hosts = CalicoHostIndex()
+
+
 def get_calico_ip_tunnel_address(hostname=None):
     """Returns current address of ipip tunnel of calico node.
     :param hostname: name of host, if not defined, then will be used current
@@ -1064,13 +1194,10 @@ def get_calico_ip_tunnel_address(hostname=None):
     """
     if not hostname:
         hostname = get_hostname()
-    url = ETCD_CALICO_HOST_CONFIG_KEY_PATH_TEMPLATE.format(
-        hostname=hostname) + '/' + ETCD_KEY_CALICO_HOST_IP_TUNNEL_ADDRESS
     try:
-        result = Etcd(url).get()
-    except requests.exceptions.HTTPError:
+        return calico_hosts.get_tunnel_address(hostname)
+    except (requests.exceptions.HTTPError, KeyError):
         return None
-    return result[u'node'][u'value']
 
 
 def get_current_calico_hosts():
@@ -1078,40 +1205,27 @@ def get_current_calico_hosts():
     Return all calico hosts currently present in etcd as list of strings
     :return: list, error_str
     """
-    res = []
     try:
-        resp = Etcd(ETCD_CALICO_URL + '/host/').get()
-        for host in resp[u'node'][u'nodes']:
-            if host[u'dir']:
-                hostname = host[u'key'].rsplit(u'/', 1)[-1]
-                res.append(hostname)
+        return calico_hosts.get_hosts(), None
     except (requests.exceptions.HTTPError, KeyError):
         return None, "Can't get list of calico hosts"
-    return res, None
 
 
 def get_calico_host_bird_ip(hostname):
     try:
-        resp = Etcd(
-            ETCD_CALICO_HOST_KEY_PATH_TEMPLATE.format(hostname=hostname) +
-            '/bird_ip').get()
-        return resp[u'node'][u'value'], None
+        bird_ip = calico_hosts.get_bird_ip(hostname)
     except (requests.exceptions.HTTPError, KeyError):
+        bird_ip = None
+    if bird_ip is None:
         return None, "Can't get calico host bird ip"
+    return bird_ip, None
 
 
 def find_calico_host_by_ip(bird_ip):
-    all_hosts, err = get_current_calico_hosts()
-    if err:
-        return None, err
-
-    for host in all_hosts:
-        host_bird_ip, err = get_calico_host_bird_ip(host)
-        if not host_bird_ip:
-            return None, err
-        if host_bird_ip == bird_ip:
-            return host, None
-    return None, None
+    try:
+        return calico_hosts.find_by_ip(bird_ip), None
+    except (requests.exceptions.HTTPError, KeyError):
+        return None, "Can't get list of calico hosts"
 
 
 @contextmanager
@@ -1134,6 +1248,47 @@ def session_scope(session):
         session.close()
 
 
+# Functions which accept name and dict of metrics values, see report_metrics
+metrics_hooks = []
+
+
+def report_metrics(name, values):
+    """Passes metrics (e.g. timings of phases of some task) to all registered
+    metrics hooks. Metrics are logged if there are no hooks.
+    :param name: name of the measured operation
+    :param values: dict of metric name -> value
+    """
+    if not metrics_hooks:
+        current_app.logger.debug('Metrics of %s: %s', name, values)
+        return
+    for hook in metrics_hooks:
+        try:
+            hook(name, values)
+        except Exception:
+            current_app.logger.warning('Metrics hook %r failed', hook,
+                                       exc_info=True)
+
+
+class PhaseTimer(object):
+    """Measures duration of consecutive phases of some operation.
+
+        timer = PhaseTimer()
+        do_something()
+        timer.phase('something')
+        ...
+        report_metrics('operation', timer.timings)
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._last = time.time()
+
+    def phase(self, name):
+        now = time.time()
+        self.timings[name] = now - self._last
+        self._last = now
+
+
 def _find_calico_host(nodes, ip):
     for node in nodes:
         for sub_node in node['nodes']:
@@ -53,6 +53,67 @@ class TestV(unittest.TestCase):
         self.assertEqual(validator.errors, {})
 
 
+@mock.patch.object(validators, 'SystemSettings')
+@mock.patch.object(validators, 'kube_catalogue')
+class TestValidationContext(unittest.TestCase):
+    schema = {
+        'kube_type': {'type': 'integer', 'kube_type_in_db': True,
+                      'kube_type_in_user_package': True,
+                      'kube_type_exists': True},
+        'containers': {'type': 'list', 'schema': {'type': 'dict', 'schema': {
+            'kubes': {'type': 'integer', 'max_kubes_per_container': True},
+            'size': {'type': 'integer', 'pd_size_max': True},
+        }}},
+    }
+
+    def setUp(self):
+        validators.User.reset_mock()
+
+    def _data(self, containers=20):
+        return {'kube_type': 1,
+                'containers': [{'kubes': 2, 'size': 1}] * containers}
+
+    def test_data_is_loaded_once(self, kube_catalogue, system_settings):
+        system_settings.get_by_name.return_value = '10'
+        context = validation.ValidationContext('test_user')
+        for _ in range(3):
+            validator = V(user='test_user', context=context)
+            self.assertTrue(validator.validate(self._data(), self.schema),
+                            validator.errors)
+        validators.User.get.assert_called_once_with('test_user')
+        kube_catalogue.get_package.assert_called_once_with(
+            validators.User.get.return_value.package_id)
+        self.assertEqual(system_settings.get_by_name.call_count, 2)
+
+    def test_nested_validators_share_context(self, kube_catalogue,
+                                             system_settings):
+        system_settings.get_by_name.return_value = '1'
+        validator = V(user='test_user')
+        self.assertFalse(validator.validate(self._data(), self.schema))
+        self.assertEqual(system_settings.get_by_name.call_count, 2)
+        self.assertIn('containers', validator.errors)
+
+    def test_kube_type_rules(self, kube_catalogue, system_settings):
+        kube_catalogue.get_kube.return_value = None
+        validator = V(user='test_user')
+        self.assertFalse(validator.validate({'kube_type': 5}, self.schema))
+        self.assertIn('No such kube_type', str(validator.errors))
+
+        kube_catalogue.get_kube.return_value = mock.Mock(available=True)
+        package = kube_catalogue.get_package.return_value
+        package.configure_mock(name='Standard', **{
+            'get_kube.return_value': None})
+        validator = V(user='test_user')
+        self.assertFalse(validator.validate({'kube_type': 5}, self.schema))
+        self.assertIn('does not include kube type', str(validator.errors))
+        package.get_kube.assert_called_with(5)
+
+        validators.User.get.return_value = None
+        validator = V(user='unknown_user')
+        self.assertFalse(validator.validate({'kube_type': 5}, self.schema))
+        self.assertIn('can\'t be determined', validator.errors['kube_type'])
+
+
 class TestUserCreateValidation(unittest.TestCase):
     def setUp(self):
         patcher = mock.patch.object(UserValidator,
@@ -26,7 +26,7 @@ import cerberus
 from ipaddress import ip_network
 from sqlalchemy import func
 
-from kubedock.billing.models import Kube, Package
+from kubedock.billing.models import Kube, Package, kube_catalogue
 from kubedock.domains.models import BaseDomain
 from kubedock.kapi.images import Image
 from kubedock.predefined_apps.models import PredefinedApp
@@ -46,10 +46,44 @@ from .schemas import (command_pod_schema, cpu_multiplier_schema,
                       container_image_regex)
 
 
+class ValidationContext(object):
+    """
+    Data used by custom rules of `V`: kubes, package of the user and system
+    settings. It is loaded once and shared by all nested validators, so
+    validation of a pod costs the same number of queries regardless of
+    number of containers and volumes. One context may be shared by several
+    validations of the same user's data (e.g. in batch restore).
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self._user_package = None
+        self._user_package_loaded = False
+        self._settings = {}
+
+    def get_kube(self, kube_id):
+        return kube_catalogue.get_kube(kube_id)
+
+    def get_user_package(self):
+        if not self._user_package_loaded:
+            user = User.get(self.user)
+            self._user_package = (None if user is None else
+                                  kube_catalogue.get_package(user.package_id))
+            self._user_package_loaded = True
+        return self._user_package
+
+    def get_setting(self, name):
+        if name not in self._settings:
+            self._settings[name] = SystemSettings.get_by_name(name)
+        return self._settings[name]
+
+
 class V(cerberus.Validator):
     """
     This class is for all custom and our app-specific validators and types,
     implement any new here.
+    Pass `context` (see `ValidationContext`) to share loaded data among
+    several validators.
     """
 
     ERROR_SHOULD_NOT_USE_LATEST = "Tag \":latest\" should not be used "
@@ -59,6 +93,10 @@ class V(cerberus.Validator):
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.get('user')
+        # child validators get the same kwargs, so the context is shared
+        if kwargs.get('context') is None:
+            kwargs['context'] = ValidationContext(self.user)
+        self.context = kwargs['context']
         super(V, self).__init__(*args, **kwargs)
 
     def _api_validation(self, data, schema, *args, **kwargs):
@@ -146,7 +184,7 @@ class V(cerberus.Validator):
 
     def _validate_kube_type_exists(self, exists, field, value):
         if exists:
-            kube = Kube.query.get(value)
+            kube = self.context.get_kube(value)
             if kube is None:
                 self._error(field, 'Pod can\'t be created, because cluster '
                                    'has no kube type with id "{0}", please '
@@ -161,8 +199,12 @@ class V(cerberus.Validator):
             if self.user == KUBERDOCK_INTERNAL_USER and \
                     value == Kube.get_internal_service_kube_type():
                 return
-            package = User.get(self.user).package
-            if value not in [k.kube_id for k in package.kubes]:
+            package = self.context.get_user_package()
+            if package is None:
+                self._error(field,
+                            "Pod can't be created, because package of user "
+                            "\"{0}\" can't be determined".format(self.user))
+            elif package.get_kube(value) is None:
                 self._error(field,
                             "Pod can't be created, because your package "
                             "\"{0}\" does not include kube type with id "
@@ -170,7 +212,7 @@ class V(cerberus.Validator):
 
     def _validate_kube_type_in_db(self, exists, field, value):
         if exists:
-            kube = Kube.query.get(value)
+            kube = self.context.get_kube(value)
             if not kube:
                 self._error(field, 'No such kube_type: "{0}"'.format(value))
             elif not kube.is_public() and self.user != KUBERDOCK_INTERNAL_USER:
@@ -216,7 +258,7 @@ class V(cerberus.Validator):
 
     def _validate_pd_size_max(self, exists, field, value):
         if exists:
-            max_size = SystemSettings.get_by_name('persitent_disk_max_size')
+            max_size = self.context.get_setting('persitent_disk_max_size')
             if max_size and int(value) > int(max_size):
                 self._error(field, (
                     'Persistent disk size must be less or equal '
@@ -224,7 +266,7 @@ class V(cerberus.Validator):
 
     def _validate_max_kubes_per_container(self, exists, field, value):
         if exists:
-            max_size = SystemSettings.get_by_name('max_kubes_per_container')
+            max_size = self.context.get_setting('max_kubes_per_container')
             if max_size and int(value) > int(max_size):
                 self._error(field, (
                     'Container cannot have more than {0} kubes.'.format(
@@ -323,14 +365,15 @@ def check_change_pod_data(data):
     }
 
 
-def check_new_pod_data(data, user=None, **kwargs):
+def check_new_pod_data(data, user=None, context=None, **kwargs):
     # FIXME: in cerberus 0.9.1 "corece" in nested fields doesn't work right:
     # .validated({'a': 123, 'b': {'a': 456}},
     #            {'a': {}, 'b': {'type': 'dict',
     #                            'schema': {'a': {'coerce': str}}}})
     # -> {'a': '456', 'b': {'a': 456}}
     # use normalisation only after upgrade to Cerberus 1.0 ...
-    validator = V(user=None if user is None else user.username, **kwargs)
+    validator = V(user=None if user is None else user.username,
+                  context=context, **kwargs)
     if not validator.validate(data, new_pod_schema):
         raise ValidationError(validator.errors)
 
@@ -345,9 +388,10 @@ def check_new_pod_data(data, user=None, **kwargs):
     return data
 
 
-def check_pod_dump(data, user=None, **kwargs):
+def check_pod_dump(data, user=None, context=None, **kwargs):
     kwargs.setdefault('allow_unknown', True)
-    validator = V(user=None if user is None else user.username, **kwargs)
+    validator = V(user=None if user is None else user.username,
+                  context=context, **kwargs)
     if not validator.validate(data, pod_dump_schema):
         raise ValidationError(validator.errors)
 
@@ -78,3 +78,15 @@ class PodsClient(ClientBase):
                 'pv_backups_path_template': pv_backups_path_template,
             }
         )
+
+    def restore_batch(self, pod_dumps, owner=None, pv_backups_location=None,
+                      pv_backups_path_template=None):
+        return self.transport.post(
+            self._url('restore', 'batch'),
+            json={
+                'pod_dumps': pod_dumps,
+                'owner': owner,
+                'pv_backups_location': pv_backups_location,
+                'pv_backups_path_template': pv_backups_path_template,
+            }
+        )
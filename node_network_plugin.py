@@ -51,6 +51,7 @@ FSLIMIT_PATH = os.path.join(KD_SCRIPT_DIR, 'fslimit.py')
 STORAGE_MANAGE_DIR = 'node_storage_manage'
 PLUGIN_PATH = '/usr/libexec/kubernetes/kubelet-plugins/net/exec/kuberdock/'
 KD_CONF_PATH = PLUGIN_PATH + 'kuberdock.json'
+IPSET = 'ipset'
 
 PUBLIC_IP_RULE = 'iptables -w -{0} KUBERDOCK-PUBLIC-IP -t nat -d {1} ' \
                  '-p {2} --dport {3} -j DNAT --to-destination {4}:{5}'
@@ -203,15 +204,43 @@ def set_config(filename, data):
         f.writelines(['{0}={1}\n'.format(k, v) for k, v in d.items()])
 
 
+def _get_ipset_members(set_name):
+    """Returns set of members of ipset or None if there is no such ipset."""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output([IPSET, 'list', set_name],
+                                             stderr=devnull)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    lines = [line.strip() for line in output.splitlines()]
+    if 'Members:' not in lines:
+        return None
+    return set(line for line in lines[lines.index('Members:') + 1:] if line)
+
+
 def _update_ipset(set_name, ip_list, set_type='hash:ip'):
+    """
+    Makes ipset to contain exactly ip_list. Nothing is changed if it already
+    does. Otherwise a temporary set is filled and swapped with the target one
+    by a single `ipset restore`, so the change is applied atomically.
+    """
+    ip_list = set(ip_list)
+    if _get_ipset_members(set_name) == ip_list:
+        return
     set_temp = '{0}_temp'.format(set_name)
-    subprocess.call(['ipset', '-exist', 'create', set_name, set_type])
-    subprocess.call(['ipset', '-exist', 'create', set_temp, set_type])
-    subprocess.call(['ipset', 'flush', set_temp])
-    for ip in ip_list:
-        subprocess.call(['ipset', 'add', set_temp, ip])
-    subprocess.call(['ipset', 'swap', set_temp, set_name])
-    subprocess.call(['ipset', 'destroy', set_temp])
+    commands = ['create {0} {1}'.format(set_name, set_type),
+                'create {0} {1}'.format(set_temp, set_type),
+                'flush {0}'.format(set_temp)]
+    commands.extend('add {0} {1}'.format(set_temp, ip)
+                    for ip in sorted(ip_list))
+    commands.extend(['swap {0} {1}'.format(set_temp, set_name),
+                     'destroy {0}'.format(set_temp)])
+    proc = subprocess.Popen([IPSET, '-exist', 'restore'],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    output = proc.communicate('\n'.join(commands) + '\n')[0]
+    if proc.returncode:
+        glog('Failed to update ipset {0}: {1}'.format(set_name, output))
 
 
 def update_ipset():
@@ -500,14 +529,26 @@ def _run_storage_manage_command(args):
 class VolumeManager(object):
     """Class that creates, restores from backup and deletes volumes."""
 
+    #: Max length of chain of incremental backups
+    max_backup_chain = 100
+
     def restore_if_needed(self, volume_spec):
         """If backup url specified, it downloads the backup archive from
         backup url and extracts it into a volume path.
+        Archive may be an incremental backup (see backup_node.py), in this
+        case the chain of its base archives is restored first.
         """
         if not volume_spec.backup_url:
             return
+        self._restore(volume_spec.backup_url, volume_spec.path)
+
+    def _restore(self, url, path, chain=()):
+        if len(chain) >= self.max_backup_chain or url in chain:
+            raise VolumeRestoreException(
+                'Chain of incremental backups of {0} is too long or '
+                'looped'.format(chain[0] if chain else url))
 
-        url_path = urlparse.urlparse(volume_spec.backup_url).path
+        url_path = urlparse.urlparse(url).path
         extractor = self._ArchiveExtractor()
         try:
             extractor.detect_type_by_extension(url_path)
@@ -516,7 +557,7 @@ class VolumeManager(object):
                 'Unknown type of archive got from {url}. '
                 'At the moment only {supported_formats} formats '
                 'are supported'.format(
-                    url=volume_spec.backup_url,
+                    url=url,
                     supported_formats=', '.join(
                         x.strip('.') for x in extractor.supported_formats)
                 ))
@@ -526,8 +567,7 @@ class VolumeManager(object):
         requests_session.mount('ftp://', FileAdapter())
 
         try:
-            r = requests_session.get(volume_spec.backup_url, stream=True,
-                                     verify=False)
+            r = requests_session.get(url, stream=True, verify=False)
             r.raise_for_status()
 
             with NamedTemporaryFile('w+b') as f:
@@ -536,16 +576,36 @@ class VolumeManager(object):
                         f.write(chunk)
 
                 f.seek(0)
-                extractor.extract(f, volume_spec.path)
+                meta = extractor.get_backup_meta(f)
+                if meta is not None and meta.get('base'):
+                    self._restore(urlparse.urljoin(url, meta['base']), path,
+                                  chain + (url,))
+                f.seek(0)
+                extractor.extract(f, path)
+                if meta is not None:
+                    self._remove_deleted(path, meta.get('deleted', []))
 
         except (requests.exceptions.RequestException, socket.timeout):
             raise VolumeRestoreException(
                 'Connection failure while downloading backup from {}'
-                .format(volume_spec.backup_url))
+                .format(url))
         except extractor.BadArchive:
             raise VolumeRestoreException(
                 'An error occurred while extracting archive got from {}'
-                .format(volume_spec.backup_url))
+                .format(url))
+
+    @staticmethod
+    def _remove_deleted(path, deleted):
+        """Removes files deleted since the base backup."""
+        root = os.path.realpath(path)
+        for rel_path in deleted:
+            target = os.path.normpath(os.path.join(root, rel_path))
+            if not target.startswith(root + os.sep):
+                continue
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            elif os.path.lexists(target):
+                os.remove(target)
 
     def create(self, volume_spec):
         """
@@ -578,7 +638,9 @@ class VolumeManager(object):
             raise PluginException(u'Failed to remove volume: {}'.format(err))
 
     class _ArchiveExtractor(object):
-        supported_formats = ['.tar.gz', '.zip']
+        supported_formats = ['.tar.gz', '.tar.bz2', '.zip']
+        #: File with info about incremental backup (see backup_node.py)
+        backup_meta = '.kuberdock-backup.json'
 
         def __init__(self, archive_type=None):
             self.archive_type = archive_type
@@ -595,6 +657,7 @@ class VolumeManager(object):
             assert self.archive_type
             extractors = {
                 '.tar.gz': self._extract_tar,
+                '.tar.bz2': self._extract_tar,
                 '.zip': self._extract_zip
             }
             try:
@@ -604,10 +667,28 @@ class VolumeManager(object):
             else:
                 return extract(file_obj, path)
 
+        def get_backup_meta(self, file_obj):
+            """Returns info about incremental backup or None if the archive
+            is not an incremental backup.
+            """
+            if self.archive_type == '.zip':
+                return None
+            try:
+                with tarfile.open(fileobj=file_obj, mode='r:*') as archive:
+                    try:
+                        member = archive.getmember(self.backup_meta)
+                    except KeyError:
+                        return None
+                    return json.load(archive.extractfile(member))
+            except (tarfile.TarError, ValueError):
+                raise self.BadArchive
+
         def _extract_tar(self, file_obj, path):
             try:
-                with tarfile.open(fileobj=file_obj, mode='r:gz') as archive:
-                    archive.extractall(path)
+                with tarfile.open(fileobj=file_obj, mode='r:*') as archive:
+                    archive.extractall(path, members=(
+                        m for m in archive.getmembers()
+                        if m.name != self.backup_meta))
             except tarfile.TarError:
                 raise self.BadArchive
 